@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare the memory needed to parse decrypted entries as strings and straight from wiped buffers.
+
+Every entry plaintext is copied in memory, as a decryption backend would hand it over, then parsed and kept,
+as a writer would keep its fields. Both the memory kept at the end and the largest transient allocation of a
+single entry, on top of what was already kept, are measured: entries with long notes show the difference.
+
+Usage: python benchmarks/bench_buffers.py [-n ENTRIES] [-l LINES] [-c DENSITY] [--notes BYTES]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from typing import List, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p2kp2 import PassEntry  # noqa: E402
+from p2kp2.buffers import wipe  # noqa: E402
+from store_generator import StoreGenerator  # noqa: E402
+
+
+def parse_string(name: str, plaintext: bytes) -> PassEntry:
+    # what PassReader does by default: the backend bytes are decoded into a string, then parsed
+    data = bytes(plaintext)
+    return PassEntry.from_string(name, data.decode("utf-8"))
+
+
+def parse_buffer(name: str, plaintext: bytes) -> PassEntry:
+    # what PassReader does with wipe_buffers: the backend fills a bytearray, parsed in place and wiped
+    buffer = bytearray(plaintext)
+    try:
+        return PassEntry.from_buffer(name, buffer)
+    finally:
+        wipe(buffer)
+
+
+def measure(parse, names: List[str], plaintexts: List[bytes]) -> Dict[str, float]:
+    """Return the largest transient peak of an entry and the memory kept at the end, in bytes."""
+    gc.collect()
+    # allocated up front, so that growing the list doesn't count as transient
+    entries = [None] * len(names)
+    transient = 0
+    kept = 0
+    for i, (name, plaintext) in enumerate(zip(names, plaintexts)):
+        # tracing starts afresh for every entry, which gives its own peak without tracemalloc.reset_peak, only
+        # there since python 3.9: what is still traced once it's parsed is what the entry keeps
+        tracemalloc.start()
+        entries[i] = parse(name, plaintext)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        transient = max(transient, peak)
+        kept += current
+    del entries
+    return {"transient": transient, "kept": kept}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', type=int, default=20000)
+    parser.add_argument('-l', '--lines', type=int, default=4)
+    parser.add_argument('-c', '--custom-density', type=float, default=0.5)
+    parser.add_argument('--notes', type=int, default=4096, help="bytes of free text notes in every entry")
+    args = parser.parse_args()
+
+    generator = StoreGenerator(entries=args.entries, lines=args.lines, custom_density=args.custom_density)
+    folders = generator.folders()
+    names = [os.path.join(generator.random.choice(folders), f"entry-{i:06d}") for i in range(args.entries)]
+    filler = "\n".join(generator.word(79) for _ in range(args.notes // 80))
+    plaintexts = [f"{generator.entry_content()}\n{filler}\n".encode("utf-8") for _ in range(args.entries)]
+
+    print(f"Parsing {args.entries} entries of about {sum(map(len, plaintexts)) // args.entries} bytes\n")
+    strings = measure(parse_string, names, plaintexts)
+    buffers = measure(parse_buffer, names, plaintexts)
+    for name, result in [("strings", strings), ("buffers", buffers)]:
+        print(f"{name:>8}: {result['kept'] / 2 ** 20:8.1f} MiB kept, "
+              f"{result['transient'] / 1024:8.1f} KiB transient peak per entry")
+    print("")
+    print(f"transient peak: {strings['transient'] / buffers['transient']:.1f}x lower with buffers")
+    print("Only the buffers are wiped: the copies made while parsing strings are left to the garbage collector.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Compare the decryption backends: per-entry gpg, batch gpg sessions and in-process OpenPGP.
+
+Usage: python benchmarks/bench_decrypt.py [-i STORE] [-r ROUNDS] [-j JOBS]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p2kp2 import PassReader  # noqa: E402
+from p2kp2.backends import backends, BackendNotAvailableException  # noqa: E402
+
+
+def time_decryption(reader: PassReader, rounds: int) -> float:
+    """Return the seconds needed to decrypt every entry of the store, rounds times."""
+    entries = reader.get_pass_entries() * rounds
+    start = time.perf_counter()
+    for _ in reader.parse_entries(entries):
+        pass
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--input', default="tests/password-store")
+    parser.add_argument('-r', '--rounds', type=int, default=25)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    nentries = len(PassReader(path=args.input).get_pass_entries()) * args.rounds
+    print(f"Decrypting {nentries} entries from {args.input} with {args.jobs} job(s)\n")
+    results = {}
+    for name in backends:
+        try:
+            reader = PassReader(path=args.input, jobs=args.jobs, backend=name)
+        except BackendNotAvailableException as e:
+            print(f"{name:>10}: skipped, {e}")
+            continue
+        elapsed = time_decryption(reader, args.rounds)
+        results[name] = elapsed
+        print(f"{name:>10}: {elapsed:8.3f}s  {nentries / elapsed:8.1f} entries/s")
+    print("")
+    for name, elapsed in results.items():
+        if name != "passpy":
+            print(f"{name} is {results['passpy'] / elapsed:.2f}x faster than passpy")
+
+
+if __name__ == "__main__":
+    main()
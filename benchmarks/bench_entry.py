@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Compare the memory and time needed to parse entries with the slotted PassEntry and with the original one.
+
+Usage: python benchmarks/bench_entry.py [-n ENTRIES] [-l LINES] [-c DENSITY]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p2kp2 import PassEntry  # noqa: E402
+from store_generator import StoreGenerator  # noqa: E402
+
+
+class LegacyPassEntry:
+    """PassEntry as it was before slots and the single-pass parser, kept here as the reference."""
+
+    to_skip: List[str] = ["---", ""]
+
+    def __init__(self, entry: str, entry_string: str):
+        self.url = ""
+        self.user = ""
+        self.notes = ""
+        self.custom_properties = {}
+        self.groups = self.get_groups(entry)
+        self.title = self.get_title(entry)
+        self.parse_entry_string(entry_string)
+
+    @staticmethod
+    def get_title(entry: str) -> str:
+        return entry.split("/").pop()
+
+    @staticmethod
+    def get_groups(entry: str) -> List[str]:
+        groups = entry.split("/")
+        groups.pop()
+        return groups
+
+    @staticmethod
+    def is_valid_line(entry_line: str) -> bool:
+        return entry_line.find(":") > 0
+
+    @staticmethod
+    def parse_entry_line(entry_line: str) -> Tuple[str, str]:
+        data = entry_line.split(":", 1)
+        return data[0].strip(), data[1].strip()
+
+    def parse_entry_string(self, entry_string: str) -> None:
+        lines = entry_string.split("\n")
+        self.password = lines.pop(0)
+
+        lines = list(filter(lambda x: x not in self.to_skip and self.is_valid_line(x), lines))
+        data = list(map(lambda x: self.parse_entry_line(x), lines))
+        for key, value in data:
+            if key == "url":
+                self.url = value
+            elif key == "user" or key == "login":
+                self.user = value
+            elif key == "notes":
+                self.notes = value
+            else:
+                self.custom_properties.update({key: value})
+
+
+def measure(build, names: List[str], contents: List[str]) -> Dict[str, float]:
+    """Return the seconds needed to parse every entry, and the bytes needed to keep them all in memory."""
+    gc.collect()
+    start = time.perf_counter()
+    entries = [build(name, content) for name, content in zip(names, contents)]
+    elapsed = time.perf_counter() - start
+    del entries
+    gc.collect()
+    tracemalloc.start()
+    entries = [build(name, content) for name, content in zip(names, contents)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del entries
+    return {"time": elapsed, "memory": memory}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', type=int, default=100000)
+    parser.add_argument('-l', '--lines', type=int, default=4)
+    parser.add_argument('-c', '--custom-density', type=float, default=0.5)
+    args = parser.parse_args()
+
+    generator = StoreGenerator(entries=args.entries, lines=args.lines, custom_density=args.custom_density)
+    folders = generator.folders()
+    names = [os.path.join(generator.random.choice(folders), f"entry-{i:06d}") for i in range(args.entries)]
+    contents = [generator.entry_content() for _ in range(args.entries)]
+
+    print(f"Parsing {args.entries} entries with {args.lines} lines each\n")
+    legacy = measure(LegacyPassEntry, names, contents)
+    slotted = measure(PassEntry.from_string, names, contents)
+    for name, result in [("legacy", legacy), ("slotted", slotted)]:
+        print(f"{name:>8}: {result['time']:7.3f}s  {result['memory'] / 2 ** 20:8.1f} MiB")
+    print("")
+    print(f"time saved:   {legacy['time'] - slotted['time']:7.3f}s ({legacy['time'] / slotted['time']:.2f}x faster)")
+    print(f"memory saved: {(legacy['memory'] - slotted['memory']) / 2 ** 20:7.1f} MiB "
+          f"({(legacy['memory'] - slotted['memory']) / args.entries:.0f} bytes per entry)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Time how long the command line takes to start, and check that it doesn't load the conversion dependencies.
+
+Usage: python benchmarks/bench_import.py [-r RUNS] [-t TOP]
+
+Every run is a fresh python process: importing p2kp2.pass2keepass2 is timed with python -X importtime, then the
+whole 'pass2keepass2 --version' with a wall clock, next to an empty python run. The median of the runs is printed,
+with the slowest imports.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# only needed once a conversion starts
+heavy_modules = ["pykeepass", "lxml", "passpy", "rx", "gnupg", "argon2", "pkg_resources"]
+
+
+def run_python(code: List[str]) -> subprocess.CompletedProcess:
+    """Run python from the repository root, with the repository first in the path."""
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.run([sys.executable] + code, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                          cwd=root, check=True)
+
+
+def import_times() -> Dict[str, int]:
+    """Return the cumulative microseconds needed to import every module loaded by p2kp2.pass2keepass2."""
+    output = run_python(["-X", "importtime", "-c", "import p2kp2.pass2keepass2"]).stderr.decode("utf-8")
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def wall_time(code: List[str]) -> float:
+    """Return the seconds needed to run python with the given arguments."""
+    start = time.perf_counter()
+    run_python(code)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--runs', type=int, default=10)
+    parser.add_argument('-t', '--top', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    modules = set.intersection(*(set(x) for x in runs))
+    medians = {name: statistics.median(x[name] for x in runs) for name in modules}
+    versions = [wall_time(["-m", "p2kp2.pass2keepass2", "--version"]) for _ in range(args.runs)]
+    interpreter = [wall_time(["-c", "pass"]) for _ in range(args.runs)]
+
+    print(f"Median of {args.runs} runs\n")
+    print(f"import p2kp2.pass2keepass2: {medians['p2kp2.pass2keepass2'] / 1000:8.1f}ms")
+    print(f"pass2keepass2 --version:    {statistics.median(versions) * 1000:8.1f}ms")
+    print(f"python -c pass:             {statistics.median(interpreter) * 1000:8.1f}ms")
+    print("\nSlowest imports:")
+    for name in sorted(medians, key=medians.get, reverse=True)[1:args.top + 1]:
+        print(f"  {name:<40} {medians[name] / 1000:8.1f}ms")
+    loaded = [name for name in heavy_modules if any(x == name or x.startswith(name + ".") for x in modules)]
+    print("\nConversion dependencies loaded at startup: {}".format(", ".join(loaded) if loaded else "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Time every conversion stage on generated password-stores of growing size.
+
+Usage: python benchmarks/bench_stages.py [-n SIZE [SIZE ...]] [-b BACKEND] [-j JOBS] [--bulk] [--stores DIR]
+                                         [--baseline RESULTS]
+
+Stages are timed one at a time, each one on the output of the previous one: scan, decrypt, parse, map, group
+lookup, insert and save. Every run is saved in benchmarks/results and compared with a baseline: by default the
+latest previous run with the same settings.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p2kp2 import PassReader, P2KP2, DecryptionBackend  # noqa: E402
+from p2kp2.backends import backends  # noqa: E402
+from p2kp2.index import StoreIndex  # noqa: E402
+from p2kp2.kdf import AesKdf  # noqa: E402
+from store_generator import StoreGenerator, remove_store  # noqa: E402
+
+results_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+stages = ["scan", "decrypt", "parse", "map", "group lookup", "insert", "save"]
+
+
+class PlaintextBackend(DecryptionBackend):
+    """Hand out already decrypted entries, so that parsing can be timed on its own."""
+
+    def __init__(self, plaintexts: Dict[str, bytes]):
+        self.plaintexts = plaintexts
+
+    def decrypt(self, path: str) -> bytes:
+        return self.plaintexts[path]
+
+
+def sample_mapper(entry):
+    """A mapper doing the kind of work the README example does."""
+    if "field-0" in entry.custom_properties:
+        entry.custom_properties["otp-uri"] = f"otpauth:{entry.custom_properties.pop('field-0')}"
+    return entry
+
+
+@contextmanager
+def stage(times: Dict[str, float], name: str):
+    """Record the seconds spent in the with block as the given stage."""
+    start = time.perf_counter()
+    yield
+    times[name] = time.perf_counter() - start
+    print(f"  {name:>12}: {times[name]:8.3f}s", flush=True)
+
+
+def time_stages(store: str, args) -> Dict[str, float]:
+    """Run every stage on the given store and return the seconds spent in each one."""
+    times = {}
+    with stage(times, "scan"):
+        index = StoreIndex(store)
+
+    reader = PassReader(path=store, jobs=args.jobs, backend=args.backend)
+    with stage(times, "decrypt"):
+        paths = [entry.path for entry in index]
+        if args.jobs > 1:
+            with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+                plaintexts = dict(zip(paths, executor.map(reader.backend.decrypt, paths)))
+        else:
+            plaintexts = {path: reader.backend.decrypt(path) for path in paths}
+    reader.close()
+
+    reader = PassReader(path=store, backend=PlaintextBackend(plaintexts))
+    with stage(times, "parse"):
+        entries = list(reader.parse_entries(index.names()))
+
+    reader.mapper = sample_mapper
+    with stage(times, "map"):
+        entries = [reader.apply_mapper(entry) for entry in entries]
+
+    with tempfile.TemporaryDirectory() as folder:
+        kdf = AesKdf(rounds=args.kdf_rounds) if args.kdf_rounds is not None else None
+        writer = P2KP2(password="benchmark", destination=os.path.join(folder, "bench.kdbx"), bulk=args.bulk,
+                       kdf=kdf)
+        with stage(times, "group lookup"):
+            writer.build_group_tree(index.groups())
+            for entry in entries:
+                writer.get_group(entry.groups)
+
+        with stage(times, "insert"):
+            if args.bulk:
+                for i in range(0, len(entries), writer.bulk_size):
+                    writer.add_entries(entries[i:i + writer.bulk_size])
+            else:
+                for entry in entries:
+                    writer.add_entry(entry)
+
+        with stage(times, "save"):
+            writer.db.save()
+    return times
+
+
+def get_store(size: int, args) -> str:
+    """Return a generated store with the given size, building it if needed, and point gpg to its key."""
+    shape = f"n{size}-d{args.depth}-f{args.fanout}-l{args.lines}-c{args.custom_density}"
+    path = os.path.join(args.stores, shape)
+    if not os.path.isdir(os.path.join(path, "store")):
+        print(f"Generating a {size} entries store in {path}...", flush=True)
+        start = time.perf_counter()
+        StoreGenerator(entries=size, depth=args.depth, fanout=args.fanout, lines=args.lines,
+                       custom_density=args.custom_density).generate(path)
+        print(f"  generated in {time.perf_counter() - start:.1f}s", flush=True)
+    os.environ["GNUPGHOME"] = os.path.join(path, "gnupg")
+    return os.path.join(path, "store")
+
+
+def get_settings(args) -> Dict:
+    """Return the settings a run must share with its baseline to be compared."""
+    return {"backend": args.backend, "jobs": args.jobs, "bulk": args.bulk, "kdf_rounds": args.kdf_rounds,
+            "depth": args.depth, "fanout": args.fanout, "lines": args.lines, "custom_density": args.custom_density}
+
+
+def find_baseline(settings: Dict) -> str:
+    """Return the latest saved run with the same settings, if any."""
+    for path in sorted(glob.glob(os.path.join(results_folder, "stages-*.json")), reverse=True):
+        with open(path) as f:
+            if json.load(f)["settings"] == settings:
+                return path
+    return None
+
+
+def get_commit() -> str:
+    """Return the current git commit, or an empty string outside of a git checkout."""
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.decode("utf-8").strip()
+
+
+def print_comparison(run: Dict, baseline: Dict):
+    """Print how much every stage changed since the baseline run."""
+    print(f"\nCompared with {baseline['date']} ({baseline['commit'] or 'unknown commit'}):")
+    for size, times in run["sizes"].items():
+        old_times = baseline["sizes"].get(size)
+        if old_times is None:
+            continue
+        print(f"  {size} entries")
+        for name in stages:
+            if name in times and old_times.get(name):
+                ratio = times[name] / old_times[name]
+                print(f"  {name:>12}: {old_times[name]:8.3f}s -> {times[name]:8.3f}s  ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--sizes', type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument('-b', '--backend', choices=list(backends.keys()), default="batch")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--bulk', action='store_true')
+    parser.add_argument('--kdf-rounds', type=int, default=None)
+    parser.add_argument('-d', '--depth', type=int, default=2)
+    parser.add_argument('-f', '--fanout', type=int, default=5)
+    parser.add_argument('-l', '--lines', type=int, default=4)
+    parser.add_argument('-c', '--custom-density', type=float, default=0.5)
+    parser.add_argument('--stores', default=None, help="keep the generated stores here and reuse them")
+    parser.add_argument('--baseline', default=None, help="the saved run to compare with")
+    args = parser.parse_args()
+
+    keep_stores = args.stores is not None
+    if not keep_stores:
+        args.stores = tempfile.mkdtemp(prefix="p2kp2-bench-")
+    settings = get_settings(args)
+    run = {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": get_commit(), "python": platform.python_version(),
+           "settings": settings, "sizes": {}}
+    try:
+        for size in args.sizes:
+            store = get_store(size, args)
+            print(f"Converting {size} entries with the {args.backend} backend and {args.jobs} job(s)", flush=True)
+            run["sizes"][str(size)] = time_stages(store, args)
+            if not keep_stores:
+                remove_store(os.path.dirname(store))
+    finally:
+        if not keep_stores:
+            remove_store(args.stores)
+
+    baseline_path = args.baseline or find_baseline(settings)
+    os.makedirs(results_folder, exist_ok=True)
+    path = os.path.join(results_folder, time.strftime("stages-%Y%m%d-%H%M%S.json"))
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults saved in {path}")
+    if baseline_path is not None:
+        with open(baseline_path) as f:
+            print_comparison(run, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Build throwaway password-stores, encrypted to a throwaway gpg key, to benchmark pass2keepass2 with.
+
+Usage: python benchmarks/store_generator.py OUTPUT [-n ENTRIES] [-d DEPTH] [-f FANOUT] [-l LINES] [-c DENSITY]
+
+The gpg key lives in its own gpg home, inside OUTPUT, so your keyring is never touched: point GNUPGHOME to it,
+as printed at the end, to read the store.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import string
+import subprocess
+from typing import List
+
+
+class StoreGenerator:
+    """Generate a random password-store with a given shape.
+
+    Entries are spread randomly over a tree of folders depth levels deep, where every folder has fanout
+    sub-folders. Every entry has a password followed by the given number of lines: the custom_density share of
+    them are custom 'key: value' properties, the others are the usual url, user and notes, then free text.
+    """
+
+    def __init__(self, entries: int = 1000, depth: int = 2, fanout: int = 5, lines: int = 4,
+                 custom_density: float = 0.5, seed: int = 0):
+        """Constructor for StoreGenerator
+
+        :param entries: the number of entries
+        :param depth: the number of folder levels below the store root
+        :param fanout: the number of sub-folders of every folder
+        :param lines: the number of lines after the password in every entry
+        :param custom_density: the share of those lines that are custom properties, between 0 and 1
+        :param seed: the random seed, the same seed always builds the same store
+        """
+        if not 0 <= custom_density <= 1:
+            raise ValueError("custom_density must be between 0 and 1")
+        self.entries = entries
+        self.depth = depth
+        self.fanout = fanout
+        self.lines = lines
+        self.custom_density = custom_density
+        self.random = random.Random(seed)
+
+    def folders(self) -> List[str]:
+        """Return every folder of the store tree, the store root included as ''."""
+        folders = [""]
+        level = [""]
+        for depth in range(self.depth):
+            level = [os.path.join(parent, f"group-{depth}-{i}") for parent in level for i in range(self.fanout)]
+            folders += level
+        return folders
+
+    def word(self, length: int = 8) -> str:
+        """Return a random lowercase word."""
+        return "".join(self.random.choices(string.ascii_lowercase, k=length))
+
+    def entry_content(self) -> str:
+        """Return the plaintext of a random entry."""
+        password = "".join(self.random.choices(string.ascii_letters + string.digits + string.punctuation, k=24))
+        ncustom = round(self.lines * self.custom_density)
+        lines = [password]
+        standard = [f"url: https://{self.word()}.example.com", f"user: {self.word()}", f"notes: {self.word(32)}"]
+        for i in range(self.lines - ncustom):
+            lines.append(standard[i] if i < len(standard) else " ".join(self.word() for _ in range(6)))
+        for i in range(ncustom):
+            lines.append(f"field-{i}: {self.word(16)}")
+        return "\n".join(lines) + "\n"
+
+    def write_plaintext(self, path: str) -> List[str]:
+        """Write every entry, unencrypted, into path and return the written files."""
+        folders = self.folders()
+        for folder in folders:
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+        files = []
+        for i in range(self.entries):
+            file = os.path.join(path, self.random.choice(folders), f"entry-{i:06d}")
+            with open(file, "w") as f:
+                f.write(self.entry_content())
+            files.append(file)
+        return files
+
+    def generate(self, path: str) -> str:
+        """Build an encrypted password-store in path/store, with its own gpg home in path/gnupg.
+
+        :param path: an empty or missing folder
+        :return: the gpg home holding the store key
+        """
+        store = os.path.join(path, "store")
+        gpg_home = os.path.join(path, "gnupg")
+        os.makedirs(store)
+        os.makedirs(gpg_home, mode=0o700)
+        key_id = create_key(gpg_home)
+        with open(os.path.join(store, ".gpg-id"), "w") as f:
+            f.write(key_id + "\n")
+        files = self.write_plaintext(store)
+        # a single gpg process encrypts every file, reading their names from stdin
+        subprocess.run(["gpg2", "--homedir", gpg_home, "--batch", "--yes", "--quiet", "--trust-model", "always",
+                        "--recipient", key_id, "--encrypt-files"],
+                       input="".join(f"{file}\n" for file in files).encode("utf-8"), check=True)
+        for file in files:
+            os.remove(file)
+        return gpg_home
+
+
+def create_key(gpg_home: str) -> str:
+    """Create a key without passphrase in the given gpg home and return its fingerprint."""
+    uid = "pass2keepass2 benchmark <bench@pass2keepass2>"
+    subprocess.run(["gpg2", "--homedir", gpg_home, "--batch", "--quiet", "--passphrase", "",
+                    "--quick-gen-key", uid, "future-default", "default", "never"], check=True)
+    output = subprocess.run(["gpg2", "--homedir", gpg_home, "--batch", "--quiet", "--trust-model", "always",
+                             "--with-colons", "--list-keys", uid], stdout=subprocess.PIPE, check=True).stdout
+    return next(line.split(":")[9] for line in output.decode("utf-8").splitlines() if line.startswith("fpr:"))
+
+
+def remove_store(path: str):
+    """Stop the gpg agent of a generated store and delete it."""
+    subprocess.run(["gpgconf", "--homedir", os.path.join(path, "gnupg"), "--kill", "gpg-agent"],
+                   stderr=subprocess.DEVNULL)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output')
+    parser.add_argument('-n', '--entries', type=int, default=1000)
+    parser.add_argument('-d', '--depth', type=int, default=2)
+    parser.add_argument('-f', '--fanout', type=int, default=5)
+    parser.add_argument('-l', '--lines', type=int, default=4)
+    parser.add_argument('-c', '--custom-density', type=float, default=0.5)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = StoreGenerator(entries=args.entries, depth=args.depth, fanout=args.fanout, lines=args.lines,
+                               custom_density=args.custom_density, seed=args.seed)
+    gpg_home = generator.generate(args.output)
+    print(f"{args.entries} entries written to {os.path.join(args.output, 'store')}")
+    print(f"Read them with: GNUPGHOME={gpg_home}")
+
+
+if __name__ == "__main__":
+    main()
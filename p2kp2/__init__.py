@@ -1,5 +1,45 @@
-from p2kp2.reader import PassEntry, PassReader, CustomMapperExecException
-from p2kp2.writer import P2KP2, DbAlreadyExistsException, empty_db_path
-
+import importlib
 
 __version__ = '1.0.1'
+
+# every public name, and the module defining it: modules are only imported on first access, so that the command
+# line, or a script only needing __version__, doesn't pay for pykeepass, passpy and Rx until a conversion starts
+_exports = {
+    "DecryptionBackend": "p2kp2.backends",
+    "PasspyBackend": "p2kp2.backends",
+    "GpgBatchBackend": "p2kp2.backends",
+    "OpenPGPBackend": "p2kp2.backends",
+    "PassEntry": "p2kp2.reader",
+    "EntryReader": "p2kp2.reader",
+    "PassReader": "p2kp2.reader",
+    "BatchMapper": "p2kp2.reader",
+    "ProcessMapper": "p2kp2.reader",
+    "CustomMapperExecException": "p2kp2.reader",
+    "EntryWriter": "p2kp2.writer",
+    "P2KP2": "p2kp2.writer",
+    "DbAlreadyExistsException": "p2kp2.writer",
+    "DbNotWritableException": "p2kp2.writer",
+    "empty_db_path": "p2kp2.writer",
+    "KeePassXmlWriter": "p2kp2.exporters",
+    "CsvWriter": "p2kp2.exporters",
+    "KeePassReader": "p2kp2.reverse",
+    "PassWriter": "p2kp2.reverse",
+    "ShardedWriter": "p2kp2.shards",
+    "MergedReader": "p2kp2.merge",
+    "AsyncPassReader": "p2kp2.aio",
+    "AsyncP2KP2": "p2kp2.aio",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name: str):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
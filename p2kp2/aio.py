@@ -0,0 +1,275 @@
+from __future__ import annotations
+import asyncio
+import functools
+import os
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Awaitable, Iterable, List, Union
+
+from p2kp2.gpg import DecryptionException
+from p2kp2.profiling import Profiler
+from p2kp2.reader import PassReader, PassEntry, ProcessMapper, BatchMapper, EntryNotFoundException
+from p2kp2.rules import FieldRules
+from p2kp2.writer import P2KP2
+
+
+class ProgressStream:
+    """An async stream of progress counts, the asyncio counterpart of the Rx event_stream.
+
+    Every 'async for' over the stream gets the counts published from the moment it starts, and ends when the
+    current run is over. Runs are opened as soon as the reader or the writer is asked for one, before anything is
+    awaited, so a listener started right before, or right after, gets every count. Counts are queued for every
+    listener, so none is ever missed.
+    """
+
+    def __init__(self):
+        self.running = False
+        self._queues: List[asyncio.Queue] = []
+
+    def open(self):
+        """Start a new run."""
+        self.running = True
+
+    def publish(self, count: int):
+        """Send a count to every listener."""
+        for queue in self._queues:
+            queue.put_nowait(count)
+
+    def close(self):
+        """End the current run, and the iteration of every listener."""
+        self.running = False
+        for queue in self._queues:
+            queue.put_nowait(None)
+
+    def __aiter__(self) -> AsyncIterator[int]:
+        return self._listen()
+
+    async def _listen(self) -> AsyncIterator[int]:
+        if not self.running:
+            return
+        queue = asyncio.Queue()
+        self._queues.append(queue)
+        try:
+            while True:
+                count = await queue.get()
+                if count is None:
+                    return
+                yield count
+        finally:
+            self._queues.remove(queue)
+
+
+class AsyncPassReader(PassReader):
+    """Read a pass db from asyncio code, without ever blocking the event loop.
+
+    Every entry is decrypted by its own gpg process, started with asyncio, and at most concurrency of them run at
+    the same time. Entries are yielded by the aiter_entries async iterator in the store order, and progress is
+    published on the progress stream. The custom mapper, if any, is applied on the event loop, so it should be
+    quick: a ProcessMapper is not supported.
+
+    The synchronous PassReader methods keep working, with the 'passpy' backend.
+    """
+
+    def __init__(self, path: str = None, password: str = None, mapper=None, concurrency: int = 4,
+                 profiler: Profiler = None, rules: FieldRules = None):
+        """Constructor for AsyncPassReader
+
+        :param path: the password-store location. Default is ~/.password-store
+        :param password: optional password used to unlock the secret key
+        :param mapper: optional function, or BatchMapper, applied to every parsed entry
+        :param concurrency: the maximum number of gpg processes running at once
+        :param profiler: optional Profiler recording how long every stage takes
+        :param rules: optional FieldRules telling how entry fields are mapped while parsing
+        """
+        if isinstance(mapper, ProcessMapper):
+            raise ValueError("a ProcessMapper can't be used by an AsyncPassReader")
+        super().__init__(path=path, password=password, mapper=mapper, jobs=concurrency, profiler=profiler,
+                         rules=rules)
+        self.concurrency = concurrency
+        self.progress = ProgressStream()
+
+    def gpg_args(self, path: str) -> List[str]:
+        """Return the gpg command decrypting the given file to stdout."""
+        args = [self.store.gpg_bin] + list(self.store.gpg_opts)
+        if self.password is not None and self.password != "":
+            # the password is written on gpg stdin, keeping it out of the process arguments
+            args += ["--pinentry-mode=loopback", "--passphrase-fd=0"]
+        return args + ["--decrypt", path]
+
+    async def decrypt(self, path: str, semaphore: asyncio.Semaphore, entry: str = None) -> bytes:
+        """Decrypt a gpg encrypted file in a gpg process, once the semaphore lets it run.
+
+        :param path: the absolute path of the file to decrypt
+        :param semaphore: the semaphore limiting the running gpg processes
+        :param entry: the entry name, for the profiler
+        :return: the plaintext
+        """
+        password = None
+        if self.password is not None and self.password != "":
+            password = self.password.encode("utf-8") + b"\n"
+        async with semaphore:
+            with self.profiler.measure("decrypt", entry):
+                process = await asyncio.create_subprocess_exec(*self.gpg_args(path), stdin=asyncio.subprocess.PIPE,
+                                                               stdout=asyncio.subprocess.PIPE,
+                                                               stderr=asyncio.subprocess.PIPE)
+                try:
+                    plaintext, errors = await process.communicate(password)
+                except BaseException:
+                    # cancelled, most likely: don't leave gpg behind
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+                    raise
+        if process.returncode != 0:
+            raise DecryptionException(f"gpg could not decrypt the file: {errors.decode('utf-8', 'replace').strip()}")
+        return plaintext
+
+    async def read_entry(self, entry: str, semaphore: asyncio.Semaphore) -> PassEntry:
+        """Decrypt and parse a single entry, without applying the mapper."""
+        if entry is None or entry == "":
+            raise EntryNotFoundException()
+        entry_path = os.path.join(self.path, os.path.normpath(entry) + ".gpg")
+        if not os.path.isfile(entry_path):
+            raise FileNotFoundError(f"{entry} is not in the password store.")
+        plaintext = await self.decrypt(entry_path, semaphore, entry)
+        with self.profiler.measure("parse", entry):
+            return PassEntry.from_bytes(entry, plaintext, self.rules)
+
+    async def aread_entries(self, entries_name: Iterable[str]) -> AsyncIterator[PassEntry]:
+        """Decrypt and parse the given entries, preserving their order, without applying the mapper.
+
+        A bounded window of entries is decrypted ahead of the one being yielded. The first error cancels every
+        pending decryption, killing their gpg processes, before being raised.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = deque()
+        try:
+            for entry_name in entries_name:
+                pending.append(asyncio.ensure_future(self.read_entry(entry_name, semaphore)))
+                if len(pending) >= 2 * self.concurrency:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def amap_entries(self, entries: AsyncIterable[PassEntry]) -> AsyncIterator[PassEntry]:
+        """Apply the custom mapper, if any, to already parsed entries: one at a time, or in chunks for a
+        BatchMapper."""
+        if not isinstance(self.mapper, BatchMapper):
+            async for entry in entries:
+                yield self.apply_mapper(entry)
+            return
+        async for chunk in batches(entries, self.mapper.size):
+            for entry in self.apply_batch_mapper(chunk):
+                yield entry
+
+    def aiter_entries(self) -> AsyncIterator[PassEntry]:
+        """Decrypt, parse and map all the pass db entries, publishing the progress every event_step entries and
+        after the last one.
+
+        The progress stream is open from this call on, until the returned iterator is exhausted or closed. Entries
+        are not kept in memory: use aparse_db to collect them.
+        """
+        self.progress.open()
+        return self._aiter_entries()
+
+    async def _aiter_entries(self) -> AsyncIterator[PassEntry]:
+        loop = asyncio.get_running_loop()
+        # scanning the store hits the disk: keep it off the loop
+        try:
+            entries_name = await loop.run_in_executor(None, self.get_pass_entries)
+        except BaseException:
+            self.progress.close()
+            raise
+        entries = self.aread_entries(entries_name)
+        i = 0
+        try:
+            async for entry in self.amap_entries(entries):
+                i = i + 1
+                if i % self.event_step == 0:
+                    self.progress.publish(i)
+                yield entry
+            if i % self.event_step != 0:
+                self.progress.publish(i)
+        finally:
+            await entries.aclose()
+            self.progress.close()
+            self.close()
+
+    async def aparse_db(self):
+        """Populate the entries list with all the data from the pass db."""
+        async for entry in self.aiter_entries():
+            self.entries.append(entry)
+
+
+class AsyncP2KP2(P2KP2):
+    """Write a keepass db from asyncio code, without ever blocking the event loop.
+
+    Entries are added in batches of bulk_size, and the db is saved, in the default executor of the loop, while
+    progress is published on the progress stream after every batch. Use open to build it off the loop too, since
+    opening an existing db runs its key derivation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Constructor for AsyncP2KP2, taking the same arguments as P2KP2."""
+        super().__init__(*args, **kwargs)
+        self.progress = ProgressStream()
+
+    @classmethod
+    async def open(cls, *args, **kwargs) -> AsyncP2KP2:
+        """Build an AsyncP2KP2 in the default executor of the loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(cls, *args, **kwargs))
+
+    def _add_batch(self, pass_entries: List[PassEntry]):
+        if self.bulk:
+            self.add_entries(pass_entries)
+        else:
+            for pass_entry in pass_entries:
+                self.add_entry(pass_entry)
+
+    def apopulate_db(self, entries: Union[AsyncIterable[PassEntry], Iterable[PassEntry]]) -> Awaitable[int]:
+        """Populate the keepass db with the given entries, then save it.
+
+        The progress stream is open from this call on, until the returned awaitable is done.
+
+        :param entries: an async iterable of PassEntry, like AsyncPassReader.aiter_entries(), or a plain one
+        :return: an awaitable of the number of entries added
+        """
+        self.progress.open()
+        return self._apopulate_db(entries)
+
+    async def _apopulate_db(self, entries: Union[AsyncIterable[PassEntry], Iterable[PassEntry]]) -> int:
+        loop = asyncio.get_running_loop()
+        i = 0
+        try:
+            async for batch in batches(entries, self.bulk_size):
+                await loop.run_in_executor(None, self._add_batch, batch)
+                i = i + len(batch)
+                self.progress.publish(i)
+            await loop.run_in_executor(None, self.save)
+        finally:
+            self.progress.close()
+        return i
+
+
+async def batches(entries: Union[AsyncIterable[PassEntry], Iterable[PassEntry]],
+                  size: int) -> AsyncIterator[List[PassEntry]]:
+    """Group entries, from an async or a plain iterable, in lists of at most size entries."""
+    batch = []
+    if hasattr(entries, "__aiter__"):
+        async for entry in entries:
+            batch.append(entry)
+            if len(batch) == size:
+                yield batch
+                batch = []
+    else:
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
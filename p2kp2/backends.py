@@ -0,0 +1,251 @@
+from __future__ import annotations
+import os
+import subprocess
+import threading
+import warnings
+from contextlib import ExitStack
+from typing import List, TYPE_CHECKING
+
+from p2kp2.buffers import read_into, wipe
+from p2kp2.gpg import GpgSessionPool, DecryptionException
+
+if TYPE_CHECKING:
+    from passpy import Store
+
+
+class DecryptionBackend:
+    """Base class for the strategies used to decrypt pass entries."""
+
+    def decrypt(self, path: str) -> bytes:
+        """Decrypt a gpg encrypted file.
+
+        :param path: the absolute path of the file to decrypt
+        :return: the plaintext
+        """
+        raise NotImplementedError()
+
+    def decrypt_buffer(self, path: str) -> bytearray:
+        """Decrypt a gpg encrypted file into a bytearray, which the caller wipes as soon as it's done with it.
+
+        Backends that can read the plaintext straight into the bytearray do so. By default the plaintext is
+        copied from decrypt, whose own bytes are left to the garbage collector.
+
+        :param path: the absolute path of the file to decrypt
+        :return: the plaintext
+        """
+        return bytearray(self.decrypt(path))
+
+    def close(self):
+        """Release every resource held by the backend. It can still be used afterwards."""
+
+
+class PasspyBackend(DecryptionBackend):
+    """Start a new gpg process for every entry, like passpy does.
+
+    Entries don't go through passpy itself, only its store gpg binary and options: gpg is run directly, with a
+    single process per entry and nothing else, like probing its configuration, on the way.
+    """
+
+    def __init__(self, store: Store, password: str = None):
+        """Constructor for PasspyBackend
+
+        :param store: the passpy store, used for its gpg configuration
+        :param password: optional password used to unlock the secret key
+        """
+        self.gpg_bin = store.gpg_bin
+        self.gpg_opts = list(store.gpg_opts)
+        self.password = password if password != "" else None
+        if self.password is not None:
+            # the passphrase is written on gpg stdin, keeping it out of the process arguments
+            self.gpg_opts += ["--pinentry-mode=loopback", "--passphrase-fd=0"]
+
+    def gpg_args(self, path: str) -> List[str]:
+        """Return the gpg command decrypting the given file to stdout."""
+        return [self.gpg_bin] + self.gpg_opts + ["--decrypt", path]
+
+    def decrypt(self, path: str) -> bytes:
+        password = self.password.encode("utf-8") + b"\n" if self.password is not None else b""
+        result = subprocess.run(self.gpg_args(path), input=password, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise DecryptionException(
+                f"gpg could not decrypt the file: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    def decrypt_buffer(self, path: str) -> bytearray:
+        # read the gpg output unbuffered, straight into the buffer
+        process = subprocess.Popen(self.gpg_args(path), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, bufsize=0)
+        try:
+            if self.password is not None:
+                process.stdin.write(self.password.encode("utf-8") + b"\n")
+            process.stdin.close()
+            buffer = read_into(process.stdout, os.path.getsize(path))
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            wipe(buffer)
+            raise DecryptionException(f"gpg could not decrypt the file: exit code {returncode}")
+        return buffer
+
+
+class GpgBatchBackend(DecryptionBackend):
+    """Stream all entries through a fixed set of long-lived gpg processes."""
+
+    def __init__(self, store: Store, password: str = None, size: int = 1):
+        """Constructor for GpgBatchBackend
+
+        :param store: the passpy store, used for its gpg configuration
+        :param password: optional password used to unlock the secret key
+        :param size: the number of gpg processes
+        """
+        self.sessions = GpgSessionPool(size=size, gpg_bin=store.gpg_bin, gpg_opts=store.gpg_opts,
+                                       password=password)
+
+    def decrypt(self, path: str) -> bytes:
+        return self.sessions.decrypt(path)
+
+    def decrypt_buffer(self, path: str) -> bytearray:
+        return self.sessions.decrypt_buffer(path)
+
+    def close(self):
+        self.sessions.close()
+
+
+class OpenPGPBackend(DecryptionBackend):
+    """Decrypt entries in-process with PGPy.
+
+    The secret keys listed in the store '.gpg-id' files are exported from the gpg keyring once, the first time
+    they are needed, and kept unlocked in memory until the backend is closed.
+    """
+
+    def __init__(self, store: Store, password: str = None):
+        """Constructor for OpenPGPBackend
+
+        :param store: the passpy store, used for its gpg configuration and to find the '.gpg-id' files
+        :param password: optional password used to unlock the secret key
+        """
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                import pgpy
+        except ImportError:
+            raise BackendNotAvailableException("The openpgp backend requires PGPy: "
+                                               "pip install pass2keepass2[openpgp]")
+        self._pgpy = pgpy
+        self.store = store
+        self.password = password if password != "" else None
+        self._keys = None
+        self._unlocked = ExitStack()
+        self._lock = threading.Lock()
+
+    def get_recipients(self) -> List[str]:
+        """Return every gpg id found in the store '.gpg-id' files."""
+        recipients = []
+        for root, dirs, files in os.walk(self.store.store_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            if ".gpg-id" in files:
+                with open(os.path.join(root, ".gpg-id")) as gpg_id_file:
+                    for line in gpg_id_file:
+                        if line.strip() != "" and line.strip() not in recipients:
+                            recipients.append(line.strip())
+        return recipients
+
+    def export_secret_keys(self) -> bytes:
+        """Export the store secret keys from the gpg keyring."""
+        args = [self.store.gpg_bin, "--batch", "--quiet", "--export-secret-keys"]
+        pass_fds = ()
+        if self.password is not None:
+            password_fd, password_fd_w = os.pipe()
+            os.write(password_fd_w, self.password.encode("utf-8") + b"\n")
+            os.close(password_fd_w)
+            args += ["--pinentry-mode=loopback", f"--passphrase-fd={password_fd}"]
+            pass_fds = (password_fd,)
+        try:
+            result = subprocess.run(args + self.get_recipients(), stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, pass_fds=pass_fds)
+        finally:
+            for fd in pass_fds:
+                os.close(fd)
+        # gpg fails when some of the matching keys can't be exported, but the others are still usable
+        if result.stdout == b"":
+            raise DecryptionException("Could not export the store secret keys.")
+        return result.stdout
+
+    def _load_keys(self) -> list:
+        """Export, parse and unlock the secret keys."""
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            _, keys = self._pgpy.PGPKey.from_blob(self.export_secret_keys())
+            keys = [key for key in keys.values() if not key.is_public and key.is_primary]
+            for key in keys:
+                if key.is_protected:
+                    self._unlocked.enter_context(key.unlock(self.password or ""))
+                for k in [key] + list(key.subkeys.values()):
+                    self._cache_private_key(k)
+        return keys
+
+    @staticmethod
+    def _cache_private_key(key):
+        """Build the key cryptography object only once.
+
+        PGPy rebuilds, and validates, the private key object on every decryption, which is by far its most
+        expensive step: since the key is not going to change it's safe to build it once and reuse it.
+        """
+        keymaterial = key._key.keymaterial
+        if hasattr(keymaterial, "__privkey__"):
+            private_key = keymaterial.__privkey__()
+            keymaterial.__privkey__ = lambda: private_key
+
+    def decrypt(self, path: str) -> bytes:
+        with self._lock:
+            if self._keys is None:
+                self._keys = self._load_keys()
+            keys = self._keys
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                message = self._pgpy.PGPMessage.from_file(path)
+            except (ValueError, self._pgpy.errors.PGPError) as e:
+                raise DecryptionException(f"Not a valid OpenPGP message: {e}")
+            for key in keys:
+                if message.encrypters & ({key.fingerprint.keyid} | set(key.subkeys.keys())):
+                    try:
+                        plaintext = key.decrypt(message).message
+                    except self._pgpy.errors.PGPError as e:
+                        raise DecryptionException(f"Could not decrypt the file: {e}")
+                    return plaintext.encode("utf-8") if isinstance(plaintext, str) else bytes(plaintext)
+        raise DecryptionException("None of the exported keys can decrypt the file.")
+
+    def close(self):
+        with self._lock:
+            self._unlocked.close()
+            self._keys = None
+
+
+backends = {
+    "passpy": PasspyBackend,
+    "batch": GpgBatchBackend,
+    "openpgp": OpenPGPBackend,
+}
+
+
+def make_backend(name: str, store: Store, password: str = None, jobs: int = 1) -> DecryptionBackend:
+    """Build a decryption backend by name.
+
+    :param name: one of 'passpy', 'batch' or 'openpgp'
+    :param store: the passpy store the backend will decrypt
+    :param password: optional password used to unlock the secret key
+    :param jobs: the number of entries that will be decrypted concurrently
+    :return: the decryption backend
+    """
+    if name not in backends:
+        raise ValueError(f"Unknown decryption backend: {name}")
+    if name == "batch":
+        return GpgBatchBackend(store, password=password, size=jobs)
+    return backends[name](store, password=password)
+
+
+class BackendNotAvailableException(Exception):
+    """Exception raised when a decryption backend misses some of its optional dependencies."""
@@ -0,0 +1,63 @@
+import ctypes
+import re
+from typing import BinaryIO, Union
+
+min_buffer_size = 256
+binary_sample_size = 8000  # like git, only the start of the data tells text and binary apart
+# a run of well-formed UTF-8 characters but NUL: matching it checks bytes without decoding them into a str
+_text_run = re.compile(rb"[\x01-\x7f]*(?:(?:[\xc2-\xdf]|\xe0[\xa0-\xbf]|[\xe1-\xec\xee\xef][\x80-\xbf]|"
+                       rb"\xed[\x80-\x9f]|\xf0[\x90-\xbf][\x80-\xbf]|[\xf1-\xf3][\x80-\xbf]{2}|"
+                       rb"\xf4[\x80-\x8f][\x80-\xbf])[\x80-\xbf][\x01-\x7f]*)*")
+
+
+def wipe(buffer: bytearray):
+    """Overwrite a buffer with zeros, in place, without allocating anything."""
+    if len(buffer) > 0:
+        ctypes.memset(ctypes.addressof(ctypes.c_char.from_buffer(buffer)), 0, len(buffer))
+
+
+def looks_binary(data: Union[bytes, bytearray]) -> bool:
+    """Whether decrypted data looks like a binary file, a key file or a certificate say, rather than text.
+
+    Only the first binary_sample_size bytes are looked at, in place and with no decoding, so that no str copy of
+    a secret is left behind: data is binary if they hold a NUL byte or they aren't valid UTF-8. Text whose
+    invalid bytes come later is only found out when it's decoded.
+    """
+    end = min(len(data), binary_sample_size)
+    valid = _text_run.match(data, 0, end).end()
+    # the sample may end in the middle of a character, up to 3 bytes long
+    return valid < (end if end == len(data) else end - 3)
+
+
+def read_into(stream: BinaryIO, size_hint: int = 4096) -> bytearray:
+    """Read a stream to its end straight into a bytearray, with no intermediate bytes object.
+
+    The stream should be unbuffered, or its own buffer will hold a copy of the data too. Whenever the bytearray
+    must grow, or shrink to the data size at the end, the data is moved to a new one and the old one is wiped.
+
+    :param stream: a binary stream supporting readinto
+    :param size_hint: the expected data size, to avoid growing the buffer
+    :return: the data
+    """
+    buffer = bytearray(max(size_hint, min_buffer_size))
+    size = 0
+    while True:
+        if size == len(buffer):
+            buffer = _move(buffer, 2 * len(buffer), size)
+        with memoryview(buffer) as view:
+            read = stream.readinto(view[size:])
+        if not read:
+            break
+        size += read
+    if size < len(buffer):
+        buffer = _move(buffer, size, size)
+    return buffer
+
+
+def _move(buffer: bytearray, capacity: int, size: int) -> bytearray:
+    """Copy the first size bytes of a buffer into a new one of the given capacity, wiping the old one."""
+    moved = bytearray(capacity)
+    with memoryview(buffer) as view:
+        moved[:size] = view[:size]
+    wipe(buffer)
+    return moved
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import json
+import os
+import time
+from typing import List, Set, Sequence, TYPE_CHECKING
+
+from p2kp2.reader import PassEntry
+
+if TYPE_CHECKING:
+    from p2kp2.writer import P2KP2
+
+journal_suffix = ".p2kp2-journal"
+
+
+def journal_path(destination: str) -> str:
+    """Return the path of the checkpoint journal of a keepass db."""
+    return destination + journal_suffix
+
+
+class Checkpoint:
+    """A journal of the entries already written to a keepass db, so that an interrupted conversion can resume.
+
+    While converting, the db is saved to its destination every interval seconds, and when the conversion
+    stops because of an error or a SIGINT. Right before every save, the entries written since the previous
+    one are appended to the journal, next to the db, as a json line with their pass name and their keepass
+    path. Every line but the last one is then known to be in the saved db; the last one may not be, if the
+    save was interrupted, so resuming looks those entries up in the db itself, and then compacts the journal.
+    The journal is deleted once the conversion is done.
+
+    Entries are matched to the pass entries they come from by their order, so the mapper must return exactly
+    one entry for every entry it gets: a BatchMapper can't be used.
+    """
+
+    def __init__(self, destination: str, interval: float = 60):
+        """Constructor for Checkpoint
+
+        :param destination: the keepass db path
+        :param interval: the seconds between two saves
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.path = journal_path(destination)
+        self.interval = interval
+        self.entries_name: Sequence[str] = []
+        self.written = 0
+        self.pending: List[List] = []
+        self.last_save = time.monotonic()
+
+    def exists(self) -> bool:
+        """Whether a previous conversion left a journal behind."""
+        return os.path.isfile(self.path)
+
+    def start(self, entries_name: Sequence[str]):
+        """Get ready to record a conversion of the given entries.
+
+        :param entries_name: the names of the entries about to be converted, in their conversion order
+        """
+        self.entries_name = entries_name
+        self.written = 0
+        self.pending = []
+        self.last_save = time.monotonic()
+
+    def record(self, pass_entry: PassEntry):
+        """Record an entry just added to the db."""
+        if self.written >= len(self.entries_name):
+            raise CheckpointException("more entries were written than read: the mapper must return exactly one "
+                                      "entry for every entry")
+        self.pending.append([self.entries_name[self.written], list(pass_entry.groups), pass_entry.title])
+        self.written += 1
+
+    def due(self) -> bool:
+        """Whether the db should be saved now."""
+        return time.monotonic() - self.last_save >= self.interval
+
+    def commit(self):
+        """Append the entries recorded since the last commit to the journal, making sure they reach the disk."""
+        if self.pending:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"entries": self.pending}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending = []
+        self.last_save = time.monotonic()
+
+    def remove(self):
+        """Delete the journal."""
+        if self.exists():
+            os.remove(self.path)
+
+    def resume(self, writer: P2KP2) -> Set[str]:
+        """Return the names of the pass entries already in the db, according to the journal.
+
+        The journal is then rewritten with just those names, so that the entries of its last line that didn't
+        make it into the db are never taken for done later on.
+
+        :param writer: the P2KP2 opened on the db the journal belongs to
+        """
+        done = set()
+        lines = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                    if "done" in data:
+                        done.update(data["done"])
+                    else:
+                        lines.append(data["entries"])
+                except (ValueError, KeyError, TypeError):
+                    # a torn line: it was being written when the conversion stopped, before its save
+                    break
+        done.update(name for line in lines[:-1] for name, _, _ in line)
+        for name, groups, title in (lines[-1] if lines else []):
+            if writer.has_entry(groups, title):
+                done.add(name)
+        with open(self.path + ".tmp", "w") as f:
+            f.write(json.dumps({"done": sorted(done)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        return done
+
+
+class CheckpointException(Exception):
+    """Exception raised when the entries written can't be matched to the pass entries they come from."""
@@ -0,0 +1,211 @@
+import base64
+import csv
+import io
+import os
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Iterable, Union, BinaryIO, List
+
+from p2kp2.profiling import Profiler
+from p2kp2.reader import EntryReader, PassEntry
+from p2kp2.writer import EntryWriter, DbAlreadyExistsException
+
+root_group_name = "Root"
+base64_chunk_size = 3 * 16384  # the attachment bytes encoded at once: a multiple of 3, so chunks join up
+
+
+class StreamWriter(EntryWriter):
+    """Write the entries to a plain file as they come, in constant memory, for other password managers to import.
+
+    There's no key derivation nor encryption at all: the file holds every password in clear text, and it's only
+    readable by its owner. Entries are written to a temporary file next to the destination, which replaces it
+    once all of them are written, so an interrupted conversion leaves the destination untouched.
+    """
+
+    suffix: str  # the file extension of the format
+
+    def __init__(self, destination: str = None, overwrite: bool = False, profiler: Profiler = None):
+        """Constructor for StreamWriter
+
+        :param destination: the final file path. Default is 'pass' with the format extension
+        :param overwrite: force writing over an existing file
+        :param profiler: optional Profiler recording how long writing every entry and replacing the file take
+        """
+        super().__init__(profiler)
+        if destination is None:
+            destination = "pass" + self.suffix
+        if os.path.exists(destination) and not overwrite:
+            raise DbAlreadyExistsException()
+        self.destination = destination
+
+    def populate_db(self, entries: Union[EntryReader, Iterable[PassEntry]]):
+        if isinstance(entries, EntryReader):
+            entries = entries.entries
+        tmp = self.destination + ".tmp"
+        i = 0
+        try:
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                self.begin(f)
+                for pass_entry in entries:
+                    with self.profiler.measure("insert", pass_entry.name if self.profiler.enabled else None):
+                        self.write_entry(pass_entry)
+                    i = i + 1
+                    if i % self.event_step == 0:
+                        self.event_stream.on_next(i)
+                self.end()
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if i % self.event_step != 0:
+            self.event_stream.on_next(i)
+        with self.profiler.measure("save"):
+            os.replace(tmp, self.destination)
+
+    def begin(self, f: BinaryIO):
+        """Start writing to the temporary file, before the first entry."""
+        raise NotImplementedError()
+
+    def write_entry(self, pass_entry: PassEntry):
+        """Write a single entry."""
+        raise NotImplementedError()
+
+    def end(self):
+        """Complete the file, after the last entry."""
+        raise NotImplementedError()
+
+
+class KeePassXmlWriter(StreamWriter):
+    """Write a KeePass 2 XML file, the unencrypted format of the KeePass 'KeePass XML (2.x)' import and export.
+
+    Groups are nested elements: entries are written inside their group as they come, opening and closing groups
+    when the path changes, so only the currently open groups are kept in memory. A PassReader yields entries
+    folder by folder, as needed; should a mapper move an entry back to an already closed group, that group is
+    opened again as a sibling element with the same name, but a UUID of its own, since every UUID must be unique:
+    besides the open groups, the path of every group written is kept in memory for that.
+
+    The attachment of a binary entry is written inline, in its entry, encoded in base64 a chunk at a time.
+    """
+
+    suffix = ".xml"
+    contiguous = True
+
+    def begin(self, f: BinaryIO):
+        from lxml import etree
+        from lxml.builder import E
+        self._e = E
+        # KeePass plain XML dates
+        self._now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._stack = ExitStack()
+        self._xf = self._stack.enter_context(etree.xmlfile(f, encoding="utf-8"))
+        self._xf.write_declaration(standalone=True)
+        self._stack.enter_context(self._xf.element("KeePassFile"))
+        self._xf.write(E.Meta(E.Generator("pass2keepass2"), E.DatabaseName(root_group_name)), pretty_print=True)
+        self._stack.enter_context(self._xf.element("Root"))
+        self._path = []
+        self._groups = []
+        self._written = set()  # the path of every group opened so far
+        self._open_group(root_group_name, ())
+
+    def _uuid(self, name: str = None) -> str:
+        """Return a KeePass UUID: a random one, or a stable one for a group path."""
+        value = uuid.uuid4() if name is None else uuid.uuid5(uuid.NAMESPACE_URL, "p2kp2:" + name)
+        return base64.b64encode(value.bytes).decode("ascii")
+
+    def _times(self):
+        E = self._e
+        return E.Times(E.CreationTime(self._now), E.LastModificationTime(self._now), E.LastAccessTime(self._now),
+                       E.ExpiryTime(self._now), E.Expires("False"), E.UsageCount("0"),
+                       E.LocationChanged(self._now))
+
+    def _open_group(self, name: str, path: tuple):
+        E = self._e
+        group = self._xf.element("Group")
+        group.__enter__()
+        self._groups.append(group)
+        # the first element of a group has the stable UUID of its path, any later one a random UUID
+        group_uuid = self._uuid() if path in self._written else self._uuid("/".join(path))
+        self._written.add(path)
+        self._xf.write(E.UUID(group_uuid), E.Name(name), self._times(), pretty_print=True)
+
+    def _close_group(self):
+        self._groups.pop().__exit__(None, None, None)
+
+    def write_entry(self, pass_entry: PassEntry):
+        E = self._e
+        path = list(pass_entry.groups)
+        common = 0
+        while common < min(len(path), len(self._path)) and path[common] == self._path[common]:
+            common = common + 1
+        for _ in range(len(self._path) - common):
+            self._close_group()
+        for i in range(common, len(path)):
+            self._open_group(path[i], tuple(path[:i + 1]))
+        self._path = path
+        element = E.Entry(
+            E.UUID(self._uuid()),
+            self._times(),
+            E.String(E.Key("Title"), E.Value(pass_entry.title)),
+            E.String(E.Key("UserName"), E.Value(pass_entry.user)),
+            E.String(E.Key("Password"), E.Value(pass_entry.password, ProtectInMemory="True")),
+            E.String(E.Key("URL"), E.Value(pass_entry.url)),
+            E.String(E.Key("Notes"), E.Value(pass_entry.notes)),
+            *[E.String(E.Key(key), E.Value(value)) for key, value in pass_entry.custom_properties.items()]
+        )
+        if pass_entry.attachment is None:
+            self._xf.write(element, pretty_print=True)
+            return
+        with self._xf.element("Entry"):
+            self._xf.write(*element, pretty_print=True)
+            with self._xf.element("Binary"):
+                self._xf.write(E.Key(pass_entry.title))
+                with self._xf.element("Value"):
+                    with memoryview(pass_entry.attachment) as view:
+                        for i in range(0, len(view), base64_chunk_size):
+                            self._xf.write(base64.b64encode(view[i:i + base64_chunk_size]).decode("ascii"))
+
+    def end(self):
+        while self._groups:
+            self._close_group()
+        self._stack.close()
+
+
+class CsvWriter(StreamWriter):
+    """Write a CSV file laid out like the KeePassXC CSV export, with a header and a row for every entry.
+
+    The group is the full path of the entry group, root group included and separated by '/'. CSV has no room for
+    custom properties: they are appended to the notes, as 'key: value' lines. Nor for attachments: binary entries
+    can't be written at all.
+    """
+
+    suffix = ".csv"
+    header: List[str] = ["Group", "Title", "Username", "Password", "URL", "Notes"]
+
+    def begin(self, f: BinaryIO):
+        self._text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text, quoting=csv.QUOTE_ALL)
+        self._csv.writerow(self.header)
+
+    def write_entry(self, pass_entry: PassEntry):
+        if pass_entry.attachment is not None:
+            raise UnsupportedEntryException(f"{pass_entry.name} is a binary entry: csv files can't hold it.")
+        notes = [pass_entry.notes] if pass_entry.notes != "" else []
+        notes.extend(f"{key}: {value}" for key, value in pass_entry.custom_properties.items())
+        self._csv.writerow(["/".join([root_group_name] + list(pass_entry.groups)), pass_entry.title,
+                            pass_entry.user, pass_entry.password, pass_entry.url, "\n".join(notes)])
+
+    def end(self):
+        # the file is closed by populate_db
+        self._text.flush()
+        self._text.detach()
+
+
+formats = {
+    "xml": KeePassXmlWriter,
+    "csv": CsvWriter,
+}
+
+
+class UnsupportedEntryException(Exception):
+    """Exception raised when an entry can't be written in the chosen format."""
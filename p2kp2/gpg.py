@@ -0,0 +1,267 @@
+from __future__ import annotations
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import weakref
+from typing import List, Optional
+
+from p2kp2.buffers import read_into, wipe
+
+
+class DecryptionException(Exception):
+    """Exception raised when an encrypted file cannot be decrypted."""
+
+
+class GpgSessionException(DecryptionException):
+    """Exception raised when a gpg session fails to decrypt a file or dies unexpectedly."""
+
+
+class EncryptionException(Exception):
+    """Exception raised when some data cannot be encrypted."""
+
+
+def encrypt(data: bytes, recipients: List[str], gpg_bin: str = "gpg2", gpg_opts: List[str] = None) -> bytes:
+    """Encrypt some data to the given recipients with a new gpg process.
+
+    The recipients are trusted as they are, like the ones of a pass '.gpg-id' file: they were chosen by the
+    store owner, so gpg is not asked to check their keys validity.
+
+    :param data: the plaintext
+    :param recipients: the recipients key ids, fingerprints or emails
+    :param gpg_bin: the gpg binary
+    :param gpg_opts: additional gpg options
+    :return: the encrypted data
+    """
+    args = [gpg_bin] + list(gpg_opts or []) + ["--trust-model", "always", "--encrypt"]
+    for recipient in recipients:
+        args += ["--recipient", recipient]
+    result = subprocess.run(args, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        reason = result.stderr.decode("utf-8", "replace").strip().split("\n")[-1]
+        raise EncryptionException(f"gpg could not encrypt the data: {reason}")
+    return result.stdout
+
+
+class GpgSession:
+    """A long-lived gpg process able to decrypt many files, one after another.
+
+    gpg is started once in '--decrypt-files' mode and reads the names of the files to decrypt from its stdin.
+    Every file is exposed to gpg through a symlink in a private temporary folder, next to a named pipe where
+    gpg writes the plaintext: this way the decrypted data never touches the disk. The status lines printed by
+    gpg are used to find out when, and how, every file has been processed.
+    """
+
+    def __init__(self, gpg_bin: str = "gpg2", gpg_opts: List[str] = None, password: str = None):
+        """Constructor for GpgSession
+
+        :param gpg_bin: the gpg binary
+        :param gpg_opts: additional gpg options
+        :param password: optional password used to unlock the secret key. It's handed to gpg through a file
+            descriptor, so it never shows up in the process arguments.
+        """
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._folder = tempfile.mkdtemp(prefix="p2kp2-")
+        args = [gpg_bin] + list(gpg_opts or []) + ["--yes", "--status-fd", "1"]
+        pass_fds = ()
+        password_fd = None
+        if password is not None and password != "":
+            password_fd, password_fd_w = os.pipe()
+            os.write(password_fd_w, password.encode("utf-8") + b"\n")
+            os.close(password_fd_w)
+            args += ["--pinentry-mode=loopback", f"--passphrase-fd={password_fd}"]
+            pass_fds = (password_fd,)
+        args.append("--decrypt-files")
+        try:
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.DEVNULL, pass_fds=pass_fds)
+        except Exception:
+            shutil.rmtree(self._folder, ignore_errors=True)
+            raise
+        finally:
+            if password_fd is not None:
+                os.close(password_fd)
+        self._finalizer = weakref.finalize(self, GpgSession._shutdown, self._process, self._folder)
+
+    @staticmethod
+    def _shutdown(process: subprocess.Popen, folder: str):
+        """Close gpg stdin, wait for it to exit and remove the temporary folder."""
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    @property
+    def closed(self) -> bool:
+        """Whether the gpg process has been terminated."""
+        return not self._finalizer.alive
+
+    def close(self):
+        """Terminate the gpg process."""
+        self._finalizer()
+
+    def __enter__(self) -> GpgSession:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def decrypt(self, path: str) -> bytes:
+        """Decrypt a gpg encrypted file.
+
+        :param path: the file to decrypt
+        :return: the plaintext
+        """
+        buffer = self.decrypt_buffer(path)
+        try:
+            return bytes(buffer)
+        finally:
+            wipe(buffer)
+
+    def decrypt_buffer(self, path: str) -> bytearray:
+        """Decrypt a gpg encrypted file, reading the plaintext straight into a bytearray the caller can wipe.
+
+        :param path: the file to decrypt
+        :return: the plaintext
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"{path} is not a file.")
+        with self._lock:
+            if self.closed:
+                raise GpgSessionException("The gpg session is closed.")
+            self._counter += 1
+            link = os.path.join(self._folder, f"{self._counter}.gpg")
+            fifo = link[:-4]
+            os.symlink(os.path.abspath(path), link)
+            os.mkfifo(fifo, 0o600)
+            try:
+                return self._decrypt_through(link, fifo)
+            finally:
+                os.unlink(link)
+                os.unlink(fifo)
+
+    def _decrypt_through(self, link: str, fifo: str) -> bytearray:
+        """Ask gpg to decrypt link, collecting the plaintext from the fifo."""
+        # Open both fifo ends here: gpg will never block opening it and the reader will only see
+        # the end of the file once our own write end is closed, after gpg is done with it.
+        read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        write_fd = os.open(fifo, os.O_WRONLY)
+        os.set_blocking(read_fd, True)
+        result = []
+        reader = threading.Thread(target=self._read_all, args=(read_fd, os.path.getsize(link), result),
+                                  daemon=True)
+        reader.start()
+        try:
+            self._process.stdin.write(link.encode() + b"\n")
+            self._process.stdin.flush()
+            decrypted = self._wait_for_file_done()
+        except (OSError, ValueError):
+            decrypted = None
+        finally:
+            os.close(write_fd)
+            reader.join()
+        buffer = result[0] if result else bytearray()
+        if decrypted is None:
+            wipe(buffer)
+            self.close()
+            raise GpgSessionException("The gpg process died unexpectedly.")
+        if not decrypted:
+            wipe(buffer)
+            raise GpgSessionException("gpg could not decrypt the file.")
+        return buffer
+
+    def _wait_for_file_done(self) -> Optional[bool]:
+        """Consume gpg status lines up to the end of the current file.
+
+        :return: whether the file was decrypted, or None if gpg exited
+        """
+        decrypted = False
+        while True:
+            line = self._process.stdout.readline()
+            if line == b"":
+                return None
+            if line.startswith(b"[GNUPG:] DECRYPTION_OKAY"):
+                decrypted = True
+            elif line.startswith(b"[GNUPG:] DECRYPTION_FAILED"):
+                decrypted = False
+            elif line.startswith(b"[GNUPG:] FILE_DONE"):
+                return decrypted
+
+    @staticmethod
+    def _read_all(fd: int, size_hint: int, result: List[bytearray]):
+        """Read from fd until EOF into a bytearray, then close it."""
+        # unbuffered: the plaintext goes straight from the pipe into the bytearray
+        with open(fd, "rb", buffering=0) as f:
+            result.append(read_into(f, size_hint))
+
+
+class GpgSessionPool:
+    """A small, fixed size set of GpgSession, shared between threads."""
+
+    def __init__(self, size: int = 1, gpg_bin: str = "gpg2", gpg_opts: List[str] = None, password: str = None):
+        """Constructor for GpgSessionPool
+
+        :param size: the maximum number of gpg processes. They are started only when needed.
+        :param gpg_bin: the gpg binary
+        :param gpg_opts: additional gpg options
+        :param password: optional password used to unlock the secret key
+        """
+        self.size = size
+        self._session_args = (gpg_bin, gpg_opts, password)
+        self._sessions: List[GpgSession] = []
+        self._idle: List[GpgSession] = []
+        self._available = threading.Condition()
+
+    def _acquire(self) -> GpgSession:
+        with self._available:
+            while not self._idle and len(self._sessions) >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            session = GpgSession(*self._session_args)
+            self._sessions.append(session)
+            return session
+
+    def _release(self, session: GpgSession):
+        with self._available:
+            self._idle.append(session)
+            self._available.notify()
+
+    def decrypt(self, path: str) -> bytes:
+        """Decrypt a gpg encrypted file using the first idle session."""
+        buffer = self.decrypt_buffer(path)
+        try:
+            return bytes(buffer)
+        finally:
+            wipe(buffer)
+
+    def decrypt_buffer(self, path: str) -> bytearray:
+        """Decrypt a gpg encrypted file into a bytearray, using the first idle session."""
+        session = self._acquire()
+        try:
+            return session.decrypt_buffer(path)
+        except GpgSessionException:
+            # a dead session can't be reused: replace it the next time it's needed
+            if session.closed:
+                with self._available:
+                    self._sessions.remove(session)
+                    self._available.notify()
+                session = None
+            raise
+        finally:
+            if session is not None:
+                self._release(session)
+
+    def close(self):
+        """Terminate all gpg processes."""
+        with self._available:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+            self._idle = []
@@ -0,0 +1,62 @@
+import os
+from typing import List, NamedTuple, Tuple, Iterator
+
+
+class IndexEntry(NamedTuple):
+    """A single pass entry as found on disk, before decryption."""
+
+    name: str
+    path: str
+    size: int
+    mtime_ns: int
+    groups: Tuple[str, ...]
+
+
+class StoreIndex:
+    """All the entries of a password-store, collected with a single scan of its folders.
+
+    Entries are listed like pass does: hidden files and folders are skipped, a folder entries come before its
+    sub-folders ones, and both are sorted alphabetically, ignoring case.
+    """
+
+    path: str
+    entries: List[IndexEntry]
+
+    def __init__(self, path: str):
+        """Constructor for StoreIndex
+
+        :param path: the password-store location
+        """
+        self.path = path
+        self.entries = []
+        self._scan(path, ())
+
+    def _scan(self, folder: str, groups: Tuple[str, ...]):
+        """Add the entries of a folder, then recurse into its sub-folders."""
+        folders = []
+        with os.scandir(folder) as it:
+            for dir_entry in sorted(it, key=lambda x: x.name.lower()):
+                if dir_entry.name.startswith("."):
+                    continue
+                if dir_entry.is_dir():
+                    folders.append(dir_entry)
+                elif dir_entry.name.endswith(".gpg") and dir_entry.is_file():
+                    stat = dir_entry.stat()
+                    name = "/".join(groups + (dir_entry.name[:-4],))
+                    self.entries.append(IndexEntry(name, dir_entry.path, stat.st_size, stat.st_mtime_ns, groups))
+        for dir_entry in folders:
+            self._scan(dir_entry.path, groups + (dir_entry.name,))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        return iter(self.entries)
+
+    def names(self) -> List[str]:
+        """Return all entries name."""
+        return [entry.name for entry in self.entries]
+
+    def groups(self) -> List[Tuple[str, ...]]:
+        """Return the groups path of all entries, without duplicates and in order."""
+        return list(dict.fromkeys(entry.groups for entry in self.entries))
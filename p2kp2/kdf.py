@@ -0,0 +1,139 @@
+from __future__ import annotations
+import os
+import time
+from typing import NamedTuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pykeepass import PyKeePass
+
+
+class AesKdf(NamedTuple):
+    """AES-KDF key derivation, the only one supported by KDBX 3.1 databases."""
+
+    rounds: int = 500000
+
+
+class Argon2Kdf(NamedTuple):
+    """Argon2 key derivation, which requires a KDBX 4 database."""
+
+    memory: int = 65536  # KiB
+    iterations: int = 2
+    parallelism: int = 2
+    variant: str = "argon2d"  # or "argon2id"
+
+
+Kdf = Union[AesKdf, Argon2Kdf]
+
+# the pykeepass kdf_uuids name of every Argon2 variant
+argon2_variants = {"argon2d": "argon2", "argon2id": "argon2id"}
+
+
+def get_kdf(db: PyKeePass) -> Kdf:
+    """Return the key derivation settings of a keepass db."""
+    from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids
+    header = db.kdbx.header.value.dynamic_header
+    if db.version[0] < 4:
+        return AesKdf(rounds=header.transform_rounds.data)
+    parameters = header.kdf_parameters.data.dict
+    uuid = parameters["$UUID"].value
+    if uuid == kdf_uuids["aeskdf"]:
+        return AesKdf(rounds=parameters["R"].value)
+    variant = "argon2id" if uuid == kdf_uuids["argon2id"] else "argon2d"
+    return Argon2Kdf(memory=parameters["M"].value // 1024, iterations=parameters["I"].value,
+                     parallelism=parameters["P"].value, variant=variant)
+
+
+def set_kdf(db: PyKeePass, kdf: Kdf):
+    """Change the key derivation settings of a keepass db. They are used from its next save onwards.
+
+    Only the parameters of the key derivation already used by the db can be changed: AES-KDF rounds, or Argon2
+    memory, iterations, parallelism and variant.
+
+    :param db: the keepass db
+    :param kdf: the new key derivation settings
+    """
+    check_kdf(kdf)
+    current = get_kdf(db)
+    if type(current) != type(kdf):
+        raise KdfNotSupportedException(f"The database uses {type(current).__name__}, it can't be changed to "
+                                       f"{type(kdf).__name__}.")
+    header = db.kdbx.header.value.dynamic_header
+    if db.version[0] < 4:
+        header.transform_rounds.data = kdf.rounds
+        return
+    parameters = header.kdf_parameters.data.dict
+    if isinstance(kdf, AesKdf):
+        parameters["R"].value = kdf.rounds
+    else:
+        from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids
+        parameters["$UUID"].value = kdf_uuids[argon2_variants[kdf.variant]]
+        parameters["M"].value = kdf.memory * 1024
+        parameters["I"].value = kdf.iterations
+        parameters["P"].value = kdf.parallelism
+
+
+def check_kdf(kdf: Kdf):
+    """Raise a ValueError if the key derivation settings are out of range."""
+    if isinstance(kdf, AesKdf):
+        if kdf.rounds < 1:
+            raise ValueError("AES-KDF rounds must be at least 1.")
+    elif isinstance(kdf, Argon2Kdf):
+        if kdf.variant not in argon2_variants:
+            raise ValueError(f"Unknown Argon2 variant: {kdf.variant}")
+        if kdf.iterations < 1 or kdf.parallelism < 1:
+            raise ValueError("Argon2 iterations and parallelism must be at least 1.")
+        if kdf.memory < 8 * kdf.parallelism:
+            raise ValueError("Argon2 memory must be at least 8 KiB for every thread.")
+    else:
+        raise ValueError(f"Unknown key derivation: {kdf}")
+
+
+def derive(kdf: Kdf, key: bytes = b"\x00" * 32, salt: bytes = b"\x00" * 32) -> bytes:
+    """Run the key derivation once, like keepass does when opening or saving a db."""
+    if isinstance(kdf, AesKdf):
+        from pykeepass.kdbx_parsing.common import aes_kdf
+        return aes_kdf(salt, kdf.rounds, key)
+    import argon2
+    argon2_type = argon2.low_level.Type.ID if kdf.variant == "argon2id" else argon2.low_level.Type.D
+    return argon2.low_level.hash_secret_raw(secret=key, salt=salt, hash_len=32, type=argon2_type,
+                                            time_cost=kdf.iterations, memory_cost=kdf.memory,
+                                            parallelism=kdf.parallelism, version=19)
+
+
+def calibrate(kdf: Kdf, target_ms: int) -> Kdf:
+    """Tune the key derivation cost so that it takes about target_ms on this machine.
+
+    Like keepass '1 second delay' button, this only changes the AES-KDF rounds or the Argon2 iterations: Argon2
+    memory and parallelism are kept as they are.
+
+    :param kdf: the key derivation settings to start from
+    :param target_ms: how long a single key derivation should take, in milliseconds
+    :return: the tuned key derivation settings
+    """
+    if target_ms <= 0:
+        raise ValueError("The key derivation target time must be positive.")
+    check_kdf(kdf)
+    if isinstance(kdf, AesKdf):
+        probe = kdf._replace(rounds=100000)
+        cost = probe.rounds
+    else:
+        probe = kdf._replace(iterations=1)
+        cost = probe.iterations
+    salt = os.urandom(32)
+    # keep doubling the probe until it's long enough to be measured reliably
+    while True:
+        start = time.perf_counter()
+        derive(probe, salt=salt)
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.05 or elapsed * 1000 >= target_ms:
+            break
+        cost = cost * 2
+        probe = probe._replace(rounds=cost) if isinstance(kdf, AesKdf) else probe._replace(iterations=cost)
+    tuned = max(1, round(cost * target_ms / (elapsed * 1000)))
+    if isinstance(kdf, AesKdf):
+        return kdf._replace(rounds=tuned)
+    return kdf._replace(iterations=tuned)
+
+
+class KdfNotSupportedException(Exception):
+    """Exception raised when a keepass db can't use the requested key derivation."""
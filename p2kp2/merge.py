@@ -0,0 +1,210 @@
+import os
+import threading
+from queue import Queue, Empty, Full
+from typing import List, Tuple, Iterable, Iterator, Callable
+
+from p2kp2.index import StoreIndex, IndexEntry
+from p2kp2.reader import EntryReader, PassReader, PassEntry, BatchMapper
+
+
+def mount_path(prefix: str) -> Tuple[str, ...]:
+    """Return the groups of a mount prefix, like 'team/infra'. An empty prefix is the root group."""
+    return tuple(x for x in prefix.strip("/").split("/") if x != "") if prefix is not None else ()
+
+
+def default_prefix(path: str) -> str:
+    """Return the prefix a store is mounted under when none is given: its folder name, with no leading dots."""
+    return os.path.basename(os.path.normpath(os.path.expanduser(path))).lstrip(".")
+
+
+def check_mounts(prefixes: Iterable[str]):
+    """Make sure every entry name belongs to a single store: raise a ValueError for an empty prefix among many
+    stores, for two equal prefixes, or for a prefix nested into another one."""
+    paths = [mount_path(x) for x in prefixes]
+    for i, path in enumerate(paths):
+        if path == () and len(paths) > 1:
+            raise ValueError("every store needs its own prefix when there are many of them")
+        for other in paths[i + 1:]:
+            if path[:len(other)] == other or other[:len(path)] == path:
+                raise ValueError(f"the store prefixes '{'/'.join(path)}' and '{'/'.join(other)}' overlap")
+
+
+class MergedIndex(StoreIndex):
+    """The entries of several password-stores, each one under its mount path, as the index of a single store."""
+
+    def __init__(self, indexes: List[Tuple[Tuple[str, ...], StoreIndex]]):
+        """Constructor for MergedIndex
+
+        :param indexes: the mount path and the index of every store
+        """
+        self.path = None
+        self.entries = [IndexEntry("/".join(path + (entry.name,)), entry.path, entry.size, entry.mtime_ns,
+                                   path + entry.groups)
+                        for path, index in indexes for entry in index]
+
+
+class _EndOfStore:
+    """Sentinel put on the queue when a store reader is done, carrying its exception if any."""
+
+    def __init__(self, exception: BaseException = None):
+        self.exception = exception
+
+
+class MergedReader(EntryReader):
+    """Read several password-stores as a single one, every store under its own group prefix.
+
+    Every store has its own PassReader, with its own decryption backend and jobs, and its own mapper, which sees
+    the entries as they are in their store. Readers run at the same time, each in its own thread, and hand their
+    entries, once mounted under their prefix, to a bounded queue: entries of different stores come out
+    interleaved, as they are decrypted. Writers nesting groups as entries come, like KeePassXmlWriter, need every
+    store in one piece instead: with contiguous, every store gets a queue of its own, and stores come out one
+    after the other, while the next ones decrypt up to queue_size entries ahead. The first error stops all the
+    readers and is raised again.
+
+    Entry names are the mounted ones, like 'team/web/test2' for the 'web/test2' entry of the store mounted under
+    'team': they work with the checkpoints, but not with a sync, which needs the entries in order.
+    """
+
+    def __init__(self, stores: List[Tuple[str, PassReader]], queue_size: int = 64, contiguous: bool = False):
+        """Constructor for MergedReader
+
+        :param stores: the prefix and the reader of every store. Prefixes are group paths, like 'team/infra':
+            they must not overlap, and can only be empty for a single store
+        :param queue_size: the maximum number of entries waiting to be consumed, of every store if contiguous
+        :param contiguous: yield the stores one after the other, instead of interleaved, by default
+        """
+        if len(stores) == 0:
+            raise ValueError("at least a store is needed")
+        check_mounts(prefix for prefix, _ in stores)
+        super().__init__()
+        self.stores = [(mount_path(prefix), reader) for prefix, reader in stores]
+        self.queue_size = queue_size
+        self.contiguous = contiguous
+        self._index = None
+
+    @property
+    def mapper(self) -> Callable:
+        """The mapper of the store readers, for the checks that depend on it: a BatchMapper if any of them uses
+        one, else the first mapper found."""
+        mappers = [reader.mapper for _, reader in self.stores if reader.mapper is not None]
+        return next((x for x in mappers if isinstance(x, BatchMapper)), mappers[0] if mappers else None)
+
+    @property
+    def index(self) -> MergedIndex:
+        """The entries index of all the stores, mounted under their prefix."""
+        if self._index is None:
+            self._index = MergedIndex([(path, reader.index) for path, reader in self.stores])
+        return self._index
+
+    def refresh_index(self):
+        """Forget the stores index: they will be scanned again the next time the index is needed."""
+        self._index = None
+        for _, reader in self.stores:
+            reader.refresh_index()
+
+    def get_pass_entries(self) -> List[str]:
+        """Returns all the stores entries, with their mounted name."""
+        return self.index.names()
+
+    def close(self):
+        """Release the resources held by the decryption backends."""
+        for _, reader in self.stores:
+            reader.close()
+
+    def split_entries(self, entries_name: Iterable[str]) -> List[List[str]]:
+        """Return, for every store, the names in it of the given mounted entries."""
+        names = [[] for _ in self.stores]
+        for entry_name in entries_name:
+            parts = tuple(entry_name.split("/"))
+            for i, (path, _) in enumerate(self.stores):
+                if parts[:len(path)] == path and len(parts) > len(path):
+                    names[i].append("/".join(parts[len(path):]))
+                    break
+            else:
+                raise FileNotFoundError(f"{entry_name} is not in any of the password-stores.")
+        return names
+
+    def iter_entries(self, entries_name: Iterable[str] = None, contiguous: bool = None) -> Iterator[PassEntry]:
+        """Lazily decrypt and parse the entries of all the stores at the same time, firing a progress event every
+        event_step entries and after the last one.
+
+        :param entries_name: optional mounted names of the entries to read, instead of all of them
+        :param contiguous: yield the stores one after the other, instead of interleaved. Default is the reader
+            setting
+        """
+        if entries_name is None:
+            entries_name = self.get_pass_entries()
+        if contiguous is None:
+            contiguous = self.contiguous
+        if contiguous:
+            queues = [Queue(maxsize=self.queue_size) for _ in self.stores]
+        else:
+            queues = [Queue(maxsize=self.queue_size)] * len(self.stores)
+        errors = []
+        stop = threading.Event()
+
+        def put(queue: Queue, item) -> bool:
+            """Wait for room in the queue, giving up if the entries are no longer wanted."""
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def read(queue: Queue, path: Tuple[str, ...], reader: PassReader, names: List[str]):
+            entries = reader.iter_entries(names)
+            try:
+                for entry in entries:
+                    entry.groups = list(path) + entry.groups
+                    if not put(queue, entry):
+                        break
+                put(queue, _EndOfStore())
+            except BaseException as e:
+                # a later store fails the reading too, without waiting for its turn
+                errors.append(e)
+                put(queue, _EndOfStore(e))
+            finally:
+                entries.close()
+
+        threads = [threading.Thread(target=read, args=(queue, path, reader, names), name=f"p2kp2-store-{i}",
+                                    daemon=True)
+                   for i, (queue, (path, reader), names) in enumerate(zip(queues, self.stores,
+                                                                           self.split_entries(entries_name)))]
+        for thread in threads:
+            thread.start()
+        i = 0
+        try:
+            # every queue, in order, with the number of stores feeding it
+            for queue, stores in ([(x, 1) for x in queues] if contiguous else [(queues[0], len(queues))]):
+                while stores > 0:
+                    try:
+                        item = queue.get(timeout=0.1)
+                    except Empty:
+                        if errors:
+                            raise errors[0]
+                        continue
+                    if isinstance(item, _EndOfStore):
+                        if item.exception is not None:
+                            raise item.exception
+                        stores -= 1
+                        continue
+                    i = i + 1
+                    if i % self.event_step == 0:
+                        self.event_stream.on_next(i)
+                    yield item
+            if i % self.event_step != 0:
+                self.event_stream.on_next(i)
+        finally:
+            stop.set()
+            # unblock the readers waiting for room in their queue
+            for queue in set(queues):
+                try:
+                    while True:
+                        queue.get_nowait()
+                except Empty:
+                    pass
+            for thread in threads:
+                thread.join()
+
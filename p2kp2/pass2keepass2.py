@@ -1,40 +1,77 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
 import os
 import signal
 import sys
 import importlib.util
 from getpass import getpass
-from math import floor
-from typing import Callable
+from typing import Callable, Union
 
-from p2kp2 import PassReader, P2KP2, DbAlreadyExistsException, CustomMapperExecException, __version__
+from p2kp2 import PassReader, P2KP2, BatchMapper, ProcessMapper, DbAlreadyExistsException, \
+    DbNotWritableException, CustomMapperExecException, __version__
+from p2kp2.backends import BackendNotAvailableException
+from p2kp2.checkpoint import Checkpoint, CheckpointException
+from p2kp2.exporters import formats
+from p2kp2.kdf import Kdf, AesKdf, Argon2Kdf, KdfNotSupportedException, calibrate, check_kdf
+from p2kp2.merge import MergedReader, check_mounts, default_prefix
+from p2kp2.pipeline import convert
+from p2kp2.profiling import Profiler
+from p2kp2.progress import ProgressReporter
+from p2kp2.reverse import KeePassReader, PassWriter, PassEntryExistsException, UnsafePassEntryException
+from p2kp2.rules import FieldRules, RulesException
+from p2kp2.shards import ShardedWriter, ShardException
+from p2kp2.sync import sync
+from p2kp2.writer import EntryWriter
 
 
-def print_reader_progress(reader):
-    nentries = len(reader.get_pass_entries())
+def print_conversion_progress(reader, writer, mode: str = "text", total: int = None,
+                              stream=None) -> ProgressReporter:
+    """Return a reporter printing the conversion progress, to stream or stdout, while in its with block."""
+    return ProgressReporter(reader, writer, mode=mode, total=total, stream=stream)
 
-    def print_progress(progress):
-        percent = floor(100 * progress / nentries)
-        sys.stdout.write(f" > Reading password-store... {percent}%\r")
-        sys.stdout.flush()
-    reader.event_stream.subscribe(print_progress)
 
+def run_conversion(reader, writer, args) -> int:
+    """Convert the entries, skipping the ones already converted when resuming, while printing the progress.
 
-def print_writer_progress(writer, nentries):
-    def print_progress(progress):
-        percent = floor(100 * progress / nentries)
-        sys.stdout.write(f" > Writing keepass database... {percent}%\r")
-        sys.stdout.flush()
-    writer.event_stream.subscribe(print_progress)
+    Return the number of entries in the destination.
+    """
+    entries_name = reader.get_pass_entries()
+    if args.checkpoint is not None:
+        if args.resume:
+            done = args.checkpoint.resume(writer)
+            entries_name = [x for x in entries_name if x not in done]
+        else:
+            # a new conversion: the journal of a previous one, if any, is stale
+            args.checkpoint.remove()
+    with print_conversion_progress(reader, writer, mode=args.progress, total=len(entries_name),
+                                   stream=args.progress_stream):
+        written = convert(reader, writer, entries_name=entries_name)
+    if isinstance(writer, ShardedWriter):
+        print("")
+        for path, count in sorted(writer.shards.items()):
+            print(f" > {os.path.abspath(path)}: {count} entries")
+        return written
+    return len(writer.db.entries) if args.format == "kdbx" else written
+
+
+def print_profile(args):
+    """Save the profiling report, if asked to, and print its summary."""
+    if args.profiler is None:
+        return
+    args.profiler.save(args.profile)
+    print("")
+    print(args.profiler.summary())
+    print(f"\nProfiling report saved to {os.path.abspath(args.profile)}")
 
 
 class CustomMapperImportException(Exception):
     """Exception raised when encountering an error when importing an user provided mapper function."""
 
 
-def import_custom_mapper(path: str) -> Callable:
+def import_custom_mapper(path: str, batch_size: int = 100,
+                         processes: int = 0) -> Union[Callable, BatchMapper, ProcessMapper]:
     try:
         # Create a spec from the provided file
         spec = importlib.util.spec_from_file_location("p2kp2.custom", path)
@@ -42,12 +79,172 @@ def import_custom_mapper(path: str) -> Callable:
         custom = importlib.util.module_from_spec(spec)
         # Import the custom module
         spec.loader.exec_module(custom)
-        # Return the mapper function
+        # Return the mapper function: a batch mapper, if there's one, wins over a single entry mapper
+        if hasattr(custom, "custom_batch_mapper"):
+            return BatchMapper(custom.custom_batch_mapper, size=batch_size)
+        if processes > 0:
+            return ProcessMapper(custom.custom_mapper, processes=processes, source=path)
         return custom.custom_mapper
     except:
         raise CustomMapperImportException()
 
 
+def make_kdf(args) -> Kdf:
+    """Build the key derivation settings from the command line options, None if none was given."""
+    aes_options = args.kdf_rounds is not None
+    argon2_options = any(x is not None for x in [args.kdf_memory, args.kdf_iterations, args.kdf_parallelism])
+    name = args.kdf
+    if name is None:
+        if aes_options and argon2_options:
+            raise ValueError("AES-KDF and Argon2 options can't be mixed.")
+        if argon2_options:
+            name = "argon2d"
+        elif aes_options or args.kdf_target_ms is not None:
+            name = "aes"
+        else:
+            return None
+    if name == "aes":
+        if argon2_options:
+            raise ValueError("Argon2 options can't be used with AES-KDF.")
+        kdf = AesKdf() if args.kdf_rounds is None else AesKdf(rounds=args.kdf_rounds)
+    else:
+        if aes_options:
+            raise ValueError("AES-KDF rounds can't be used with Argon2.")
+        kdf = Argon2Kdf(variant=name)
+        if args.kdf_memory is not None:
+            kdf = kdf._replace(memory=args.kdf_memory * 1024)
+        if args.kdf_iterations is not None:
+            kdf = kdf._replace(iterations=args.kdf_iterations)
+        if args.kdf_parallelism is not None:
+            kdf = kdf._replace(parallelism=args.kdf_parallelism)
+    check_kdf(kdf)
+    if args.kdf_target_ms is not None:
+        kdf = calibrate(kdf, args.kdf_target_ms)
+    return kdf
+
+
+def check_format(args):
+    """Refuse the options that only apply to a keepass database when writing another format."""
+    if args.format == "kdbx":
+        return
+    kdbx_options = {"--sync": args.sync, "--bulk": args.bulk, "--checkpoint": args.checkpoint_interval is not None,
+                    "--resume": args.resume, "--kdf options": args.kdf_settings is not None}
+    for option, used in kdbx_options.items():
+        if used:
+            raise ValueError(f"{option} can't be used with the {args.format} format.")
+
+
+def check_shards(args):
+    """Refuse the options a sharded conversion can't handle: every shard is a new keepass db, written at once."""
+    if args.shard_by is None:
+        return
+    unsupported = {"--format": args.format != "kdbx", "--sync": args.sync,
+                   "--checkpoint": args.checkpoint_interval is not None, "--resume": args.resume,
+                   "--profile": args.profile is not None}
+    for option, used in unsupported.items():
+        if used:
+            raise ValueError(f"{option} can't be used with --shard-by.")
+    if args.shard_processes is not None and args.shard_processes < 1:
+        raise ValueError("the number of shard processes must be a positive integer.")
+
+
+def make_writer(args, password: str) -> EntryWriter:
+    """Build the writer of the chosen output format."""
+    if args.shard_by is not None:
+        return ShardedWriter(password=password, destination=args.output, overwrite=args.force_overwrite,
+                             bulk=args.bulk, kdf=args.kdf_settings, processes=args.shard_processes)
+    if args.format == "kdbx":
+        return P2KP2(password=password, destination=args.output, overwrite=args.force_overwrite,
+                     bulk=args.bulk, sync=args.sync or args.resume, kdf=args.kdf_settings,
+                     profiler=args.profiler, checkpoint=args.checkpoint)
+    return formats[args.format](destination=args.output, overwrite=args.force_overwrite, profiler=args.profiler)
+
+
+def check_reverse(args):
+    """Make sure a reverse conversion has both its paths, refusing the options that only apply to a conversion."""
+    if not args.reverse:
+        return
+    if args.input is None or args.output is None:
+        raise ValueError("--reverse needs the keepass database with -i and the password-store folder with -o.")
+    conversion_options = {"--format": args.format != "kdbx", "--sync": args.sync, "--bulk": args.bulk,
+                          "--checkpoint": args.checkpoint_interval is not None, "--resume": args.resume,
+                          "--kdf options": args.kdf_settings is not None, "-c": args.custom is not None,
+                          "-r": args.rules is not None, "--shard-by": args.shard_by is not None}
+    for option, used in conversion_options.items():
+        if used:
+            raise ValueError(f"{option} can't be used with --reverse.")
+
+
+def parse_stores(args):
+    """Turn the -i options into the stores to merge, as (prefix, path) pairs, leaving a single plain -i as it is.
+
+    Every -i is either a store path, mounted under its folder name, or 'PREFIX=PATH'. Values naming an existing
+    folder are always paths, even with a '=' in them.
+    """
+    values = args.input
+    args.stores = None
+    if values is None:
+        return
+    if len(values) == 1 and ("=" not in values[0] or os.path.isdir(os.path.expanduser(values[0]))):
+        args.input = values[0]
+        return
+    if args.reverse:
+        raise ValueError("--reverse reads a single keepass database.")
+    if args.sync:
+        raise ValueError("--sync can't be used with many stores, or a store prefix.")
+    stores = []
+    for value in values:
+        prefix, separator, path = value.partition("=")
+        if not separator or os.path.isdir(os.path.expanduser(value)):
+            prefix, path = default_prefix(value), value
+        stores.append((prefix, path))
+    check_mounts(prefix for prefix, _ in stores)
+    args.input = None
+    args.stores = stores
+
+
+def make_merged_reader(args, mapper: Callable, password: str = None) -> MergedReader:
+    """Build a reader for every store given with -i, merged into a single one."""
+    return MergedReader([(prefix, PassReader(path=path, password=password, mapper=mapper, jobs=args.jobs,
+                                             backend=args.backend, profiler=args.profiler, rules=args.field_rules,
+                                             wipe_buffers=args.wipe_buffers))
+                         for prefix, path in args.stores])
+
+
+def input_line(args) -> str:
+    """Describe the input password-store, or stores, for the intro message."""
+    if args.stores is None:
+        return "Input password-store: {}\n".format(
+            os.path.abspath(args.input) if args.input is not None else os.path.expanduser("~/.password-store"))
+    return "Input password-stores:\n" + "".join(
+        f"  {os.path.abspath(os.path.expanduser(path))} under '{prefix}'\n" for prefix, path in args.stores)
+
+
+def resume_hint(args) -> str:
+    """Suggest --resume when the destination was left behind by an interrupted conversion."""
+    destination = args.output if args.output is not None else "pass.kdbx"
+    return ", or --resume to complete the interrupted conversion" if Checkpoint(destination).exists() else ""
+
+
+def make_checkpoint(args) -> Checkpoint:
+    """Build the conversion checkpoint from the command line options, None if none was asked for."""
+    if args.checkpoint_interval is None and not args.resume:
+        return None
+    if args.sync:
+        raise ValueError("a sync is always incremental: it can't be checkpointed or resumed.")
+    interval = args.checkpoint_interval if args.checkpoint_interval is not None else 60
+    if interval <= 0:
+        raise ValueError("the checkpoint interval must be positive.")
+    destination = args.output if args.output is not None else "pass.kdbx"
+    checkpoint = Checkpoint(destination, interval=interval)
+    if args.resume:
+        if args.force_overwrite:
+            raise ValueError("-f and --resume can't be used together.")
+        if not checkpoint.exists() or not os.path.exists(destination):
+            raise ValueError(f"there's no interrupted conversion to resume at {os.path.abspath(destination)}.")
+    return checkpoint
+
+
 def exec_normal_mode(args):
     """Interactive script."""
 
@@ -63,12 +260,12 @@ def exec_normal_mode(args):
             "encrypted while in memory, so you probably want to execute this on a trusted hardware.\n\n" \
             "The script will now read your input password-store, so you will probably be asked to " \
             "unlock it.\nKeep in mind this may take a while, depending on the number of entries.\n\n" \
-            "Input password-store: {}\n" \
+            "{}" \
             "Output keepass2 database: {}\n" \
             "{}" \
-        .format(os.path.abspath(args.input) if args.input is not None else os.path.expanduser("~/.password-store"),
+        .format(input_line(args),
                 os.path.abspath(args.output) if args.output is not None else os.path.abspath(
-                    "pass.kdbx"),
+                    f"pass.{args.format}"),
                 mapper_line)
     print(intro)
     answer = input("Are you ready to proceed? [Y/n] ")
@@ -81,66 +278,95 @@ def exec_normal_mode(args):
     try:
         mapper = None
         if mapper_path is not None:
-            mapper = import_custom_mapper(mapper_path)
-        reader = PassReader(path=args.input, mapper=mapper)
+            mapper = import_custom_mapper(mapper_path, batch_size=args.batch_size,
+                                          processes=args.map_processes)
+        if args.stores is not None:
+            reader = make_merged_reader(args, mapper)
+        else:
+            reader = PassReader(path=args.input, mapper=mapper, jobs=args.jobs, backend=args.backend,
+                                profiler=args.profiler, rules=args.field_rules, wipe_buffers=args.wipe_buffers)
     except CustomMapperImportException:
         print(">> ERROR: error while importing the provided mapper.")
         exit(1)
-    except Exception:
-        print(">> ERROR: error while reading the password-store.")
-        exit(1)
-
-    # Parse the entries
-    try:
-        print_reader_progress(reader)
-        reader.parse_db()
-        print("\n\nPassword-store decrypted! {} entries are ready to be converted.".format(len(reader.entries)))
-    except CustomMapperExecException:
-        print(">> ERROR: error while executing the provided mapper.")
+    except BackendNotAvailableException as e:
+        print(f">> ERROR: {e}")
         exit(1)
     except Exception:
-        print("\n>> ERROR: error while parsing the password-store entries.")
+        print(">> ERROR: error while reading the password-store.")
         exit(1)
 
     # Choose a password for keepass
-    print("Now choose a strong password for your new keepass database!\n")
     password = None
-    while password is None:
-        p1 = getpass("A strong password: ")
-        p2 = getpass("Enter it again! ")
-        if p1 == p2:
-            password = p1
-        else:
-            print("\n >>> Entered passwords do not match, try again.\n")
+    if args.format == "kdbx":
+        print("Now choose a strong password for your new keepass database!\n")
+        while password is None:
+            p1 = getpass("A strong password: ")
+            p2 = getpass("Enter it again! ")
+            if p1 == p2:
+                password = p1
+            else:
+                print("\n >>> Entered passwords do not match, try again.\n")
+    else:
+        print(f"> WARNING < The {args.format} file will hold all your passwords in clear text: keep it safe!\n")
 
-    # Write the keepass db
-    print("\nAlright! It's finally time to write the keepass db. Hold tight, this might take a while!")
+    # Convert the pass db into the keepass db
+    print("\nAlright! It's finally time to convert the password-store. Hold tight, this might take a while!")
     try:
         print("")
         sys.stdout.write(f" > Creating the new keepass database... 0%\r")
         sys.stdout.flush()
-        p2kp2 = P2KP2(password=password, destination=args.output, overwrite=args.force_overwrite)
+        p2kp2 = make_writer(args, password)
         sys.stdout.write(f" > Creating the new keepass database... 100%\r")
         sys.stdout.flush()
     except DbAlreadyExistsException:
         print("")
         print(">> ERROR: keepass database file already exists! "
-              "Use -f if you want to force overwriting.")
+              "Use -f if you want to force overwriting{}.".format(resume_hint(args)))
+        exit(1)
+    except (KdfNotSupportedException, DbNotWritableException) as e:
+        print("")
+        print(f">> ERROR: {e}")
+        exit(1)
+    except Exception:
+        print("")
+        print(">> ERROR: error while opening the keepass database.")
         exit(1)
 
     try:
         print("")
-        print_writer_progress(p2kp2, len(reader.entries))
-        p2kp2.populate_db(reader)
+        if args.sync:
+            result = sync(reader, p2kp2)
+            print(
+                "\nALL DONE! {} entries added, {} updated, {} removed and {} left untouched.\nHave a nice day!"
+                .format(result.added, result.updated, result.removed, result.unchanged)
+            )
+        else:
+            count = run_conversion(reader, p2kp2, args)
+            print("")
+            print(
+                "\nALL DONE! {} entries have been added to the new {}!\nHave a nice day!"
+                .format(count, "keepass database" if args.format == "kdbx" else f"{args.format} file")
+            )
+    except (CheckpointException, ShardException) as e:
         print("")
-        print(
-            "\nALL DONE! {} entries have been added to the new keepass database!\nHave a nice day!"
-            .format(len(p2kp2.db.entries))
-        )
+        print(f">> ERROR: {e}")
+        exit(1)
+    except DbAlreadyExistsException as e:
+        print("")
+        print(f">> ERROR: keepass database file {e} already exists! Use -f if you want to force overwriting.")
+        exit(1)
+    except CustomMapperExecException as e:
+        print("")
+        print(">> ERROR: error while executing the provided mapper{}.".format(
+            f" on {e.entry}" if e.entry is not None else ""))
+        if e.reason is not None:
+            print(f">> {e.reason}")
+        exit(1)
     except Exception:
         print("")
-        print("\n>> ERROR: error while adding entries to the new db.")
+        print("\n>> ERROR: error while converting the password-store entries.")
         exit(1)
+    print_profile(args)
 
 
 def exec_quick_mode(args):
@@ -151,36 +377,39 @@ def exec_quick_mode(args):
     try:
         mapper = args.custom
         if mapper is not None:
-            mapper = import_custom_mapper(os.path.abspath(args.custom))
-        reader = PassReader(path=args.input, password=password, mapper=mapper)
+            mapper = import_custom_mapper(os.path.abspath(args.custom), batch_size=args.batch_size,
+                                          processes=args.map_processes)
+        if args.stores is not None:
+            reader = make_merged_reader(args, mapper, password)
+        else:
+            reader = PassReader(path=args.input, password=password, mapper=mapper, jobs=args.jobs,
+                                backend=args.backend, profiler=args.profiler, rules=args.field_rules,
+                                wipe_buffers=args.wipe_buffers)
     except CustomMapperImportException:
         print(">> ERROR: error while importing the provided mapper.")
         exit(1)
-    except Exception:
-        print(">> ERROR: error while reading the password-store.")
-        exit(1)
-
-    try:
-        print_reader_progress(reader)
-        reader.parse_db()
-    except CustomMapperExecException:
-        print(">> ERROR: error while executing the provided mapper.")
+    except BackendNotAvailableException as e:
+        print(f">> ERROR: {e}")
         exit(1)
     except Exception:
-        print("\n>> ERROR: error while parsing the password-store entries.")
+        print(">> ERROR: error while reading the password-store.")
         exit(1)
 
     try:
         print("")
         sys.stdout.write(f" > Creating the new keepass database... 0%\r")
         sys.stdout.flush()
-        p2kp2 = P2KP2(password=password, destination=args.output, overwrite=args.force_overwrite)
+        p2kp2 = make_writer(args, password)
         sys.stdout.write(f" > Creating the new keepass database... 100%\r")
         sys.stdout.flush()
     except DbAlreadyExistsException:
         print("")
         print("\n>> ERROR: keepass database file already exists! "
-              "Use -f if you want to force overwriting.")
+              "Use -f if you want to force overwriting{}.".format(resume_hint(args)))
+        exit(1)
+    except (KdfNotSupportedException, DbNotWritableException) as e:
+        print("")
+        print(f"\n>> ERROR: {e}")
         exit(1)
     except Exception:
         print("")
@@ -189,14 +418,76 @@ def exec_quick_mode(args):
 
     try:
         print("")
-        print_writer_progress(p2kp2, len(reader.entries))
-        p2kp2.populate_db(reader)
+        if args.sync:
+            result = sync(reader, p2kp2)
+            print("ALL DONE! {} added, {} updated, {} removed, {} unchanged! Bye!"
+                  .format(result.added, result.updated, result.removed, result.unchanged))
+        else:
+            count = run_conversion(reader, p2kp2, args)
+            print("")
+            print("ALL DONE! {} entries converted! Bye!".format(count))
+    except (CheckpointException, ShardException) as e:
+        print("")
+        print(f">> ERROR: {e}")
+        exit(1)
+    except DbAlreadyExistsException as e:
+        print("")
+        print(f">> ERROR: keepass database file {e} already exists! Use -f if you want to force overwriting.")
+        exit(1)
+    except CustomMapperExecException as e:
+        print("")
+        print(">> ERROR: error while executing the provided mapper{}.".format(
+            f" on {e.entry}" if e.entry is not None else ""))
+        if e.reason is not None:
+            print(f">> {e.reason}")
+        exit(1)
+    except Exception:
+        print("")
+        print("\n>> ERROR: error while converting the password-store entries.")
+        exit(1)
+    print_profile(args)
+
+
+def exec_reverse_mode(args):
+    """Restore a password-store from a keepass db."""
+    print("Insert the password of the keepass database:")
+    password = getpass("-> ")
+    try:
+        reader = KeePassReader(args.input, password=password, profiler=args.profiler)
+    except Exception:
+        print(">> ERROR: error while opening the keepass database.")
+        exit(1)
+    try:
+        writer = PassWriter(args.output, recipients=args.recipient, jobs=args.jobs, overwrite=args.force_overwrite,
+                            profiler=args.profiler)
+    except Exception as e:
+        print(f">> ERROR: {e}")
+        exit(1)
+
+    try:
+        print("")
+        total = len(reader.get_keepass_entries())
+        with ProgressReporter(reader, writer, mode=args.progress, total=total, stream=args.progress_stream,
+                              labels=("Reading keepass database", "Writing password-store")):
+            writer.populate_db(reader.iter_entries())
+        print("")
+        if reader.skipped:
+            print(f">> WARNING: the attachments of {len(reader.skipped)} entries were left out: "
+                  f"{', '.join(reader.skipped)}")
+        print("ALL DONE! {} entries restored! Bye!".format(total))
+    except PassEntryExistsException as e:
         print("")
-        print("ALL DONE! {} entries converted! Bye!".format(len(p2kp2.db.entries)))
+        print(f">> ERROR: {e} Use -f if you want to force overwriting.")
+        exit(1)
+    except UnsafePassEntryException as e:
+        print("")
+        print(f">> ERROR: {e}")
+        exit(1)
     except Exception:
         print("")
-        print("\n>> ERROR: error while adding entries to the new db.")
+        print("\n>> ERROR: error while writing the password-store entries.")
         exit(1)
+    print_profile(args)
 
 
 def main_func():
@@ -208,17 +499,84 @@ def main_func():
     # Parse commandline
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--custom', default=None)
-    parser.add_argument('-i', '--input', default=None)
+    parser.add_argument('--map-processes', type=int, default=0,
+                        help="run the custom_mapper in this many worker processes")
+    parser.add_argument('-r', '--rules', default=None, help="a json file of declarative field mapping rules")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="number of entries handed at once to a custom_batch_mapper")
+    parser.add_argument('-i', '--input', action='append', default=None,
+                        help="the password-store, or [PREFIX=]PATH for each of many stores merged into one database")
     parser.add_argument('-o', '--output', default=None)
     parser.add_argument('-q', '--quick', action='store_true')
     parser.add_argument('-f', '--force-overwrite', action='store_true')
+    parser.add_argument('--format', choices=['kdbx', 'xml', 'csv'], default='kdbx',
+                        help="write a keepass database, or a clear text KeePass 2 XML or CSV file to import")
+    parser.add_argument('--bulk', action='store_true')
+    parser.add_argument('--sync', action='store_true')
+    parser.add_argument('--checkpoint', dest='checkpoint_interval', type=float, default=None,
+                        help="save the partial database every this many seconds, to resume it if interrupted")
+    parser.add_argument('--resume', action='store_true', help="complete an interrupted checkpointed conversion")
+    parser.add_argument('--shard-by', choices=['top-level-group'], default=None,
+                        help="write one keepass database per top-level folder, in parallel processes")
+    parser.add_argument('--shard-processes', type=int, default=None,
+                        help="the number of processes writing the shards, the number of CPUs by default")
+    parser.add_argument('--reverse', action='store_true',
+                        help="restore a password-store in the -o folder from the -i keepass database")
+    parser.add_argument('--recipient', action='append', default=None,
+                        help="a gpg recipient of the restored password-store, when it has no .gpg-id yet")
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--wipe-buffers', action='store_true',
+                        help="parse every decrypted entry in place and wipe its plaintext right away")
+    parser.add_argument('-b', '--backend', choices=['passpy', 'batch', 'openpgp'], default='passpy')
+    parser.add_argument('--kdf', choices=['aes', 'argon2d', 'argon2id'], default=None)
+    parser.add_argument('--kdf-rounds', type=int, default=None)
+    parser.add_argument('--kdf-memory', type=int, default=None, help="Argon2 memory, in MiB")
+    parser.add_argument('--kdf-iterations', type=int, default=None)
+    parser.add_argument('--kdf-parallelism', type=int, default=None)
+    parser.add_argument('--kdf-target-ms', type=int, default=None,
+                        help="tune the key derivation to take this long on this machine")
+    parser.add_argument('--progress', choices=['text', 'json'], default='text',
+                        help="print the progress as a line of text, or as json lines for logs")
+    parser.add_argument('--profile', default=None, help="save a per-stage timing report to this json file")
     parser.add_argument('-v', '--version', action='store_true')
     parsed_args = parser.parse_args()
+    if parsed_args.batch_size < 1:
+        parser.error("the batch size must be a positive integer")
+    if parsed_args.map_processes < 0:
+        parser.error("the number of mapper processes can't be negative")
+    try:
+        parse_stores(parsed_args)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        parsed_args.field_rules = FieldRules.from_file(parsed_args.rules) if parsed_args.rules is not None else None
+    except RulesException as e:
+        parser.error(f"invalid rules file: {e}")
+    parsed_args.profiler = Profiler() if parsed_args.profile is not None else None
+    try:
+        parsed_args.checkpoint = make_checkpoint(parsed_args)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        parsed_args.kdf_settings = make_kdf(parsed_args)
+        check_format(parsed_args)
+        check_reverse(parsed_args)
+        check_shards(parsed_args)
+    except ValueError as e:
+        parser.error(str(e))
 
+    parsed_args.progress_stream = None
     if parsed_args.version:
         print("Pass2keepass2 v{}".format(__version__))
-    else:
-        if parsed_args.quick:
+        return
+    with contextlib.ExitStack() as stack:
+        if parsed_args.progress == "json":
+            # stdout only gets the json lines, for the programs reading them: any other message goes to stderr
+            parsed_args.progress_stream = sys.stdout
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        if parsed_args.reverse:
+            exec_reverse_mode(parsed_args)
+        elif parsed_args.quick:
             exec_quick_mode(parsed_args)
         else:
             exec_normal_mode(parsed_args)
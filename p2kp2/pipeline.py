@@ -0,0 +1,97 @@
+import threading
+from queue import Queue, Empty, Full
+from typing import Iterator, List
+
+from p2kp2.checkpoint import CheckpointException
+from p2kp2.merge import MergedReader
+from p2kp2.reader import PassReader, PassEntry, BatchMapper
+from p2kp2.writer import EntryWriter
+
+
+class _EndOfEntries:
+    """Sentinel put on the queue when the reader is done, carrying the reader exception if any."""
+
+    def __init__(self, exception: BaseException = None):
+        self.exception = exception
+
+
+def convert(reader: PassReader, writer: EntryWriter, queue_size: int = 64, entries_name: List[str] = None) -> int:
+    """Decrypt the pass db and populate the keepass db at the same time.
+
+    The keepass group tree is created up front from the store index, unless the reader has a mapper, which may
+    move entries out of their folder and leave some groups empty. Then the reader runs in its own thread
+    and hands the parsed entries to the writer through a bounded queue: at most queue_size decrypted entries
+    are waiting to be written at any time, however big the store is. The first error, either while reading or
+    while writing, stops both stages and is raised again here.
+
+    :param reader: the PassReader to read entries from
+    :param writer: the P2KP2, or any other EntryWriter, to write entries to
+    :param queue_size: the maximum number of entries waiting to be written
+    :param entries_name: optional names of the entries to convert, instead of the whole store, like the ones
+        left to convert when resuming from a checkpoint
+    :return: the number of entries written
+    """
+    if entries_name is None:
+        entries_name = reader.get_pass_entries()
+    if writer.checkpoint is not None:
+        if isinstance(reader.mapper, BatchMapper):
+            raise CheckpointException("a batch mapper can't be used with a checkpoint")
+        writer.checkpoint.start(entries_name)
+    queue = Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """Wait for room in the queue, giving up if the writer stopped."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def read():
+        if isinstance(reader, MergedReader):
+            # interleaved stores, unless the writer needs every one of them in one piece
+            entries = reader.iter_entries(entries_name, contiguous=writer.contiguous)
+        else:
+            entries = reader.iter_entries(entries_name)
+        try:
+            for entry in entries:
+                if not put(entry):
+                    break
+            put(_EndOfEntries())
+        except BaseException as e:
+            put(_EndOfEntries(e))
+        finally:
+            entries.close()
+
+    written = 0
+
+    def queued_entries() -> Iterator[PassEntry]:
+        nonlocal written
+        while True:
+            item = queue.get()
+            if isinstance(item, _EndOfEntries):
+                if item.exception is not None:
+                    raise item.exception
+                return
+            written += 1
+            yield item
+
+    if reader.mapper is None:
+        writer.build_group_tree(reader.index.groups())
+    producer = threading.Thread(target=read, name="p2kp2-reader", daemon=True)
+    producer.start()
+    try:
+        writer.populate_db(queued_entries())
+    finally:
+        stop.set()
+        # unblock the reader if it's waiting for room in the queue
+        try:
+            while True:
+                queue.get_nowait()
+        except Empty:
+            pass
+        producer.join()
+    return written
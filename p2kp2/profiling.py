@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, ContextManager
+
+stages = ["scan", "decrypt", "parse", "map", "group lookup", "insert", "bulk build", "bulk attach", "save"]
+
+
+class Profiler:
+    """Record how long every conversion stage takes, overall and for every entry.
+
+    Only timings are recorded, together with the entries name, which pass keeps unencrypted on disk anyway:
+    passwords and every other entry content never reach the profiler. It's safe to use from many threads.
+    """
+
+    enabled: bool = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings: Dict[str, List[float]] = {}
+        self.entries: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, entry: str = None):
+        """Record a single run of a stage.
+
+        :param stage: the stage name
+        :param seconds: how long it took
+        :param entry: the name of the entry it was run for, if any
+        """
+        with self._lock:
+            self.timings.setdefault(stage, []).append(seconds)
+            if entry is not None:
+                timings = self.entries.setdefault(entry, {})
+                timings[stage] = timings.get(stage, 0) + seconds
+
+    @contextmanager
+    def measure(self, stage: str, entry: str = None):
+        """Record the time spent in the with block as a run of the given stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, entry)
+
+    def report(self) -> Dict:
+        """Return the wall time, then calls, total time and latency percentiles of every stage, then the time
+        spent on every entry in each stage."""
+        with self._lock:
+            report_stages = {}
+            for stage in sorted(self.timings, key=lambda x: stages.index(x) if x in stages else len(stages)):
+                values = sorted(self.timings[stage])
+                report_stages[stage] = {
+                    "calls": len(values),
+                    "total": sum(values),
+                    "mean": sum(values) / len(values),
+                    "p50": percentile(values, 50),
+                    "p90": percentile(values, 90),
+                    "p99": percentile(values, 99),
+                    "max": values[-1],
+                }
+            return {
+                "wall_time": time.perf_counter() - self.start,
+                "stages": report_stages,
+                "entries": {name: dict(timings) for name, timings in self.entries.items()},
+            }
+
+    def save(self, path: str):
+        """Write the report to a json file."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self) -> str:
+        """Return the stages report as a table."""
+        report = self.report()
+        lines = [f"{'stage':>12} {'calls':>8} {'total':>10} {'mean':>10} {'p50':>10} {'p90':>10} {'p99':>10}"]
+        for stage, data in report["stages"].items():
+            lines.append(f"{stage:>12} {data['calls']:>8} {data['total']:>9.3f}s "
+                         + " ".join(f"{data[x] * 1000:>8.3f}ms" for x in ["mean", "p50", "p90", "p99"]))
+        lines.append(f"{'wall time':>12} {'':>8} {report['wall_time']:>9.3f}s")
+        return "\n".join(lines)
+
+
+class NullProfiler(Profiler):
+    """A profiler that records nothing, used when profiling is off."""
+
+    enabled = False
+
+    def record(self, stage: str, seconds: float, entry: str = None):
+        pass
+
+    def measure(self, stage: str, entry: str = None) -> ContextManager:
+        return nullcontext()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile of already sorted values, with the nearest-rank method."""
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
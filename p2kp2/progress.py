@@ -0,0 +1,120 @@
+import json
+import sys
+import threading
+import time
+from typing import TextIO, Dict, Tuple
+
+from p2kp2.reader import EntryReader
+from p2kp2.writer import EntryWriter
+
+max_events = 200  # progress events fired by the reader and the writer in a whole conversion, at most
+
+
+class ProgressReporter:
+    """Show the conversion progress: entries done, throughput, elapsed time and ETA of both the reading and the
+    writing stage.
+
+    Progress events only record the latest counts, while a background thread refreshes the output at a fixed
+    rate: printing costs the same however many entries there are. The reader and the writer are also told to
+    fire at most max_events events each. In 'text' mode a single line is rewritten in place, in 'json' mode a
+    json object is printed on its own line at every refresh, for logs and scripts.
+    """
+
+    def __init__(self, reader: EntryReader, writer: EntryWriter, mode: str = "text", interval: float = 0.5,
+                 stream: TextIO = None, total: int = None,
+                 labels: Tuple[str, str] = ("Reading password-store", "Writing keepass database")):
+        """Constructor for ProgressReporter
+
+        :param reader: the EntryReader whose entries are being read
+        :param writer: the P2KP2, or any other EntryWriter, the entries are being written to
+        :param mode: 'text' or 'json'
+        :param interval: the seconds between two refreshes
+        :param stream: where to print the progress. Default is stdout
+        :param total: the number of entries being converted. Default is the whole store
+        :param labels: the names of the reading and the writing stage, in the text output
+        """
+        if mode not in ("text", "json"):
+            raise ValueError("mode must be 'text' or 'json'")
+        self.total = total if total is not None else len(reader.index)
+        self.mode = mode
+        self.labels = labels
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stdout
+        self.counts = {"read": 0, "written": 0}
+        self.start = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = None
+        step = max(1, self.total // max_events)
+        reader.event_step = step
+        writer.event_step = step
+        reader.event_stream.subscribe(lambda count: self.counts.__setitem__("read", count))
+        writer.event_stream.subscribe(lambda count: self.counts.__setitem__("written", count))
+
+    def __enter__(self) -> "ProgressReporter":
+        self.start_reporting()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop_reporting()
+
+    def start_reporting(self):
+        """Start refreshing the output in a background thread."""
+        self.start = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="p2kp2-progress", daemon=True)
+        self._thread.start()
+
+    def stop_reporting(self):
+        """Stop the background thread, printing the progress one last time."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.refresh()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def status(self) -> Dict:
+        """Return the current progress of both stages."""
+        elapsed = time.perf_counter() - self.start
+        status = {"elapsed": round(elapsed, 3), "total": self.total}
+        for stage, count in list(self.counts.items()):
+            rate = count / elapsed if elapsed > 0 else 0.0
+            status[stage] = {
+                "count": count,
+                "rate": round(rate, 1),
+                "eta": round((self.total - count) / rate, 1) if rate > 0 else None,
+            }
+        return status
+
+    def refresh(self):
+        """Print the current progress, unless nothing changed since the last time."""
+        status = self.status()
+        counts = (status["read"]["count"], status["written"]["count"])
+        if counts == self._last:
+            return
+        self._last = counts
+        if self.mode == "json":
+            self.stream.write(json.dumps(status) + "\n")
+        else:
+            self.stream.write(f" > {self.labels[0]}... {format_stage(status['read'], self.total)}"
+                              f" | {self.labels[1]}... {format_stage(status['written'], self.total)}"
+                              f" | {format_seconds(status['elapsed'])}\r")
+        self.stream.flush()
+
+
+def format_stage(stage: Dict, total: int) -> str:
+    """Return the progress of a single stage as text."""
+    percent = 100 * stage["count"] // total if total > 0 else 100
+    eta = format_seconds(stage["eta"]) if stage["eta"] is not None else "--:--"
+    return f"{percent}% ({stage['rate']:.0f}/s, ETA {eta})"
+
+
+def format_seconds(seconds: float) -> str:
+    """Return a duration as [h:]mm:ss."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
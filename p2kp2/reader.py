@@ -1,72 +1,283 @@
 from __future__ import annotations
+import importlib.util
 import os
-from typing import List, Dict, Tuple, Callable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Tuple, Callable, Iterable, Iterator, Union, TYPE_CHECKING
 
-from passpy import Store
-from passpy.gpg import read_key
-from rx.subject import Subject
+from p2kp2.backends import DecryptionBackend, make_backend
+from p2kp2.buffers import wipe, looks_binary
+from p2kp2.index import StoreIndex
+from p2kp2.profiling import Profiler, NullProfiler
+from p2kp2.rules import FieldRules, default_rules, FIELD, CUSTOM, NOTES
 
+if TYPE_CHECKING:
+    from passpy import Store
 
-class PassReader:
-    """Read a pass db and construct an in-memory version of it."""
+
+class EntryReader:
+    """Base class for the sources pass entries are read from.
+
+    iter_entries lazily yields the entries, firing the number of entries read so far on event_stream every
+    event_step entries, and once more after the last one. parse_db collects them into entries: every EntryWriter
+    handed the reader itself writes those.
+    """
 
     entries: List[PassEntry]
+
+    def __init__(self):
+        """Constructor for EntryReader"""
+        # rx is only imported once a reader is needed, keeping the package quick to import
+        from rx.subject import Subject
+        self.entries = []
+        self.event_stream = Subject()
+        self.event_step = 1  # fire a progress event every event_step entries, and after the last one
+
+    def iter_entries(self) -> Iterator[PassEntry]:
+        """Lazily read all the entries."""
+        raise NotImplementedError()
+
+    def parse_db(self):
+        """Populate the entries list with all the entries."""
+        for entry in self.iter_entries():
+            self.entries.append(entry)
+
+
+class PassReader(EntryReader):
+    """Read a pass db and construct an in-memory version of it."""
+
     store: Store
 
-    def __init__(self, path: str = None, password: str = None, mapper: Callable = None):
+    def __init__(self, path: str = None, password: str = None, mapper: Callable = None, jobs: int = 1,
+                 backend: Union[str, DecryptionBackend] = "passpy", profiler: Profiler = None,
+                 rules: FieldRules = None, wipe_buffers: bool = False):
         """Constructor for PassReader
 
         :param path: optional password-store location.
             Default is '~/.password-store'.
+        :param password: optional password used to unlock the gpg key.
+        :param mapper: optional function applied to every parsed entry, or a BatchMapper applied to chunks of
+            entries.
+        :param jobs: number of entries decrypted concurrently. Default is 1.
+        :param backend: the DecryptionBackend used to decrypt the entries, or the name of one: 'passpy' starts a
+            gpg process for every entry, 'batch' streams all entries through long-lived gpg processes, 'openpgp'
+            decrypts them in-process. Default is 'passpy'.
+        :param profiler: optional Profiler recording how long scanning, decrypting, parsing and mapping take.
+        :param rules: optional FieldRules telling how entry fields are mapped while parsing. By default 'url',
+            'user', 'login' and 'notes' become the matching keepass fields, the others custom properties.
+        :param wipe_buffers: decrypt every entry into a bytearray, parse its fields straight from it and wipe it
+            right away, instead of decoding the whole entry into strings. Default is False.
         """
+        if jobs < 1:
+            raise ValueError("jobs must be a positive integer")
         if path is None:
             self.path = os.path.expanduser("~/.password-store")
         else:
             self.path = os.path.abspath(os.path.expanduser(path))
+        super().__init__()
+        # passpy is only imported once a reader is needed, keeping the package quick to import
+        from passpy import Store
         self.store = Store(store_dir=self.path)
-        self.entries = []
+        self._index = None
         self.password = password
-        self.event_stream = Subject()
         self.mapper = mapper
+        self.jobs = jobs
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        self.rules = rules if rules is not None else default_rules
+        self.wipe_buffers = wipe_buffers
+        if isinstance(backend, str):
+            self.backend = make_backend(backend, self.store, password=password, jobs=jobs)
+        else:
+            self.backend = backend
 
-    def get_pass_entries(self) -> List[str]:
-        """Returns all store entries."""
-        return self._get_entries_at_path()
+    def close(self):
+        """Release the resources held by the decryption backend."""
+        self.backend.close()
 
-    def _get_entries_at_path(self, path: str = "/") -> List[str]:
-        """Recursive scan of a store path.
+    @property
+    def index(self) -> StoreIndex:
+        """The store entries index. The store is scanned the first time it's needed, then the index is reused."""
+        if self._index is None:
+            with self.profiler.measure("scan"):
+                self._index = StoreIndex(self.path)
+        return self._index
 
-        :param path: the path to scan, default at root
-        :return: a list of entries name
-        """
-        folders, entries = self.store.list_dir(self.path + path)
-        if len(folders) > 0:
-            for folder in folders:
-                for entry in self._get_entries_at_path("/{}".format(folder)):
-                    entries.append(entry)
-        return entries
+    def refresh_index(self):
+        """Forget the store index: the store will be scanned again the next time the index is needed."""
+        self._index = None
+
+    def get_pass_entries(self) -> List[str]:
+        """Returns all store entries."""
+        return self.index.names()
 
     def parse_pass_entry(self, entry_name: str) -> PassEntry:
         """Return a parsed PassEntry."""
         entry = PassEntry(reader=self, entry=entry_name)
+        if isinstance(self.mapper, BatchMapper):
+            mapped = self.apply_batch_mapper([entry])
+            if len(mapped) != 1:
+                raise CustomMapperExecException(entry_name, "the batch mapper must return exactly one entry")
+            return mapped[0]
+        return self.apply_mapper(entry)
+
+    def apply_mapper(self, entry: PassEntry) -> PassEntry:
+        """Apply the custom mapper, if any, to an already parsed PassEntry."""
         if self.mapper is not None:
             try:
-                entry = self.mapper(entry)
-            except:
-                raise CustomMapperExecException()
+                with self.profiler.measure("map", entry.name if self.profiler.enabled else None):
+                    entry = self.mapper(entry)
+            except Exception as e:
+                raise CustomMapperExecException(entry.name) from e
         return entry
 
-    def parse_db(self):
-        """Populate the entries list with all the data from the pass db."""
+    def apply_batch_mapper(self, entries: List[PassEntry]) -> List[PassEntry]:
+        """Apply the custom batch mapper to a chunk of already parsed PassEntry.
+
+        When the mapper fails, the exception names the last entry it was looking at: the one it got while
+        iterating over, or indexing, the chunk.
+        """
+        chunk = _TrackedChunk(entries)
+        try:
+            with self.profiler.measure("map"):
+                mapped = self.mapper.function(chunk)
+        except Exception as e:
+            raise CustomMapperExecException(chunk.current.name if chunk.current is not None else None) from e
+        if not isinstance(mapped, list):
+            raise CustomMapperExecException(None, "the batch mapper must return a list of entries")
+        for entry in mapped:
+            if not isinstance(entry, PassEntry):
+                raise CustomMapperExecException(None, f"the batch mapper returned {entry!r} instead of an entry")
+        return mapped
+
+    def apply_process_mapper(self, entries: Iterable[PassEntry]) -> Iterator[PassEntry]:
+        """Lazily apply the custom mapper to already parsed entries in a pool of worker processes.
+
+        Entries are sent to the workers in chunks and come back in order. Only a bounded window of chunks is
+        in flight at any time, so decryption and mapping run side by side without piling up entries. The first
+        error stops the pool, and pending chunks are cancelled.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        mapper = self.mapper
+        entries = iter(entries)
+        # workers are spawned, not forked: forking while the decryption threads hold locks can deadlock them
+        with ProcessPoolExecutor(max_workers=mapper.processes, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_mapper_process,
+                                 initargs=(None if mapper.source else mapper.function, mapper.source)) as executor:
+            pending = deque()
+            try:
+                chunk = list(islice(entries, mapper.chunk_size))
+                while chunk:
+                    pending.append(executor.submit(_map_chunk, chunk))
+                    if len(pending) >= 2 * mapper.processes:
+                        with self.profiler.measure("map"):
+                            mapped = pending.popleft().result()
+                        yield from mapped
+                    chunk = list(islice(entries, mapper.chunk_size))
+                while pending:
+                    with self.profiler.measure("map"):
+                        mapped = pending.popleft().result()
+                    yield from mapped
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def map_entries(self, entries: Iterable[PassEntry]) -> Iterator[PassEntry]:
+        """Lazily apply the custom mapper, if any, to already parsed entries.
+
+        A BatchMapper gets the entries in chunks of its size, and may return more or fewer entries than it got. A
+        ProcessMapper maps them in its process pool.
+        """
+        if isinstance(self.mapper, ProcessMapper):
+            yield from self.apply_process_mapper(entries)
+            return
+        if not isinstance(self.mapper, BatchMapper):
+            for entry in entries:
+                yield self.apply_mapper(entry)
+            return
+        entries = iter(entries)
+        chunk = list(islice(entries, self.mapper.size))
+        while chunk:
+            yield from self.apply_batch_mapper(chunk)
+            chunk = list(islice(entries, self.mapper.size))
+
+    def read_entries(self, entries_name: Iterable[str]) -> Iterator[PassEntry]:
+        """Lazily decrypt and parse the given entries, preserving their order, without applying the mapper.
+
+        When jobs is greater than 1 entries are decrypted by a pool of worker threads. The first error stops
+        the pool: pending decryptions are cancelled and the running ones are waited for before the error is
+        raised.
+
+        :param entries_name: the names of the entries to parse
+        :return: an iterator over the parsed entries
+        """
+        if self.jobs == 1:
+            for entry_name in entries_name:
+                yield PassEntry(reader=self, entry=entry_name)
+            return
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            # keep a bounded window of submitted decryptions, so that results are consumed as they are produced
+            pending = deque()
+            try:
+                for entry_name in entries_name:
+                    pending.append(executor.submit(PassEntry, reader=self, entry=entry_name))
+                    if len(pending) >= 2 * self.jobs:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def parse_entries(self, entries_name: Iterable[str]) -> Iterator[PassEntry]:
+        """Lazily parse the given entries, preserving their order, and apply the custom mapper.
+
+        Entries are read as read_entries does, while the mapper is always applied here, in order, either one
+        entry at a time or in chunks for a BatchMapper.
+
+        :param entries_name: the names of the entries to parse
+        :return: an iterator over the parsed entries
+        """
+        entries = self.read_entries(entries_name)
+        try:
+            yield from self.map_entries(entries)
+        finally:
+            entries.close()
+
+    def iter_entries(self, entries_name: Iterable[str] = None) -> Iterator[PassEntry]:
+        """Lazily decrypt and parse all the pass db entries, firing a progress event every event_step entries
+        and after the last one.
+
+        Entries are not kept in memory: use parse_db to collect them.
+
+        :param entries_name: optional names of the entries to read, instead of the whole store
+        """
+        if entries_name is None:
+            entries_name = self.get_pass_entries()
         i = 0
-        for entry in self.get_pass_entries():
-            self.entries.append(self.parse_pass_entry(entry))
-            i = i + 1
-            self.event_stream.on_next(i)
+        try:
+            for entry in self.parse_entries(entries_name):
+                i = i + 1
+                if i % self.event_step == 0:
+                    self.event_stream.on_next(i)
+                yield entry
+            if i % self.event_step != 0:
+                self.event_stream.on_next(i)
+        finally:
+            self.close()
 
 
 class PassEntry:
-    """A simple pass entry in-memory representation"""
+    """A simple pass entry in-memory representation
+
+    Binary entries, like key files or certificates stored in pass, are not parsed: their decrypted content is
+    kept as it is in attachment, to become a keepass attachment named after the entry title, and every text
+    field is left empty. Text entries have no attachment.
+    """
+
+    # entries are many and all alike: slots keep them small, with no per-instance __dict__
+    __slots__ = ("groups", "title", "password", "url", "user", "notes", "custom_properties", "attachment")
 
     to_skip: List[str] = ["---", ""]  # these lines will be skipped when parsing
 
@@ -77,6 +288,7 @@ class PassEntry:
     user: str
     notes: str
     custom_properties: Dict[str, str]
+    attachment: Union[bytes, None]
 
     def __init__(self, reader: PassReader, entry: str):
         """Constructor for PassEntry.
@@ -84,14 +296,121 @@ class PassEntry:
         :param reader:  a PassReader instance, used to access the entry
         :param entry:  string representing the entry name
         """
+        if reader.wipe_buffers:
+            with reader.profiler.measure("decrypt", entry):
+                buffer = self.decrypt_entry_buffer(reader, entry)
+            try:
+                with reader.profiler.measure("parse", entry):
+                    self.load_buffer(entry, buffer, reader.rules)
+            finally:
+                wipe(buffer)
+            return
+        with reader.profiler.measure("decrypt", entry):
+            data = self.decrypt_entry_bytes(reader, entry)
+        with reader.profiler.measure("parse", entry):
+            self.load_bytes(entry, data, reader.rules)
+
+    @classmethod
+    def from_string(cls, entry: str, entry_string: str, rules: FieldRules = default_rules) -> PassEntry:
+        """Build a PassEntry from an already decrypted entry.
+
+        :param entry: string representing the entry name
+        :param entry_string: the decrypted entry content
+        :param rules: the FieldRules used to parse the fields
+        :return: the parsed PassEntry
+        """
+        pass_entry = cls.__new__(cls)
+        pass_entry.load(entry, entry_string, rules)
+        return pass_entry
+
+    @classmethod
+    def from_bytes(cls, entry: str, data: bytes, rules: FieldRules = default_rules) -> PassEntry:
+        """Build a PassEntry from an already decrypted entry, as the decryption backend returned it.
+
+        :param entry: string representing the entry name
+        :param data: the decrypted entry content, text or binary
+        :param rules: the FieldRules used to parse the fields of a text entry
+        :return: the parsed PassEntry
+        """
+        pass_entry = cls.__new__(cls)
+        pass_entry.load_bytes(entry, data, rules)
+        return pass_entry
+
+    @classmethod
+    def from_buffer(cls, entry: str, buffer: bytearray, rules: FieldRules = default_rules) -> PassEntry:
+        """Build a PassEntry from an already decrypted entry, held in a buffer. The buffer is not wiped: the
+        attachment of a binary entry is a copy of it.
+
+        :param entry: string representing the entry name
+        :param buffer: the decrypted entry content
+        :param rules: the FieldRules used to parse the fields
+        :return: the parsed PassEntry
+        """
+        pass_entry = cls.__new__(cls)
+        pass_entry.load_buffer(entry, buffer, rules)
+        return pass_entry
+
+    def load(self, entry: str, entry_string: str, rules: FieldRules = default_rules) -> None:
+        """Set every field from the entry name and its decrypted content."""
+        self.url = ""
+        self.user = ""
+        self.notes = ""
+        self.custom_properties = {}
+        self.attachment = None
+        self.groups = self.get_groups(entry)
+        self.title = self.get_title(entry)
+        self.parse_entry_string(entry_string, rules)
+
+    def load_bytes(self, entry: str, data: bytes, rules: FieldRules = default_rules) -> None:
+        """Set every field from the entry name and its decrypted content, text or binary.
+
+        Binary data is neither decoded nor split into lines: it becomes the attachment as it is, with no copy.
+        """
+        if not looks_binary(data):
+            try:
+                entry_string = str(data, "utf-8")
+            except UnicodeDecodeError:
+                # binary after all, past the start looks_binary checks
+                pass
+            else:
+                self.load(entry, entry_string, rules)
+                return
+        self.load_attachment(entry, data)
+
+    def load_buffer(self, entry: str, buffer: bytearray, rules: FieldRules = default_rules) -> None:
+        """Set every field from the entry name and its decrypted content, text or binary, held in a buffer."""
+        self.url = ""
+        self.user = ""
+        self.notes = ""
+        self.custom_properties = {}
+        self.attachment = None
+        self.groups = self.get_groups(entry)
+        self.title = self.get_title(entry)
+        if not looks_binary(buffer):
+            try:
+                self.parse_entry_buffer(buffer, rules)
+                return
+            except UnicodeDecodeError:
+                # binary after all, past the start looks_binary checks
+                pass
+        # the caller wipes the buffer: the attachment can't be a view of it
+        self.load_attachment(entry, bytes(buffer))
+
+    def load_attachment(self, entry: str, data: bytes) -> None:
+        """Set every field of a binary entry: its decrypted content is the attachment, every text field is empty."""
+        self.password = ""
         self.url = ""
         self.user = ""
         self.notes = ""
         self.custom_properties = {}
+        self.attachment = data
         self.groups = self.get_groups(entry)
         self.title = self.get_title(entry)
-        entry_string = self.decrypt_entry(reader, entry)
-        self.parse_entry_string(entry_string)
+
+    @property
+    def name(self) -> str:
+        """The entry name, as in the password-store: its groups and title joined by '/'."""
+        return "/".join(self.groups + [self.title])
 
     @staticmethod
     def get_title(entry: str) -> str:
@@ -107,17 +426,28 @@ class PassEntry:
 
     @staticmethod
     def decrypt_entry(reader: PassReader, entry: str) -> str:
-        """Decrypt the entry using pass and return it as a string."""
-        if reader.password is None or reader.password == "":
-            found_entry = reader.store.get_key(entry)
-            if found_entry is None:
-                raise EntryNotFoundException()
-        else:
-            # implement my own get_key and pass a custom gpg pass
-            gpg_opts = reader.store.gpg_opts + \
-                ["--pinentry-mode=loopback", f"--passphrase={reader.password}"]
-            found_entry = read_key(reader.path + f"/{entry}.gpg", reader.store.gpg_bin, gpg_opts)
-        return found_entry
+        """Decrypt the entry using the reader decryption backend and return it as a string."""
+        return PassEntry.decrypt_entry_bytes(reader, entry).decode("utf-8")
+
+    @staticmethod
+    def decrypt_entry_bytes(reader: PassReader, entry: str) -> bytes:
+        """Decrypt the entry using the reader decryption backend and return it as it is, text or binary."""
+        if entry is None or entry == "":
+            raise EntryNotFoundException()
+        entry_path = os.path.join(reader.path, os.path.normpath(entry) + ".gpg")
+        if not os.path.isfile(entry_path):
+            raise FileNotFoundError(f"{entry} is not in the password store.")
+        return reader.backend.decrypt(entry_path)
+
+    @staticmethod
+    def decrypt_entry_buffer(reader: PassReader, entry: str) -> bytearray:
+        """Decrypt the entry into a bytearray using the reader decryption backend."""
+        if entry is None or entry == "":
+            raise EntryNotFoundException()
+        entry_path = os.path.join(reader.path, os.path.normpath(entry) + ".gpg")
+        if not os.path.isfile(entry_path):
+            raise FileNotFoundError(f"{entry} is not in the password store.")
+        return reader.backend.decrypt_buffer(entry_path)
 
     @staticmethod
     def is_valid_line(entry_line: str) -> bool:
@@ -130,27 +460,233 @@ class PassEntry:
         data = entry_line.split(":", 1)
         return data[0].strip(), data[1].strip()
 
-    def parse_entry_string(self, entry_string: str) -> None:
-        """Parse a entry and extract all useful data."""
-        lines = entry_string.split("\n")
-        self.password = lines.pop(0)
-
-        lines = list(filter(lambda x: x not in self.to_skip and self.is_valid_line(x), lines))
-        data = list(map(lambda x: self.parse_entry_line(x), lines))
-        for key, value in data:
-            if key == "url":
-                self.url = value
-            elif key == "user" or key == "login":
-                self.user = value
-            elif key == "notes":
-                self.notes = value
-            else:
-                self.custom_properties.update({key: value})
+    def parse_entry_string(self, entry_string: str, rules: FieldRules = default_rules) -> None:
+        """Parse a entry and extract all useful data.
+
+        Lines are parsed in a single pass, with the same rules of is_valid_line and parse_entry_line. Every
+        field is then handled as the rules lookup table says.
+        """
+        self.password, _, rest = entry_string.partition("\n")
+        table = rules.table
+        custom_properties = self.custom_properties
+        to_skip = self.to_skip
+        notes = None
+        for line in rest.split("\n"):
+            key, separator, value = line.partition(":")
+            # like is_valid_line: there must be a ':', and not as the first character
+            if not separator or not key or line in to_skip:
+                continue
+            key = key.strip()
+            action = table.get(key)
+            if action is None:
+                custom_properties[key] = value.strip()
+                continue
+            value = value.strip()
+            if action.transform is not None:
+                value = action.transform(value)
+            if action.destination == FIELD:
+                setattr(self, action.name, value)
+            elif action.destination == CUSTOM:
+                custom_properties[action.name] = value
+            elif action.destination == NOTES:
+                if notes is None:
+                    notes = []
+                notes.append(f"{action.name}: {value}")
+        if notes is not None:
+            self.notes = "\n".join(([self.notes] if self.notes != "" else []) + notes)
+
+    def parse_entry_buffer(self, buffer: bytearray, rules: FieldRules = default_rules) -> None:
+        """Parse an entry straight from its decrypted buffer, with the same results as parse_entry_string.
+
+        Lines are found in place: only the keys and the values of the fields are decoded, with their
+        surrounding whitespace already left out, so there's no copy of the whole entry nor of its lines.
+        """
+        table = rules.table
+        custom_properties = self.custom_properties
+        notes = None
+        length = len(buffer)
+        with memoryview(buffer) as view:
+            end = buffer.find(b"\n")
+            end = length if end == -1 else end
+            self.password = str(view[:end], "utf-8")
+            start = end + 1
+            while start < length:
+                end = buffer.find(b"\n", start)
+                end = length if end == -1 else end
+                colon = buffer.find(b":", start, end)
+                # like is_valid_line: there must be a ':', and not as the first character
+                if colon > start:
+                    key = str(view[start:colon], "utf-8").strip()
+                    value = self._decode_field(buffer, view, colon + 1, end)
+                    action = table.get(key)
+                    if action is None:
+                        custom_properties[key] = value
+                    else:
+                        if action.transform is not None:
+                            value = action.transform(value)
+                        if action.destination == FIELD:
+                            setattr(self, action.name, value)
+                        elif action.destination == CUSTOM:
+                            custom_properties[action.name] = value
+                        elif action.destination == NOTES:
+                            if notes is None:
+                                notes = []
+                            notes.append(f"{action.name}: {value}")
+                start = end + 1
+        if notes is not None:
+            self.notes = "\n".join(([self.notes] if self.notes != "" else []) + notes)
+
+    @staticmethod
+    def _decode_field(buffer: bytearray, view: memoryview, start: int, end: int) -> str:
+        """Decode a field value, skipping the ascii whitespace around it before decoding."""
+        while start < end and buffer[start] in b" \t\r\x0b\x0c":
+            start += 1
+        while end > start and buffer[end - 1] in b" \t\r\x0b\x0c":
+            end -= 1
+        # any other unicode whitespace, which is rare, is stripped like parse_entry_string does
+        return str(view[start:end], "utf-8").strip()
+
+    def to_entry_string(self) -> str:
+        """Return the entry content as pass stores it: the inverse of parse_entry_string with the default rules.
+
+        The password is the first line. Then come 'url', 'user' and the custom properties as 'key: value' lines,
+        and finally the notes: their first line as 'notes: value', the others as they are. Empty url, user and
+        notes are left out. Line breaks in url, user and custom properties become spaces, since every pass field
+        is a single line. Binary entries have no entry string: their content is the attachment.
+        """
+        if self.attachment is not None:
+            raise ValueError(f"{self.name} is a binary entry: its content is the attachment.")
+        lines = [self.password]
+        for key, value in [("url", self.url), ("user", self.user)]:
+            if value != "":
+                lines.append(f"{key}: {' '.join(value.splitlines())}")
+        for key, value in self.custom_properties.items():
+            lines.append(f"{key}: {' '.join(value.splitlines())}")
+        if self.notes != "":
+            first, *rest = self.notes.split("\n")
+            lines.append(f"notes: {first}")
+            lines.extend(rest)
+        # pass always ends its files with a line break
+        return "\n".join(lines) + "\n"
+
+
+class BatchMapper:
+    """A user provided mapper function that receives the entries in chunks instead of one at a time.
+
+    The function gets a list of PassEntry and must return a list of PassEntry, not necessarily of the same
+    length: this allows mappers needing to look at many entries at once, or with an expensive setup.
+    """
+
+    def __init__(self, function: Callable[[List[PassEntry]], List[PassEntry]], size: int = 100):
+        """Constructor for BatchMapper
+
+        :param function: the mapper function
+        :param size: the number of entries in every chunk
+        """
+        if size < 1:
+            raise ValueError("size must be a positive integer")
+        self.function = function
+        self.size = size
+
+
+class ProcessMapper:
+    """A user provided mapper function run in a pool of worker processes, for mappers doing real work.
+
+    Entries are pickled to and from the workers, so the function must be picklable too: a module level function
+    is. A function loaded from a file, like the command line custom mapper, can't be imported by name in the
+    workers: give the file as source and the workers will load its custom_mapper themselves.
+    """
+
+    def __init__(self, function: Callable[[PassEntry], PassEntry], processes: int = None, chunk_size: int = 32,
+                 source: str = None):
+        """Constructor for ProcessMapper
+
+        :param function: the mapper function
+        :param processes: the number of worker processes. Default is the number of CPUs
+        :param chunk_size: the number of entries sent to a worker at once
+        :param source: optional path of the file defining the mapper as custom_mapper, loaded by the workers
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1 or chunk_size < 1:
+            raise ValueError("processes and chunk_size must be positive integers")
+        self.function = function
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.source = source
+
+    def __call__(self, entry: PassEntry) -> PassEntry:
+        """Map a single entry in the current process."""
+        return self.function(entry)
+
+
+def load_custom_mapper(path: str, name: str = "custom_mapper") -> Callable:
+    """Import a function from a python file."""
+    spec = importlib.util.spec_from_file_location("p2kp2.custom", path)
+    custom = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(custom)
+    return getattr(custom, name)
+
+
+_process_mapper: Callable[[PassEntry], PassEntry] = None  # the mapper of a ProcessMapper worker process
+
+
+def _init_mapper_process(function: Callable, source: str):
+    """Set up a ProcessMapper worker."""
+    global _process_mapper
+    _process_mapper = load_custom_mapper(source) if source is not None else function
+
+
+def _map_chunk(entries: List[PassEntry]) -> List[PassEntry]:
+    """Map a chunk of entries in a ProcessMapper worker."""
+    mapped = []
+    for entry in entries:
+        try:
+            mapped.append(_process_mapper(entry))
+        except Exception as e:
+            # the original exception may not survive pickling, its description does
+            raise CustomMapperExecException(entry.name, f"{type(e).__name__}: {e}") from None
+    return mapped
+
+
+class _TrackedChunk(list):
+    """A list of entries remembering the last one a batch mapper looked at."""
+
+    current: PassEntry = None
+
+    def __iter__(self) -> Iterator[PassEntry]:
+        for entry in super().__iter__():
+            self.current = entry
+            yield entry
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        if isinstance(item, PassEntry):
+            self.current = item
+        return item
 
 
 class CustomMapperExecException(Exception):
     """Exception raised when encountering an error when executing an user provided mapper function."""
 
+    def __init__(self, entry: str = None, reason: str = None):
+        """Constructor for CustomMapperExecException
+
+        :param entry: the name of the entry the mapper failed on, if known
+        :param reason: what went wrong, when it's not the mapper raising an exception
+        """
+        message = "The custom mapper failed"
+        if entry is not None:
+            message += f" on {entry}"
+        if reason is not None:
+            message += f": {reason}"
+        super().__init__(message)
+        self.entry = entry
+        self.reason = reason
+
+    def __reduce__(self):
+        return self.__class__, (self.entry, self.reason)
+
 
 class EntryNotFoundException(Exception):
     """Exception raised when trying to access an entry that is not present in the chosen PassReader."""
@@ -0,0 +1,276 @@
+from __future__ import annotations
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Iterator, Iterable, Union, Dict, TYPE_CHECKING
+
+from p2kp2.gpg import encrypt
+from p2kp2.profiling import Profiler, NullProfiler
+from p2kp2.reader import EntryReader, PassEntry
+from p2kp2.sync import fingerprint_key
+from p2kp2.writer import EntryWriter
+
+if TYPE_CHECKING:
+    from pykeepass import PyKeePass
+    from pykeepass.entry import Entry
+    from pykeepass.group import Group
+
+gpg_id_file = ".gpg-id"
+
+
+def pass_name(name: str) -> str:
+    """Turn a keepass group or entry name into a valid pass file or folder name.
+
+    Slashes become dashes, and leading dots underscores: '.' and '..' can't walk out of the store, and pass
+    would hide any other name starting with a dot.
+    """
+    name = name.replace("/", "-").replace("\0", "").strip() if name is not None else ""
+    stripped = name.lstrip(".")
+    name = "_" * (len(name) - len(stripped)) + stripped
+    return name if name != "" else "untitled"
+
+
+class KeePassReader(EntryReader):
+    """Read a keepass db back into PassEntry objects, the way P2KP2 would have written them.
+
+    Every group becomes a folder and every entry a pass entry. The recycle bin is skipped, and so is the custom
+    property left by a sync. An entry shaped like the ones P2KP2 writes for binary pass entries, with no text
+    field, no custom property and a single attachment named after it, becomes a binary entry again. Other
+    attachments are left out, and the names of their entries listed in skipped.
+    """
+
+    db: PyKeePass
+
+    def __init__(self, path: str, password: str = None, keyfile: str = None, profiler: Profiler = None):
+        """Constructor for KeePassReader
+
+        :param path: the keepass db path
+        :param password: the keepass db password
+        :param keyfile: optional keepass db key file
+        :param profiler: optional Profiler recording how long opening the db and reading every entry take
+        """
+        super().__init__()
+        # pykeepass is only imported once a reader is needed, keeping the package quick to import
+        from pykeepass import PyKeePass
+        self.profiler = profiler if profiler is not None else NullProfiler()
+        with self.profiler.measure("open"):
+            self.db = PyKeePass(path, password=password, keyfile=keyfile)
+        self.skipped: List[str] = []  # the pass names of the entries whose attachments were left out
+        self._binaries = None  # pykeepass builds the list of all the db binaries on every access
+
+    def get_keepass_entries(self) -> List[Tuple[Tuple[str, ...], Entry]]:
+        """Return all the db entries, but the ones in the recycle bin, with the path of their pass folder.
+
+        Entries are listed like pass does: a group entries come before its subgroups ones.
+        """
+        recycle_bin = getattr(self.db, "recyclebin_group", None)
+        entries = []
+
+        def walk(group: Group, path: Tuple[str, ...]):
+            if recycle_bin is not None and group.uuid == recycle_bin.uuid:
+                return
+            entries.extend((path, entry) for entry in group.entries)
+            for subgroup in group.subgroups:
+                walk(subgroup, path + (pass_name(subgroup.name),))
+        walk(self.db.root_group, ())
+        return entries
+
+    def to_pass_entry(self, path: Tuple[str, ...], entry: Entry) -> PassEntry:
+        """Build the PassEntry of a keepass entry.
+
+        :param path: the pass folder of the entry
+        :param entry: the keepass entry
+        """
+        pass_entry = PassEntry.__new__(PassEntry)
+        pass_entry.groups = list(path)
+        pass_entry.title = pass_name(entry.title)
+        pass_entry.password = entry.password or ""
+        pass_entry.user = entry.username or ""
+        pass_entry.url = entry.url or ""
+        pass_entry.notes = entry.notes or ""
+        pass_entry.custom_properties = {key: value or "" for key, value in entry.custom_properties.items()
+                                        if key != fingerprint_key}
+        pass_entry.attachment = None
+        attachments = entry.attachments
+        if len(attachments) == 0:
+            return pass_entry
+        if self.is_binary_entry(pass_entry, attachments, entry.title):
+            if self._binaries is None:
+                self._binaries = self.db.binaries
+            pass_entry.attachment = self._binaries[attachments[0].id]
+        else:
+            self.skipped.append(pass_entry.name)
+        return pass_entry
+
+    @staticmethod
+    def is_binary_entry(pass_entry: PassEntry, attachments: List, title: str) -> bool:
+        """Tell whether a keepass entry has exactly the shape P2KP2 gives to binary pass entries: a single
+        attachment named after the entry, and nothing else."""
+        return (len(attachments) == 1 and attachments[0].filename == title and not pass_entry.custom_properties
+                and pass_entry.password == pass_entry.user == pass_entry.url == pass_entry.notes == "")
+
+    def iter_entries(self) -> Iterator[PassEntry]:
+        """Lazily convert all the db entries, firing a progress event every event_step entries and after the last
+        one."""
+        i = 0
+        for path, entry in self.get_keepass_entries():
+            with self.profiler.measure("parse"):
+                pass_entry = self.to_pass_entry(path, entry)
+            i = i + 1
+            if i % self.event_step == 0:
+                self.event_stream.on_next(i)
+            yield pass_entry
+        if i % self.event_step != 0:
+            self.event_stream.on_next(i)
+
+
+class PassWriter(EntryWriter):
+    """Write entries as a pass password-store, encrypting every one of them to the store recipients.
+
+    Recipients are looked up like pass does, in the nearest '.gpg-id' file up the folder of every entry. Every
+    entry is encrypted by its own gpg process: with jobs greater than 1 a pool of worker threads runs them
+    concurrently, while a bounded window of 2 * jobs entries keeps the memory used constant. Every file is
+    written to a temporary file first, and then moved in place. Binary entries are encrypted as they are.
+    """
+
+    def __init__(self, path: str, recipients: List[str] = None, jobs: int = 1, overwrite: bool = False,
+                 gpg_bin: str = "gpg2", profiler: Profiler = None):
+        """Constructor for PassWriter
+
+        :param path: the password-store location
+        :param recipients: optional gpg recipients of a new store, written to its '.gpg-id' file. The '.gpg-id'
+            file of an existing store is only replaced when overwriting. Default is the '.gpg-id' file already in
+            the store
+        :param jobs: number of entries encrypted concurrently. Default is 1
+        :param overwrite: force writing over existing entries, and the existing '.gpg-id' file
+        :param gpg_bin: the gpg binary
+        :param profiler: optional Profiler recording how long encrypting and writing every entry take
+        """
+        if jobs < 1:
+            raise ValueError("jobs must be a positive integer")
+        super().__init__(profiler)
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._recipients: Dict[str, List[str]] = {}
+        if recipients is not None:
+            if len(recipients) == 0:
+                raise ValueError("at least a recipient is needed")
+            gpg_id = os.path.join(self.path, gpg_id_file)
+            if os.path.isfile(gpg_id) and not overwrite:
+                # the existing entries are encrypted to the store recipients: don't change them behind their back
+                if self.get_recipients(self.path) != list(recipients):
+                    raise ValueError(f"{self.path} already has a {gpg_id_file} file, for other recipients: it is "
+                                     f"only replaced when overwriting")
+            else:
+                os.makedirs(self.path, mode=0o700, exist_ok=True)
+                with open(gpg_id, "w") as f:
+                    f.write("".join(f"{x}\n" for x in recipients))
+        elif not os.path.isfile(os.path.join(self.path, gpg_id_file)):
+            raise ValueError(f"{self.path} has no {gpg_id_file} file: the store recipients are needed")
+        self.jobs = jobs
+        self.overwrite = overwrite
+        self.gpg_bin = gpg_bin
+        # the same options pass, and passpy, use
+        self.gpg_opts = ["--quiet", "--yes", "--compress-algo=none", "--no-encrypt-to", "--batch", "--use-agent"]
+
+    def get_recipients(self, folder: str) -> List[str]:
+        """Return the recipients of a store folder, from the nearest '.gpg-id' file."""
+        recipients = self._recipients.get(folder)
+        if recipients is None:
+            gpg_id = os.path.join(folder, gpg_id_file)
+            if os.path.isfile(gpg_id):
+                with open(gpg_id) as f:
+                    recipients = [x.strip() for x in f if x.strip() != ""]
+            else:
+                recipients = self.get_recipients(os.path.dirname(folder))
+            self._recipients[folder] = recipients
+        return recipients
+
+    def write_entry(self, pass_entry: PassEntry) -> str:
+        """Encrypt a single entry and write it to the store.
+
+        :param pass_entry: the entry to write
+        :return: the path of the new encrypted file
+        """
+        name = pass_entry.name if self.profiler.enabled else None
+        folder = os.path.join(self.path, *pass_entry.groups)
+        path = os.path.join(folder, pass_entry.title + ".gpg")
+        # whatever the entry names, nothing is ever written out of the store
+        if os.path.commonpath([os.path.realpath(self.path), os.path.realpath(path)]) != os.path.realpath(self.path):
+            raise UnsafePassEntryException(pass_entry.name)
+        if os.path.exists(path) and not self.overwrite:
+            raise PassEntryExistsException(pass_entry.name)
+        with self.profiler.measure("encrypt", name):
+            plaintext = pass_entry.attachment
+            if plaintext is None:
+                plaintext = pass_entry.to_entry_string().encode("utf-8")
+            data = encrypt(plaintext, self.get_recipients(folder),
+                           gpg_bin=self.gpg_bin, gpg_opts=self.gpg_opts)
+        with self.profiler.measure("save", name):
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+            tmp = path + ".tmp"
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return path
+
+    def populate_db(self, entries: Union[EntryReader, Iterable[PassEntry]]):
+        """Write the entries of a reader, or of any iterable of PassEntry, to the store.
+
+        The first error stops the pool: pending entries are cancelled and the running ones are waited for before
+        the error is raised.
+
+        :param entries: an EntryReader, like a PassReader or a KeePassReader, whose already parsed entries will be
+            written, or an iterable of PassEntry, which will be consumed as entries are written
+        """
+        if isinstance(entries, EntryReader):
+            entries = entries.entries
+        names = set()
+        i = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            pending = deque()
+            try:
+                for pass_entry in entries:
+                    # two keepass entries with the same title in the same group would end up in the same file
+                    if pass_entry.name in names:
+                        raise PassEntryExistsException(pass_entry.name)
+                    names.add(pass_entry.name)
+                    pending.append(executor.submit(self.write_entry, pass_entry))
+                    if len(pending) >= 2 * self.jobs:
+                        pending.popleft().result()
+                        i = i + 1
+                        if i % self.event_step == 0:
+                            self.event_stream.on_next(i)
+                while pending:
+                    pending.popleft().result()
+                    i = i + 1
+                    if i % self.event_step == 0:
+                        self.event_stream.on_next(i)
+            finally:
+                for future in pending:
+                    future.cancel()
+        if i % self.event_step != 0:
+            self.event_stream.on_next(i)
+
+
+class PassEntryExistsException(Exception):
+    """Exception raised when trying to write a pass entry that is already in the store."""
+
+    def __init__(self, entry: str):
+        """Constructor for PassEntryExistsException
+
+        :param entry: the name of the entry
+        """
+        super().__init__(f"{entry} is already in the password store.")
+        self.entry = entry
+
+
+class UnsafePassEntryException(Exception):
+    """Exception raised when a pass entry would be written out of the store."""
+
+    def __init__(self, entry: str):
+        """Constructor for UnsafePassEntryException
+
+        :param entry: the name of the entry
+        """
+        super().__init__(f"{entry} would be written out of the password store.")
+        self.entry = entry
@@ -0,0 +1,129 @@
+import json
+import re
+from typing import Callable, Dict, List, NamedTuple
+
+# where a field ends up
+FIELD = "field"  # one of the keepass standard fields: url, user or notes
+CUSTOM = "custom"  # a custom property
+NOTES = "notes"  # a 'key: value' line appended to the notes
+DROP = "drop"  # nowhere
+
+standard_fields = {"url": "url", "user": "user", "login": "user", "notes": "notes"}  # pass key -> PassEntry field
+rule_keys = {"key", "rename", "to_notes", "prefix", "drop", "regex"}
+
+
+class Action(NamedTuple):
+    """What to do with the value of a pass entry field."""
+
+    destination: str
+    name: str
+    transform: Callable[[str], str] = None
+
+
+class FieldRules:
+    """A set of declarative rules telling how pass entry fields become keepass fields.
+
+    Every rule targets a single field key and can rewrite its value with regular expressions, add a prefix to
+    it, and then rename the field, append it to the notes or drop it. Rules are compiled once into a lookup
+    table by key: fields without a rule become custom properties, while 'url', 'user', 'login' and 'notes'
+    have a default rule moving them to the matching keepass field, which can be overridden.
+
+    A rules file is a json object with a 'rules' list, for example:
+
+        {"rules": [
+            {"key": "otpauth", "rename": "otp", "prefix": "otpauth:"},
+            {"key": "pin", "drop": true},
+            {"key": "comment", "to_notes": true},
+            {"key": "url", "regex": ["^http://", "https://"]}
+        ]}
+    """
+
+    table: Dict[str, Action]
+
+    def __init__(self, rules: List[Dict] = None):
+        """Constructor for FieldRules
+
+        :param rules: the rules, as they appear in a rules file
+        """
+        self.table = {key: Action(FIELD, field) for key, field in standard_fields.items()}
+        if rules is None:
+            rules = []
+        if not isinstance(rules, list):
+            raise RulesException("rules must be a list")
+        for rule in rules:
+            self.table[get_rule_key(rule)] = compile_rule(rule)
+
+    @classmethod
+    def from_file(cls, path: str) -> "FieldRules":
+        """Load the rules from a json file."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RulesException(f"could not read {path}: {e}")
+        if not isinstance(data, dict) or "rules" not in data:
+            raise RulesException("a rules file must be a json object with a 'rules' list")
+        return cls(data["rules"])
+
+
+def get_rule_key(rule: Dict) -> str:
+    """Return the key a rule targets, checking that the rule is well formed."""
+    if not isinstance(rule, dict) or not isinstance(rule.get("key"), str) or rule["key"].strip() == "":
+        raise RulesException(f"every rule needs a 'key': {rule!r}")
+    unknown = set(rule) - rule_keys
+    if unknown:
+        raise RulesException(f"unknown rule options for {rule['key']}: {', '.join(sorted(unknown))}")
+    return rule["key"].strip()
+
+
+def compile_rule(rule: Dict) -> Action:
+    """Turn a single rule into the Action applied to its field."""
+    key = get_rule_key(rule)
+    if rule.get("drop", False):
+        if len(rule) > 2:
+            raise RulesException(f"a dropped field can't have other options: {key}")
+        return Action(DROP, key)
+    name = rule.get("rename", key)
+    if not isinstance(name, str) or name.strip() == "":
+        raise RulesException(f"invalid new name for {key}: {name!r}")
+    name = name.strip()
+    transform = compile_transform(key, rule.get("regex"), rule.get("prefix"))
+    if rule.get("to_notes", False):
+        return Action(NOTES, name, transform)
+    if name in standard_fields:
+        return Action(FIELD, standard_fields[name], transform)
+    return Action(CUSTOM, name, transform)
+
+
+def compile_transform(key: str, regex, prefix) -> Callable[[str], str]:
+    """Build the function rewriting a field value: regular expressions first, then the prefix."""
+    if regex is None and prefix is None:
+        return None
+    substitutions = []
+    if regex is not None:
+        # a single [pattern, replacement] pair, or a list of them
+        if not isinstance(regex, list) or len(regex) == 0:
+            raise RulesException(f"regex must be a [pattern, replacement] pair, or a list of them: {key}")
+        pairs = [regex] if isinstance(regex[0], str) else regex
+        for pair in pairs:
+            if not isinstance(pair, list) or len(pair) != 2 or not all(isinstance(x, str) for x in pair):
+                raise RulesException(f"regex must be a [pattern, replacement] pair, or a list of them: {key}")
+            try:
+                substitutions.append((re.compile(pair[0]), pair[1]))
+            except re.error as e:
+                raise RulesException(f"invalid regex for {key}: {e}")
+    if prefix is not None and not isinstance(prefix, str):
+        raise RulesException(f"prefix must be a string: {key}")
+
+    def transform(value: str) -> str:
+        for pattern, replacement in substitutions:
+            value = pattern.sub(replacement, value)
+        return value if prefix is None else prefix + value
+    return transform
+
+
+default_rules = FieldRules()
+
+
+class RulesException(Exception):
+    """Exception raised when a field rules file is not valid."""
@@ -0,0 +1,209 @@
+import os
+from queue import Empty, Full
+from typing import Iterable, Union, Dict, List, Tuple, Sequence
+
+from p2kp2.kdf import Kdf
+from p2kp2.reader import EntryReader, PassEntry
+from p2kp2.writer import EntryWriter, P2KP2, DbAlreadyExistsException
+
+
+tmp_suffix = ".tmp"  # shards are saved next to their destination with this suffix, then moved in place
+
+
+def shard_destination(destination: str, shard: str = None) -> str:
+    """Return the path of a shard db: the destination itself for the store root entries, the destination with
+    the top-level folder name appended for the others."""
+    if shard is None:
+        return destination
+    base, extension = os.path.splitext(destination)
+    return f"{base}-{shard}{extension}"
+
+
+class ShardedWriter(EntryWriter):
+    """Write the entries into a separate keepass db for every top-level pass folder, in parallel processes.
+
+    Every entry goes to the shard of its first group, after the mapper, and entries at the root of the store go
+    to the destination itself. Shards are spread over a pool of worker processes, each of them with its own
+    P2KP2 for every shard it was given: entries are sent to them in chunks, through bounded queues, while the
+    store is still being read, and every worker saves its shards once all entries are in. So the key derivation
+    and the encryption of all shards run side by side too.
+
+    Shards are saved next to their destination first, and only moved in place once all of them are saved: should
+    the conversion, or the saving of any shard, fail, the saved ones are removed and no destination is touched.
+    Progress events count the entries handed over to the workers.
+    """
+
+    def __init__(self, password: str, destination: str = None, overwrite: bool = False, bulk: bool = False,
+                 kdf: Kdf = None, processes: int = None, chunk_size: int = 32):
+        """Constructor for ShardedWriter
+
+        :param password: the password of every shard db
+        :param destination: the db path of the store root entries. The other shards are named after it: the
+            'web' folder of 'pass.kdbx' goes to 'pass-web.kdbx'
+        :param overwrite: force writing over existing databases
+        :param bulk: let the shards add entries in batches, like P2KP2 does
+        :param kdf: the key derivation settings of every shard, AesKdf() by default
+        :param processes: the number of worker processes. Default is the number of CPUs
+        :param chunk_size: the number of entries sent to a worker at once
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1 or chunk_size < 1:
+            raise ValueError("processes and chunk_size must be positive integers")
+        super().__init__()
+        self.destination = destination if destination is not None else "pass.kdbx"
+        self.settings = {"password": password, "overwrite": overwrite, "bulk": bulk, "kdf": kdf}
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.shards: Dict[str, int] = {}  # the entries written to every shard db, by path
+
+    def check_destination(self, shard: str = None) -> str:
+        """Return the path of a shard db, making sure it can be written."""
+        path = shard_destination(self.destination, shard)
+        if os.path.exists(path) and not self.settings["overwrite"]:
+            raise DbAlreadyExistsException(path)
+        return path
+
+    def build_group_tree(self, paths: Iterable[Sequence[str]]):
+        """Check all the shards of the given groups before adding any entry, so that an existing db stops the
+        conversion before it starts."""
+        for shard in set(path[0] if path else None for path in paths):
+            self.check_destination(shard)
+
+    def populate_db(self, entries: Union[EntryReader, Iterable[PassEntry]]):
+        import multiprocessing
+        if isinstance(entries, EntryReader):
+            entries = entries.entries
+        # workers are spawned, not forked, like ProcessMapper ones: the reader threads may be holding locks
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers: List[Tuple[multiprocessing.Process, multiprocessing.Queue]] = []
+        assigned: Dict[str, int] = {}  # the worker of every shard db
+        chunks: List[List[Tuple[str, PassEntry]]] = []
+        i = 0
+        try:
+            for pass_entry in entries:
+                path = shard_destination(self.destination, pass_entry.groups[0] if pass_entry.groups else None)
+                worker = assigned.get(path)
+                if worker is None:
+                    self.check_destination(pass_entry.groups[0] if pass_entry.groups else None)
+                    worker = assigned[path] = len(assigned) % self.processes
+                    if worker == len(workers):
+                        queue = context.Queue(maxsize=4)
+                        process = context.Process(target=_write_shards, args=(queue, results, self.settings),
+                                                  name=f"p2kp2-shard-{worker}", daemon=True)
+                        process.start()
+                        workers.append((process, queue))
+                        chunks.append([])
+                chunks[worker].append((path, pass_entry))
+                if len(chunks[worker]) >= self.chunk_size:
+                    self._send(workers[worker], chunks[worker], results)
+                    chunks[worker] = []
+                i = i + 1
+                if i % self.event_step == 0:
+                    self.event_stream.on_next(i)
+            for worker, chunk in zip(workers, chunks):
+                if chunk:
+                    self._send(worker, chunk, results)
+                # no more entries: the worker reports once its shards are ready to be saved
+                self._send(worker, None, results)
+            # shards are only saved once all of them are populated, so that a failure leaves nothing behind
+            self._collect(workers, results)
+            for worker in workers:
+                self._send(worker, True, results)
+            shards = {}
+            for counts in self._collect(workers, results):
+                shards.update(counts)
+            for path in shards:
+                os.replace(path + tmp_suffix, path)
+            self.shards = shards
+        finally:
+            for process, queue in workers:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+                queue.close()
+            results.close()
+            for path in assigned:
+                # the shards saved before a failure, if any
+                if os.path.isfile(path + tmp_suffix):
+                    os.remove(path + tmp_suffix)
+        if i % self.event_step != 0:
+            self.event_stream.on_next(i)
+
+    @staticmethod
+    def _collect(workers: List[Tuple], results) -> List:
+        """Wait for an outcome from every worker, raising the first error."""
+        values = []
+        while len(values) < len(workers):
+            try:
+                outcome, value = results.get(timeout=0.1)
+            except Empty:
+                # workers only exit cleanly after putting their outcome: anything else is a crash
+                if any(process.exitcode not in (None, 0) for process, _ in workers):
+                    raise ShardException("a shard worker died unexpectedly")
+                continue
+            if outcome == "error":
+                raise ShardException(value)
+            values.append(value)
+        return values
+
+    @staticmethod
+    def _send(worker: Tuple, item, results):
+        """Wait for room in the worker queue, giving up if any worker failed."""
+        process, queue = worker
+        while True:
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+            try:
+                outcome, value = results.get_nowait()
+            except Empty:
+                if process.exitcode not in (None, 0):
+                    raise ShardException("a shard worker died unexpectedly")
+                continue
+            raise ShardException(value if outcome == "error" else "a shard worker stopped too early")
+
+
+def _write_shards(queue, results, settings: Dict):
+    """Add the entries a ShardedWriter worker gets to their shard db, then save all of them next to their
+    destination when told to."""
+    writers: Dict[str, P2KP2] = {}
+    counts: Dict[str, int] = {}
+    path = None
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is None:
+                break
+            batches: Dict[str, List[PassEntry]] = {}
+            for path, pass_entry in chunk:
+                batches.setdefault(path, []).append(pass_entry)
+            for path, batch in batches.items():
+                writer = writers.get(path)
+                if writer is None:
+                    writer = writers[path] = P2KP2(destination=path, **settings)
+                    counts[path] = 0
+                if writer.bulk:
+                    writer.add_entries(batch)
+                else:
+                    for pass_entry in batch:
+                        writer.add_entry(pass_entry)
+                counts[path] += len(batch)
+        results.put(("ready", None))
+        if not queue.get():
+            return
+        for path, writer in writers.items():
+            writer.db.filename = path + tmp_suffix
+            writer.save()
+    except Exception as e:
+        # the original exception may not survive pickling, its description does
+        results.put(("error", f"{os.path.basename(path) if path else 'a shard'}: {type(e).__name__}: {e}"))
+        return
+    results.put(("done", counts))
+
+
+class ShardException(Exception):
+    """Exception raised when a shard worker fails."""
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import hashlib
+import json
+from typing import Dict, Iterator, NamedTuple, Tuple, TYPE_CHECKING
+
+from p2kp2.index import IndexEntry
+from p2kp2.reader import PassReader, PassEntry
+from p2kp2.writer import P2KP2
+
+if TYPE_CHECKING:
+    from pykeepass.entry import Entry
+
+
+fingerprint_key = "p2kp2-source"  # the keepass custom property holding the pass entry fingerprint
+
+
+class SyncResult(NamedTuple):
+    """How many keepass entries a sync added, updated, removed or left alone."""
+
+    added: int
+    updated: int
+    removed: int
+    unchanged: int
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 of a file content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_fingerprint(index_entry: IndexEntry, digest: str = None) -> Dict:
+    """Return the fingerprint of a pass entry encrypted file: its name, mtime and content hash."""
+    return {
+        "path": index_entry.name,
+        "mtime_ns": index_entry.mtime_ns,
+        "sha256": digest if digest is not None else file_digest(index_entry.path),
+    }
+
+
+def get_synced_entries(writer: P2KP2) -> Dict[str, Tuple[Entry, Dict]]:
+    """Return the keepass entries added by a previous sync, with their fingerprint, by pass entry name.
+
+    Entries without a fingerprint were not added by a sync and are ignored.
+    """
+    synced = {}
+    for entry in writer.db.entries:
+        value = entry.get_custom_property(fingerprint_key)
+        if value is None:
+            continue
+        try:
+            fingerprint = json.loads(value)
+            synced[fingerprint["path"]] = (entry, fingerprint)
+        except (ValueError, KeyError, TypeError):
+            continue
+    return synced
+
+
+def get_untagged_entries(writer: P2KP2) -> Dict[str, Entry]:
+    """Return the keepass entries with no fingerprint, like the ones of a full conversion, by the pass entry name
+    their group path and title make up. Of many entries with the same name, only the first one is returned."""
+    untagged = {}
+    for entry in writer.db.entries:
+        if entry.get_custom_property(fingerprint_key) is None:
+            untagged.setdefault("/".join(entry.group.path + [entry.title]), entry)
+    return untagged
+
+
+def sync(reader: PassReader, writer: P2KP2) -> SyncResult:
+    """Bring a keepass db previously populated by a sync up to date with the pass db.
+
+    Every keepass entry records the fingerprint of the encrypted file it comes from in a custom property. A file
+    whose mtime did not change is assumed unchanged; otherwise its content hash is compared. Only new or changed
+    files are decrypted: their keepass entries are replaced, while entries whose file is gone are removed. The
+    db is saved once, at the end.
+
+    Entries with no fingerprint, like the ones of a full conversion, are adopted when their group path and title
+    match a pass entry with no keepass entry yet: they are replaced, fingerprint included, and counted as
+    updated. The other ones are left alone.
+
+    :param reader: the PassReader to read entries from
+    :param writer: the P2KP2 opened with sync=True
+    :return: the number of entries added, updated, removed and unchanged
+    """
+    synced = get_synced_entries(writer)
+    fingerprints = {}
+    unchanged = 0
+    for index_entry in reader.index:
+        old = synced.get(index_entry.name)
+        if old is not None:
+            entry, old_fingerprint = old
+            if old_fingerprint.get("mtime_ns") == index_entry.mtime_ns:
+                unchanged += 1
+                continue
+            digest = file_digest(index_entry.path)
+            if old_fingerprint.get("sha256") == digest:
+                # just touched: only record the new mtime
+                entry.set_custom_property(fingerprint_key, json.dumps(make_fingerprint(index_entry, digest)))
+                unchanged += 1
+                continue
+            fingerprints[index_entry.name] = make_fingerprint(index_entry, digest)
+        else:
+            fingerprints[index_entry.name] = make_fingerprint(index_entry)
+
+    names = set(reader.index.names())
+    removed = [name for name in synced if name not in names]
+    updated = [name for name in fingerprints if name in synced]
+    deleted = [synced[name][0] for name in removed + updated]
+    if len(fingerprints) > len(updated):
+        untagged = get_untagged_entries(writer)
+        adopted = [name for name in fingerprints if name not in synced and name in untagged]
+        updated += adopted
+        deleted += [untagged[name] for name in adopted]
+    binaries = {attachment.id for entry in deleted for attachment in entry.attachments}
+    for entry in deleted:
+        writer.db.delete_entry(entry)
+    if binaries:
+        # binary entries are the only users of their binaries: drop the ones nothing refers to anymore, last
+        # first, since deleting a binary renumbers the ones after it
+        in_use = {attachment.id for attachment in writer.db.attachments}
+        for binary in sorted(binaries - in_use, reverse=True):
+            writer.db.delete_binary(binary)
+
+    def fingerprinted_entries() -> Iterator[PassEntry]:
+        # fingerprints are attached before the mapper runs, since it may rename, drop or add entries
+        entries = reader.read_entries(fingerprints)
+        try:
+            for name, pass_entry in zip(fingerprints, entries):
+                pass_entry.custom_properties[fingerprint_key] = json.dumps(fingerprints[name])
+                yield pass_entry
+        finally:
+            entries.close()
+            reader.close()
+
+    writer.populate_db(reader.map_entries(fingerprinted_entries()))
+    return SyncResult(added=len(fingerprints) - len(updated), updated=len(updated), removed=len(removed),
+                      unchanged=unchanged)
@@ -1,51 +1,221 @@
+from __future__ import annotations
 import os
-import pkg_resources
-from shutil import copyfile
+from itertools import islice
+from typing import Iterable, Union, Dict, Tuple, Sequence, List, TYPE_CHECKING
 
-from pykeepass import PyKeePass
-from pykeepass.entry import Entry
-from rx.subject import Subject
+from p2kp2.checkpoint import Checkpoint
+from p2kp2.reader import EntryReader, PassEntry
+from p2kp2.kdf import Kdf, AesKdf, Argon2Kdf, set_kdf
+from p2kp2.profiling import Profiler, NullProfiler
 
-from p2kp2 import PassReader, PassEntry
+if TYPE_CHECKING:
+    from pykeepass import PyKeePass
+    from pykeepass.entry import Entry
+    from pykeepass.group import Group
 
-empty_db_path = pkg_resources.resource_filename(__name__, "empty.kdbx")
+# blank templates, with the cheapest key derivation: the new db one is set before saving
+empty_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "empty.kdbx")
+empty_kdbx4_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "empty4.kdbx")
 
 
 class DbAlreadyExistsException(Exception):
     """Trying to overwrite an already existing keepass db."""
 
 
-class P2KP2:
+class DbNotWritableException(Exception):
+    """The keepass db destination, or the folder it goes in, can't be written."""
+
+
+class EntryWriter:
+    """Base class for the destinations pass entries are converted into.
+
+    populate_db consumes the entries, firing the number of entries written so far on event_stream every
+    event_step entries, and once more after the last one.
+    """
+
+    checkpoint: Checkpoint = None  # the journal of the entries already saved, for writers that can resume
+    contiguous: bool = False  # whether the entries of a folder must come together, like a single store gives them
+
+    def __init__(self, profiler: Profiler = None):
+        """Constructor for EntryWriter
+
+        :param profiler: optional Profiler recording how long writing the entries takes
+        """
+        from rx.subject import Subject
+        self.event_stream = Subject()
+        self.event_step = 1  # fire a progress event every event_step entries, and after the last one
+        self.profiler = profiler if profiler is not None else NullProfiler()
+
+    def build_group_tree(self, paths: Iterable[Sequence[str]]):
+        """Get ready for entries in the given groups, before adding any entry. It does nothing by default.
+
+        :param paths: the groups path, in any order and possibly repeated
+        """
+
+    def populate_db(self, entries: Union[EntryReader, Iterable[PassEntry]]):
+        """Write the entries of the EntryReader, or of any iterable of PassEntry, to the destination.
+
+        :param entries: an EntryReader, like a PassReader, whose already parsed entries will be written, or an
+            iterable of PassEntry, which will be consumed as entries are written
+        """
+        raise NotImplementedError()
+
+
+def check_writable(destination: str):
+    """Make sure a db can be saved to destination, without writing anything: raise a DbNotWritableException if
+    the file exists but is read-only, or if its folder is missing or read-only."""
+    if os.path.exists(destination):
+        if not os.access(destination, os.W_OK):
+            raise DbNotWritableException(f"the keepass database {destination} is not writable.")
+        return
+    folder = os.path.dirname(os.path.abspath(destination))
+    if not os.path.isdir(folder):
+        raise DbNotWritableException(f"the folder {folder} of the keepass database does not exist.")
+    if not os.access(folder, os.W_OK):
+        raise DbNotWritableException(f"the folder {folder} of the keepass database is not writable.")
+
+
+class P2KP2(EntryWriter):
     """Convert a Pass db into a Keepass2 one."""
 
     db: PyKeePass
+    groups: Dict[Tuple[str, ...], Group]
 
-    def __init__(self, password: str, destination: str = None, overwrite: bool = False):
+    bulk_size: int = 500  # entries added at once in bulk mode
+
+    def __init__(self, password: str, destination: str = None, overwrite: bool = False, bulk: bool = False,
+                 sync: bool = False, kdf: Kdf = None, profiler: Profiler = None, checkpoint: Checkpoint = None):
         """Constructor for P2KP2
 
         :param password: the password for the new Keepass db
         :param destination: the final db path
         :param overwrite: force writing over existing database
+        :param bulk: let populate_db add entries in batches with add_entries, skipping pykeepass checks for
+            duplicated entries
+        :param sync: open the db at destination, if there's one, instead of creating a new one. The password
+            must be the one of the existing db
+        :param kdf: the key derivation settings, AesKdf or Argon2Kdf. A new db defaults to AesKdf(), while an
+            existing one keeps its own. Argon2 requires a KDBX 4 db: new dbs are created accordingly
+        :param profiler: optional Profiler recording how long group lookups, inserts and the final save take. In
+            bulk mode, building every batch and attaching it to every group are recorded as bulk build and bulk
+            attach instead of inserts
+        :param checkpoint: optional Checkpoint: populate_db then saves the db every now and then, and when it's
+            interrupted, recording the entries already saved in the checkpoint journal
+
+        Nothing is written to destination until populate_db saves the db, but a destination that couldn't be
+        written then is refused right away.
         """
+        # pykeepass is only imported once a writer is needed, keeping the package quick to import
+        from pykeepass import PyKeePass
+        super().__init__(profiler)
         if destination is None:
             destination = "pass.kdbx"
-        if not os.path.exists(destination) or overwrite:
-            copyfile(empty_db_path, destination)
+        check_writable(destination)
+        if sync and os.path.exists(destination):
+            self.db = PyKeePass(destination, password=password)
         else:
-            raise DbAlreadyExistsException()
-        self.db = PyKeePass(destination)
-        self.db.password = password
-        self.db.save()
-        self.event_stream = Subject()
+            if os.path.exists(destination) and not overwrite:
+                raise DbAlreadyExistsException()
+            self.db = PyKeePass(empty_kdbx4_db_path if isinstance(kdf, Argon2Kdf) else empty_db_path)
+            self.db.filename = destination
+            self.db.password = password
+            if kdf is None:
+                kdf = AesKdf()
+        if kdf is not None:
+            set_kdf(self.db, kdf)
+        self.bulk = bulk
+        self.checkpoint = checkpoint
+        self.groups = {}
+        self._cache_groups(self.db.root_group, ())
+
+    def _cache_groups(self, group: Group, path: Tuple[str, ...]):
+        """Add a group, and all its subgroups, to the group cache."""
+        self.groups[path] = group
+        for subgroup in group.subgroups:
+            self._cache_groups(subgroup, path + (subgroup.name,))
+
+    def get_group(self, path: Sequence[str]) -> Group:
+        """Return the group at the given path, creating it and its missing parents if needed.
+
+        Groups are looked up in the group cache, which is kept up to date by this method: groups added to the
+        db by other means won't be found.
+
+        :param path: the group names, starting from the root group
+        :return: the keepass group
+        """
+        path = tuple(path)
+        group = self.groups.get(path)
+        if group is None:
+            # since pass folder names are unique, there can only be one group with this name in its parent
+            group = self.db.add_group(destination_group=self.get_group(path[:-1]), group_name=path[-1])
+            self.groups[path] = group
+        return group
+
+    def build_group_tree(self, paths: Iterable[Sequence[str]]):
+        """Create all the given groups at once, before adding any entry.
+
+        :param paths: the groups path, in any order and possibly repeated
+        """
+        for path in sorted(set(tuple(x) for x in paths)):
+            self.get_group(path)
+
+    def populate_db(self, entries: Union[EntryReader, Iterable[PassEntry]]):
+        """Populate the keepass db with data from the EntryReader, or from any iterable of PassEntry.
 
-    def populate_db(self, pass_reader: PassReader):
-        """Populate the keepass db with data from the PassReader."""
+        :param entries: an EntryReader, like a PassReader, whose already parsed entries will be added, or an
+            iterable of PassEntry, which will be consumed as entries are added
+        """
+        if isinstance(entries, EntryReader):
+            entries = entries.entries
+            self.build_group_tree(x.groups for x in entries)
         i = 0
-        for pass_entry in pass_reader.entries:
-            self.add_entry(pass_entry)
-            i = i + 1
+        try:
+            if self.bulk:
+                entries = iter(entries)
+                batch = list(islice(entries, self.bulk_size))
+                while batch:
+                    self.add_entries(batch)
+                    for pass_entry in batch:
+                        i = i + 1
+                        self._added(pass_entry, i)
+                    batch = list(islice(entries, self.bulk_size))
+            else:
+                for pass_entry in entries:
+                    self.add_entry(pass_entry)
+                    i = i + 1
+                    self._added(pass_entry, i)
+        except BaseException:
+            if self.checkpoint is not None:
+                # keep what was converted so far: the conversion can be resumed
+                self.save()
+            raise
+        if i % self.event_step != 0:
             self.event_stream.on_next(i)
-        self.db.save()
+        self.save()
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
+
+    def _added(self, pass_entry: PassEntry, count: int):
+        """Fire the progress event and save the checkpoint, when it's their turn, after an entry is added."""
+        if count % self.event_step == 0:
+            self.event_stream.on_next(count)
+        if self.checkpoint is not None:
+            self.checkpoint.record(pass_entry)
+            if self.checkpoint.due():
+                self.save()
+
+    def save(self):
+        """Write the keepass db to its destination, committing the checkpoint journal first if there's one."""
+        if self.checkpoint is not None:
+            self.checkpoint.commit()
+        with self.profiler.measure("save"):
+            self.db.save()
+
+    def has_entry(self, groups: Sequence[str], title: str) -> bool:
+        """Whether the db has an entry with the given title in the group at the given path."""
+        group = self.groups.get(tuple(groups))
+        return group is not None and self.db.find_entries(title=title, group=group, recursive=False,
+                                                          first=True) is not None
 
     def add_entry(self, pass_entry: PassEntry) -> Entry:
         """Add a keepass entry to the db containing all data from the relative pass entry. Create the group if needed.
@@ -53,22 +223,87 @@ class P2KP2:
         :param pass_entry: the original pass entry
         :return: the newly added keepass entry
         """
+        name = pass_entry.name if self.profiler.enabled else None
         # find the correct group for the entry. If not there, create it
-        entry_group = self.db.root_group  # start from the root group
-        if len(pass_entry.groups) > 0:
-            for group_name in pass_entry.groups:
-                # since pass folder names are unique, the possible first result is also the only one
-                group = self.db.find_groups(name=group_name, recursive=False, group=entry_group, first=True)
-                if group is None:
-                    # the group is not already there, let's create it
-                    group = self.db.add_group(destination_group=entry_group, group_name=group_name)
-                entry_group = group
-        # create the entry, setting group, title, user and pass
-        entry = self.db.add_entry(entry_group, pass_entry.title, pass_entry.user, pass_entry.password)
-        # set the url and the notes
-        entry.url = pass_entry.url
-        entry.notes = pass_entry.notes
-        # add all custom fields
-        for pass_entry, value in pass_entry.custom_properties.items():
-            entry.set_custom_property(pass_entry, value)
+        with self.profiler.measure("group lookup", name):
+            entry_group = self.get_group(pass_entry.groups)
+        with self.profiler.measure("insert", name):
+            # create the entry, setting group, title, user and pass
+            entry = self.db.add_entry(entry_group, pass_entry.title, pass_entry.user, pass_entry.password)
+            binary = None
+            try:
+                # set the url and the notes
+                entry.url = pass_entry.url
+                entry.notes = pass_entry.notes
+                # add all custom fields
+                for key, value in pass_entry.custom_properties.items():
+                    entry.set_custom_property(key, value)
+                # and the content of a binary entry, as it is
+                if pass_entry.attachment is not None:
+                    binary = self.db.add_binary(pass_entry.attachment)
+                    entry.add_attachment(binary, pass_entry.title)
+            except BaseException:
+                # never leave a half-filled entry behind: a checkpoint save would keep it, but not journal it
+                entry_group._element.remove(entry._element)
+                if binary is not None:
+                    self.db.delete_binary(binary)
+                raise
         return entry
+
+    def add_entries(self, pass_entries: List[PassEntry]) -> List[Entry]:
+        """Add many keepass entries to the db at once. Create the groups if needed.
+
+        Entries XML elements are built directly, with all their fields, and then attached to their groups with
+        a single operation per group. Unlike add_entry, this does not check if an entry with the same title and
+        user is already in the group, so the time needed only depends on the number of entries added.
+
+        The batch is added as a whole or not at all: should any entry fail, none of them is left in the db.
+
+        :param pass_entries: the original pass entries
+        :return: the newly added keepass entries, in the same order
+        """
+        binaries = []
+        elements_by_group = {}
+        try:
+            # stages of their own: a batch, or all the entries of a group, aren't comparable with add_entry ones
+            with self.profiler.measure("bulk build"):
+                entries = self._build_elements(pass_entries, elements_by_group, binaries)
+            for path, elements in elements_by_group.items():
+                with self.profiler.measure("group lookup"):
+                    group = self.get_group(path)
+                with self.profiler.measure("bulk attach"):
+                    group._element.extend(elements)
+        except BaseException:
+            # a checkpoint save would keep the part of the batch already added, but not journal it
+            for elements in elements_by_group.values():
+                for element in elements:
+                    if element.getparent() is not None:
+                        element.getparent().remove(element)
+            # last first, since deleting a binary renumbers the ones after it
+            for binary in reversed(binaries):
+                self.db.delete_binary(binary)
+            raise
+        return entries
+
+    def _build_elements(self, pass_entries: List[PassEntry], elements_by_group: Dict[Tuple[str, ...], List],
+                        binaries: List[int]) -> List[Entry]:
+        """Build the keepass entries of add_entries, adding their XML elements to elements_by_group by group path
+        and the ids of the binaries they add to binaries."""
+        from lxml.builder import E
+        from pykeepass.entry import Entry
+        entries = []
+        for pass_entry in pass_entries:
+            entry = Entry(pass_entry.title, pass_entry.user, pass_entry.password, kp=self.db)
+            element = entry._element
+            # the same fields add_entry would set, with the same attributes
+            element.append(E.String(E.Key("URL"), E.Value(pass_entry.url)))
+            element.append(E.String(E.Key("Notes"), E.Value(pass_entry.notes)))
+            for key, value in pass_entry.custom_properties.items():
+                element.append(E.String(E.Key(key), E.Value(value, Protected="False")))
+            if pass_entry.attachment is not None:
+                binary = self.db.add_binary(pass_entry.attachment)
+                binaries.append(binary)
+                element.append(E.Binary(E.Key(pass_entry.title), E.Value(Ref=str(binary))))
+            elements_by_group.setdefault(tuple(pass_entry.groups), []).append(element)
+            entries.append(entry)
+        return entries
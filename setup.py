@@ -25,7 +25,11 @@ setup(
         'Rx>=3.0.1',
     ],
     extras_require={
+        'openpgp': [
+            'PGPy>=0.5.2',
+        ],
         'dev': [
+            'PGPy>=0.5.2',
             'pytest>=4.0.0',
             'pytest-spec>=1.1.0',
             'pytest-sugar>=0.9.2',
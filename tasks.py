@@ -3,6 +3,7 @@ from invoke import task
 
 TEST_FOLDER = "tests"
 PROJECT_FOLDER = "p2kp2"
+BENCH_FOLDER = "benchmarks"
 
 
 @task
@@ -51,6 +52,11 @@ def test_coverage(c, s=False):
     c.run("pipenv run pytest --cov='{}'{} {}".format(PROJECT_FOLDER, capture, TEST_FOLDER), pty=True)
 
 
+@task
+def bench(c, name="decrypt", args=""):
+    c.run("pipenv run python {}/bench_{}.py {}".format(BENCH_FOLDER, name, args), pty=True)
+
+
 #
 # ACT
 #
@@ -1,6 +1,8 @@
 import os
 import pytest
 
+from p2kp2.backends import backends
+
 
 test_pass = "somesecurepassword"
 test_db_file = "tests/test-db.kdbx"
@@ -23,3 +25,11 @@ def reset_db_after_all_class_test():
     """Delete the test db after all the class test run."""
     yield
     delete_test_db()
+
+
+@pytest.fixture(scope="class", params=list(backends.keys()))
+def backend(request):
+    """Run the whole test class once for every decryption backend."""
+    if request.param == "openpgp":
+        pytest.importorskip("pgpy")
+    return request.param
@@ -0,0 +1,9 @@
+def custom_batch_mapper(entries):
+    # keep only the first entry for every password
+    seen = set()
+    mapped = []
+    for entry in entries:
+        if entry.password not in seen:
+            seen.add(entry.password)
+            mapped.append(entry)
+    return mapped
@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2 import PassReader, BatchMapper, ProcessMapper, CustomMapperExecException
+from p2kp2.aio import AsyncPassReader, AsyncP2KP2, ProgressStream
+from p2kp2.gpg import DecryptionException
+from tests.conftest import test_db_file, test_pass
+from tests.test_reader import entry_fields, upper_title_mapper
+
+
+def read_all(reader: AsyncPassReader):
+    async def collect():
+        return [entry async for entry in reader.aiter_entries()]
+    return asyncio.run(collect())
+
+
+class TestAsyncPassReader:
+    """Test: AsyncPassReader..."""
+
+    def test_should_read_the_same_entries_as_the_pass_reader(self):
+        """... it should read the same entries as the pass reader"""
+        serial = PassReader(path="tests/password-store")
+        serial.parse_db()
+        reader = AsyncPassReader(path="tests/password-store", concurrency=2)
+        asyncio.run(reader.aparse_db())
+        assert [entry_fields(x) for x in reader.entries] == [entry_fields(x) for x in serial.entries]
+
+    def test_should_keep_the_pass_reader_methods_synchronous(self):
+        """... it should keep the pass reader methods synchronous"""
+        reader = AsyncPassReader(path="tests/password-store")
+        reader.parse_db()
+        assert [x.name for x in reader.iter_entries()] == [x.name for x in reader.entries]
+        assert len(reader.entries) == 4
+
+    def test_should_never_run_more_gpg_processes_than_allowed(self, mocker):
+        """... it should never run more gpg processes than allowed"""
+        running, peak = [0], [0]
+        create_subprocess_exec = asyncio.create_subprocess_exec
+
+        async def tracked_create_subprocess_exec(*args, **kwargs):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            process = await create_subprocess_exec(*args, **kwargs)
+            communicate = process.communicate
+
+            async def tracked_communicate(data=None):
+                try:
+                    return await communicate(data)
+                finally:
+                    running[0] -= 1
+            process.communicate = tracked_communicate
+            return process
+        mocker.patch("asyncio.create_subprocess_exec", tracked_create_subprocess_exec)
+        assert len(read_all(AsyncPassReader(path="tests/password-store", concurrency=2))) == 4
+        assert peak[0] == 2
+
+    def test_should_not_block_the_event_loop(self):
+        """... it should not block the event loop"""
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+
+        async def run():
+            ticker = asyncio.ensure_future(tick())
+            await AsyncPassReader(path="tests/password-store").aparse_db()
+            ticker.cancel()
+        asyncio.run(run())
+        assert len(ticks) > 4
+
+    def test_should_publish_the_progress_as_an_async_stream(self):
+        """... it should publish the progress as an async stream"""
+        reader = AsyncPassReader(path="tests/password-store")
+        events = []
+
+        async def listen():
+            async for count in reader.progress:
+                events.append(count)
+
+        async def run():
+            entries = reader.aiter_entries()
+            listener = asyncio.ensure_future(listen())
+            result = [entry async for entry in entries]
+            await listener
+            return result
+        assert len(asyncio.run(run())) == 4
+        assert events == [1, 2, 3, 4]
+
+    def test_should_apply_the_mappers(self):
+        """... it should apply the mappers"""
+        titles = [x.title for x in read_all(AsyncPassReader(path="tests/password-store", mapper=upper_title_mapper))]
+        assert titles == ["TEST1", "TEST3", "TEST2", "TEST4"]
+        batch_mapper = BatchMapper(lambda entries: entries[:1], size=2)
+        entries = read_all(AsyncPassReader(path="tests/password-store", mapper=batch_mapper))
+        assert [x.title for x in entries] == ["test1", "test2"]
+
+    def test_should_raise_the_mapper_errors(self):
+        """... it should raise the mapper errors"""
+        def custom_broken_mapper(_):
+            raise Exception
+        with pytest.raises(CustomMapperExecException):
+            read_all(AsyncPassReader(path="tests/password-store", mapper=custom_broken_mapper))
+
+    def test_should_refuse_a_process_mapper(self):
+        """... it should refuse a process mapper"""
+        with pytest.raises(ValueError):
+            AsyncPassReader(path="tests/password-store", mapper=ProcessMapper(upper_title_mapper))
+
+    def test_should_stop_at_the_first_missing_entry(self):
+        """... it should stop at the first missing entry"""
+        reader = AsyncPassReader(path="tests/password-store")
+
+        async def run():
+            return [entry async for entry in reader.aread_entries(["test1", "not_there", "web/test2"])]
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(run())
+
+    def test_should_raise_a_decryption_exception_when_gpg_fails(self, tmp_path):
+        """... it should raise a decryption exception when gpg fails"""
+        (tmp_path / "broken.gpg").write_bytes(b"not encrypted at all")
+        with pytest.raises(DecryptionException):
+            read_all(AsyncPassReader(path=str(tmp_path)))
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestAsyncP2KP2:
+    """Test: AsyncP2KP2..."""
+
+    def test_should_write_every_entry_read(self):
+        """... it should write every entry read"""
+        for bulk in [False, True]:
+            async def run():
+                reader = AsyncPassReader(path="tests/password-store")
+                writer = await AsyncP2KP2.open(password=test_pass, destination=test_db_file, overwrite=True,
+                                               bulk=bulk)
+                return await writer.apopulate_db(reader.aiter_entries())
+            assert asyncio.run(run()) == 4
+            db = PyKeePass(test_db_file, password=test_pass)
+            assert sorted(x.title for x in db.entries) == ["test1", "test2", "test3", "test4"]
+
+    def test_should_publish_the_progress_after_every_batch(self):
+        """... it should publish the progress after every batch"""
+        reader = PassReader(path="tests/password-store")
+        reader.parse_db()
+        writer = AsyncP2KP2(password=test_pass, destination=test_db_file)
+        writer.bulk_size = 3
+        events = []
+
+        async def listen():
+            async for count in writer.progress:
+                events.append(count)
+
+        async def run():
+            populated = writer.apopulate_db(reader.entries)
+            listener = asyncio.ensure_future(listen())
+            await populated
+            await listener
+        asyncio.run(run())
+        assert events == [3, 4]
+
+    def test_should_publish_the_progress_to_the_listeners_started_first(self):
+        """... it should publish the progress to the listeners started first"""
+        events = {"read": [], "written": []}
+
+        async def listen(stream, key):
+            async for count in stream:
+                events[key].append(count)
+
+        async def run():
+            reader = AsyncPassReader(path="tests/password-store")
+            writer = await AsyncP2KP2.open(password=test_pass, destination=test_db_file)
+            writer.bulk_size = 3
+            # like the README: the listeners are started before the conversion
+            listeners = [asyncio.ensure_future(listen(reader.progress, "read")),
+                         asyncio.ensure_future(listen(writer.progress, "written"))]
+            await writer.apopulate_db(reader.aiter_entries())
+            await asyncio.gather(*listeners)
+        asyncio.run(run())
+        assert events == {"read": [1, 2, 3, 4], "written": [3, 4]}
+
+
+class TestProgressStream:
+    """Test: ProgressStream..."""
+
+    def test_should_end_right_away_when_not_running(self):
+        """... it should end right away when not running"""
+        async def run():
+            return [count async for count in ProgressStream()]
+        assert asyncio.run(run()) == []
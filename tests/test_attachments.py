@@ -0,0 +1,168 @@
+import base64
+import os
+import shutil
+import sys
+
+import pytest
+from lxml import etree
+from pykeepass import PyKeePass
+
+from p2kp2 import PassReader, PassEntry, P2KP2
+from p2kp2.exporters import KeePassXmlWriter, CsvWriter, UnsupportedEntryException, base64_chunk_size
+from p2kp2.gpg import encrypt
+from p2kp2.kdf import Argon2Kdf
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.reverse import KeePassReader, PassWriter
+from p2kp2.sync import sync
+from tests.conftest import test_pass
+
+recipient = "pass2keepass2"
+# a DER certificate start, then every byte value: not text in any way
+key_file = b"\x30\x82\x03\x0a" + bytes(range(256)) * 64
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A disposable copy of the test password-store, with a binary entry."""
+    path = tmp_path / "password-store"
+    shutil.copytree("tests/password-store", path)
+    (path / "keys").mkdir()
+    (path / "keys" / "server.der.gpg").write_bytes(encrypt(key_file, [recipient]))
+    return str(path)
+
+
+def binary_entry(name: str = "keys/server.der", data: bytes = key_file) -> PassEntry:
+    return PassEntry.from_bytes(name, data)
+
+
+class TestBinaryPassEntry:
+    """Test: PassEntry with binary content..."""
+
+    def test_should_keep_binary_content_as_it_is(self):
+        """... it should keep binary content as it is"""
+        entry = binary_entry()
+        assert entry.attachment is key_file
+        assert (entry.groups, entry.title, entry.password, entry.user, entry.notes, entry.custom_properties) == \
+               (["keys"], "server.der", "", "", "", {})
+
+    def test_should_parse_text_content(self):
+        """... it should parse text content"""
+        entry = PassEntry.from_bytes("web/test", "pw\nuser: me\n".encode("utf-8"))
+        assert (entry.password, entry.user, entry.attachment) == ("pw", "me", None)
+        assert PassEntry.from_string("test", "pw").attachment is None
+
+    def test_should_find_out_binary_content_past_the_start(self):
+        """... it should find out binary content past the start"""
+        data = b"a" * 10000 + b"\xff"
+        assert binary_entry("test", data).attachment is data
+        buffer = bytearray(data)
+        entry = PassEntry.from_buffer("test", buffer)
+        assert entry.attachment == data
+        assert type(entry.attachment) is bytes
+
+    def test_should_have_no_entry_string(self):
+        """... it should have no entry string"""
+        with pytest.raises(ValueError):
+            binary_entry().to_entry_string()
+
+
+class TestPassReaderWithBinaryEntries:
+    """Test: PassReader reading a binary entry..."""
+
+    @pytest.mark.parametrize("wipe_buffers", [False, True])
+    def test_should_read_it_as_an_attachment(self, store, wipe_buffers):
+        """... it should read it as an attachment"""
+        reader = PassReader(path=store, wipe_buffers=wipe_buffers)
+        reader.parse_db()
+        entries = {x.name: x for x in reader.entries}
+        assert entries["keys/server.der"].attachment == key_file
+        assert entries["test1"].attachment is None
+
+
+class TestP2kp2Attachments:
+    """Test: P2KP2 writing binary entries..."""
+
+    @pytest.mark.parametrize("bulk", [False, True])
+    @pytest.mark.parametrize("kdf", [None, Argon2Kdf(memory=1024, iterations=1, parallelism=1)])
+    def test_should_store_them_as_attachments(self, tmp_path, bulk, kdf):
+        """... it should store them as attachments"""
+        destination = str(tmp_path / "pass.kdbx")
+        P2KP2(password=test_pass, destination=destination, bulk=bulk, kdf=kdf).populate_db(
+            [binary_entry(), PassEntry.from_string("test", "pw")])
+        db = PyKeePass(destination, password=test_pass)
+        attachments = db.find_entries(title="server.der", first=True).attachments
+        assert [(x.filename, x.data) for x in attachments] == [("server.der", key_file)]
+        assert db.find_entries(title="test", first=True).attachments == []
+
+    def test_should_drop_the_binaries_of_the_entries_a_sync_replaces(self, store, tmp_path):
+        """... it should drop the binaries of the entries a sync replaces"""
+        destination = str(tmp_path / "sync.kdbx")
+        sync(PassReader(path=store), P2KP2(password=test_pass, destination=destination, sync=True))
+        path = os.path.join(store, "keys", "server.der.gpg")
+        with open(path, "wb") as f:
+            f.write(encrypt(b"\x00new key", [recipient]))
+        sync(PassReader(path=store), P2KP2(password=test_pass, destination=destination, sync=True))
+        db = PyKeePass(destination, password=test_pass)
+        assert db.binaries == [b"\x00new key"]
+        assert db.find_entries(title="server.der", first=True).attachments[0].data == b"\x00new key"
+
+
+class TestExportedAttachments:
+    """Test: the output formats with binary entries..."""
+
+    def test_should_write_them_inline_in_the_xml_file(self, tmp_path):
+        """... it should write them inline in the xml file"""
+        data = bytes(range(256)) * (base64_chunk_size // 128)
+        destination = str(tmp_path / "pass.xml")
+        KeePassXmlWriter(destination=destination).populate_db([binary_entry("keys/big.bin", data)])
+        binary = etree.parse(destination).find(".//Entry/Binary")
+        assert binary.findtext("Key") == "big.bin"
+        assert base64.b64decode(binary.findtext("Value")) == data
+
+    def test_should_refuse_them_in_the_csv_file(self, tmp_path):
+        """... it should refuse them in the csv file"""
+        destination = str(tmp_path / "pass.csv")
+        with pytest.raises(UnsupportedEntryException):
+            CsvWriter(destination=destination).populate_db([binary_entry()])
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestRestoredAttachments:
+    """Test: restoring binary entries to a password-store..."""
+
+    def test_should_give_back_the_original_content(self, store, tmp_path, monkeypatch):
+        """... it should give back the original content"""
+        destination = str(tmp_path / "pass.kdbx")
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", store, "-o", destination])
+        main_func()
+        reader = KeePassReader(destination, password=test_pass)
+        reader.parse_db()
+        assert [x.attachment for x in reader.entries if x.attachment is not None] == [key_file]
+        restored = tmp_path / "restored"
+        PassWriter(str(restored), recipients=[recipient]).populate_db(reader)
+        pass_reader = PassReader(path=str(restored))
+        pass_reader.parse_db()
+        assert {x.name: x.attachment for x in pass_reader.entries}["keys/server.der"] == key_file
+
+    def test_should_only_restore_the_binary_entries_p2kp2_writes(self, tmp_path):
+        """... it should only restore the binary entries p2kp2 writes"""
+        destination = str(tmp_path / "pass.kdbx")
+        writer = P2KP2(password=test_pass, destination=destination)
+        writer.populate_db([binary_entry(), binary_entry("keys/renamed.der"), binary_entry("keys/noted.der"),
+                            PassEntry.from_string("web/site", "pw\nuser: me")])
+        writer.save()
+        db = PyKeePass(destination, password=test_pass)
+        renamed = db.find_entries(title="renamed.der", first=True)
+        renamed.attachments[0].filename = "other.der"
+        db.find_entries(title="noted.der", first=True).notes = "a note"
+        site = db.find_entries(title="site", first=True)
+        site.add_attachment(db.add_binary(key_file), "site")
+        db.save()
+        reader = KeePassReader(destination, password=test_pass)
+        reader.parse_db()
+        entries = {x.name: x for x in reader.entries}
+        assert entries["keys/server.der"].attachment == key_file
+        assert all(entries[x].attachment is None for x in ["keys/renamed.der", "keys/noted.der", "web/site"])
+        assert (entries["keys/noted.der"].notes, entries["web/site"].password) == ("a note", "pw")
+        assert reader.skipped == ["keys/renamed.der", "keys/noted.der", "web/site"]
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from passpy import Store
+
+from p2kp2.backends import make_backend, PasspyBackend, GpgBatchBackend, OpenPGPBackend
+from p2kp2.gpg import DecryptionException
+
+
+store = Store(store_dir="tests/password-store")
+test2_path = os.path.abspath("tests/password-store/web/test2.gpg")
+test2_plaintext = b'],O}DLHRZ]8UTg4jv\'JC"r<Y*\n'
+
+
+class TestMakeBackend:
+    """Test: make_backend..."""
+
+    def test_should_build_the_backends_by_name(self):
+        """... it should build the backends by name"""
+        assert type(make_backend("passpy", store)) is PasspyBackend
+        assert type(make_backend("batch", store)) is GpgBatchBackend
+
+    def test_should_size_the_batch_backend_on_the_number_of_jobs(self):
+        """... it should size the batch backend on the number of jobs"""
+        assert make_backend("batch", store, jobs=3).sessions.size == 3
+
+    def test_should_refuse_unknown_backends(self):
+        """... it should refuse unknown backends"""
+        with pytest.raises(ValueError):
+            make_backend("not_there", store)
+
+
+class TestPasspyBackend:
+    """Test: PasspyBackend..."""
+
+    def test_should_start_a_single_gpg_process_for_every_entry(self, mocker):
+        """... it should start a single gpg process for every entry"""
+        import subprocess
+        run = mocker.spy(subprocess, "run")
+        popen = mocker.spy(subprocess, "Popen")
+        assert PasspyBackend(store).decrypt(test2_path) == test2_plaintext
+        assert popen.call_count == 1
+        assert run.call_args[0][0][-2:] == ["--decrypt", test2_path]
+
+
+class TestDecryptionBackends:
+    """Test: every decryption backend..."""
+
+    def test_should_return_the_plaintext_as_bytes(self, backend):
+        """... it should return the plaintext as bytes"""
+        decryption_backend = make_backend(backend, store)
+        assert decryption_backend.decrypt(test2_path) == test2_plaintext
+        decryption_backend.close()
+
+    def test_should_decrypt_into_a_buffer(self, backend):
+        """... it should decrypt into a buffer"""
+        decryption_backend = make_backend(backend, store)
+        buffer = decryption_backend.decrypt_buffer(test2_path)
+        assert type(buffer) is bytearray
+        assert buffer == test2_plaintext
+        with pytest.raises(DecryptionException):
+            decryption_backend.decrypt_buffer(os.path.abspath("tests/password-store/.gpg-id"))
+        decryption_backend.close()
+
+    def test_should_still_work_once_closed(self, backend):
+        """... it should still work once closed"""
+        decryption_backend = make_backend(backend, store)
+        decryption_backend.close()
+        assert decryption_backend.decrypt(test2_path) == test2_plaintext
+        decryption_backend.close()
+
+    def test_should_raise_an_exception_when_the_file_cannot_be_decrypted(self, backend):
+        """... it should raise an exception when the file cannot be decrypted"""
+        decryption_backend = make_backend(backend, store)
+        with pytest.raises(DecryptionException):
+            decryption_backend.decrypt(os.path.abspath("tests/password-store/.gpg-id"))
+        decryption_backend.close()
+
+
+class TestOpenPGPBackend:
+    """Test: OpenPGPBackend..."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        """TestOpenPGPBackend setup"""
+        pytest.importorskip("pgpy")
+
+    def test_should_find_the_recipients_in_the_gpg_id_files(self):
+        """... it should find the recipients in the .gpg-id files"""
+        assert OpenPGPBackend(store).get_recipients() == ["pass2keepass2"]
+
+    def test_should_export_the_secret_keys_only_once(self, mocker):
+        """... it should export the secret keys only once"""
+        decryption_backend = OpenPGPBackend(store)
+        spy = mocker.spy(decryption_backend, "export_secret_keys")
+        decryption_backend.decrypt(test2_path)
+        decryption_backend.decrypt(test2_path)
+        assert spy.call_count == 1
+        decryption_backend.close()
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from p2kp2.buffers import read_into, wipe, looks_binary, binary_sample_size
+
+
+class TestWipe:
+    """Test: wipe..."""
+
+    def test_should_zero_the_buffer_in_place(self):
+        """... it should zero the buffer in place"""
+        buffer = bytearray(b"secret")
+        wipe(buffer)
+        assert buffer == bytearray(6)
+        wipe(bytearray())
+
+
+class TestLooksBinary:
+    """Test: looks_binary..."""
+
+    def test_should_tell_text_and_binary_apart(self):
+        """... it should tell text and binary apart"""
+        assert not looks_binary(b"pw\nuser: me\nnotes: caf\xc3\xa9\n")
+        assert not looks_binary(bytearray(b""))
+        assert looks_binary(b"pw\x00\n")
+        assert looks_binary(bytearray(b"\x30\x82\x01\xff"))
+
+    @pytest.mark.parametrize("data", [b"\xc0\x80", b"\xe0\x80\x80", b"\xed\xa0\x80", b"\xf4\x90\x80\x80", b"\xe2\x82"])
+    def test_should_find_out_malformed_utf8(self, data):
+        """... it should find out malformed utf8"""
+        with pytest.raises(UnicodeDecodeError):
+            data.decode("utf-8")
+        assert looks_binary(bytearray(data))
+
+    def test_should_only_look_at_the_start(self):
+        """... it should only look at the start"""
+        assert not looks_binary(b"a" * binary_sample_size + b"\xff\x00")
+        # a character cut by the end of the sample is still valid text
+        assert not looks_binary(b"a" * (binary_sample_size - 1) + "\u00e9".encode("utf-8"))
+
+
+class TestReadInto:
+    """Test: read_into..."""
+
+    def test_should_read_the_whole_stream(self):
+        """... it should read the whole stream"""
+        data = bytes(range(256)) * 20
+        buffer = read_into(io.BytesIO(data), size_hint=10)
+        assert type(buffer) is bytearray
+        assert buffer == data
+        assert read_into(io.BytesIO(b"")) == bytearray()
+
+    def test_should_wipe_the_buffers_it_outgrows(self, mocker):
+        """... it should wipe the buffers it outgrows"""
+        wiped = []
+        mocker.patch("p2kp2.buffers.wipe", side_effect=lambda buffer: wiped.append(bytes(buffer)) or wipe(buffer))
+        read_into(io.BytesIO(b"x" * 1000), size_hint=10)
+        # grown from 256 to 512 and 1024 bytes, then shrunk to 1000
+        assert [len(x) for x in wiped] == [256, 512, 1024]
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2 import P2KP2, PassReader, BatchMapper, CustomMapperExecException
+from p2kp2.checkpoint import Checkpoint, CheckpointException, journal_path
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.pipeline import convert
+from tests.conftest import test_db_file, test_pass
+
+
+def broken_on_test2_mapper(entry):
+    if entry.title == "test2":
+        raise ValueError("broken")
+    return entry
+
+
+@pytest.fixture
+def remove_journal():
+    """Delete the test db journal after the test."""
+    yield
+    if os.path.exists(journal_path(test_db_file)):
+        os.remove(journal_path(test_db_file))
+
+
+def db_titles():
+    return sorted(x.title for x in PyKeePass(test_db_file, password=test_pass).entries)
+
+
+@pytest.mark.usefixtures("reset_db_every_test", "remove_journal")
+class TestCheckpoint:
+    """Test: Checkpoint..."""
+
+    def test_should_save_the_db_and_the_journal_when_interrupted(self):
+        """... it should save the db and the journal when interrupted"""
+        reader = PassReader(path="tests/password-store", mapper=broken_on_test2_mapper)
+        writer = P2KP2(password=test_pass, destination=test_db_file, checkpoint=Checkpoint(test_db_file))
+        with pytest.raises(CustomMapperExecException):
+            convert(reader, writer)
+        assert db_titles() == ["test1", "test3"]
+        with open(journal_path(test_db_file)) as f:
+            assert json.loads(f.readline()) == {"entries": [["test1", [], "test1"], ["docs/test3", ["docs"], "test3"]]}
+
+    def test_should_resume_without_converting_any_entry_twice(self):
+        """... it should resume without converting any entry twice"""
+        reader = PassReader(path="tests/password-store", mapper=broken_on_test2_mapper)
+        writer = P2KP2(password=test_pass, destination=test_db_file, checkpoint=Checkpoint(test_db_file))
+        with pytest.raises(CustomMapperExecException):
+            convert(reader, writer)
+        reader = PassReader(path="tests/password-store")
+        checkpoint = Checkpoint(test_db_file)
+        writer = P2KP2(password=test_pass, destination=test_db_file, sync=True, checkpoint=checkpoint)
+        done = checkpoint.resume(writer)
+        assert done == {"test1", "docs/test3"}
+        left = [x for x in reader.get_pass_entries() if x not in done]
+        assert convert(reader, writer, entries_name=left) == 2
+        assert db_titles() == ["test1", "test2", "test3", "test4"]
+        assert not checkpoint.exists()
+
+    @pytest.mark.parametrize("bulk", [False, True])
+    def test_should_not_save_an_entry_it_failed_to_add(self, bulk):
+        """... it should not save an entry it failed to add"""
+        def unwritable_test2_mapper(entry):
+            if entry.title == "test2":
+                # no valid XML can hold it: the keepass entry fails once it's already created
+                entry.custom_properties["broken"] = "\x01"
+            return entry
+        reader = PassReader(path="tests/password-store", mapper=unwritable_test2_mapper)
+        writer = P2KP2(password=test_pass, destination=test_db_file, bulk=bulk, checkpoint=Checkpoint(test_db_file))
+        writer.bulk_size = 2
+        with pytest.raises(ValueError):
+            convert(reader, writer)
+        assert db_titles() == ["test1", "test3"]
+        checkpoint = Checkpoint(test_db_file)
+        writer = P2KP2(password=test_pass, destination=test_db_file, sync=True, checkpoint=checkpoint)
+        done = checkpoint.resume(writer)
+        assert done == {"test1", "docs/test3"}
+        reader = PassReader(path="tests/password-store")
+        convert(reader, writer, entries_name=[x for x in reader.get_pass_entries() if x not in done])
+        assert db_titles() == ["test1", "test2", "test3", "test4"]
+
+    def test_should_save_the_db_at_every_interval(self, mocker):
+        """... it should save the db at every interval"""
+        reader = PassReader(path="tests/password-store")
+        checkpoint = Checkpoint(test_db_file, interval=60)
+        mocker.patch.object(checkpoint, "due", return_value=True)
+        writer = P2KP2(password=test_pass, destination=test_db_file, checkpoint=checkpoint)
+        commit = mocker.spy(checkpoint, "commit")
+        convert(reader, writer)
+        # one save after every entry, then the final one
+        assert commit.call_count == 5
+        assert db_titles() == ["test1", "test2", "test3", "test4"]
+        assert not checkpoint.exists()
+
+    def test_should_look_up_the_entries_of_the_last_journal_line(self):
+        """... it should look up the entries of the last journal line"""
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        writer.db.add_entry(writer.get_group(["web"]), "test2", "", "")
+        with open(journal_path(test_db_file), "w") as f:
+            f.write(json.dumps({"entries": [["test1", [], "test1"]]}) + "\n")
+            f.write(json.dumps({"entries": [["web/test2", ["web"], "test2"], ["test3", [], "test3"]]}) + "\n")
+            f.write('{"entries": [["web/te')
+        checkpoint = Checkpoint(test_db_file)
+        assert checkpoint.resume(writer) == {"test1", "web/test2"}
+        # the journal is compacted, so that test3 is never taken for done
+        with open(checkpoint.path) as f:
+            assert f.read() == json.dumps({"done": ["test1", "web/test2"]}) + "\n"
+        assert checkpoint.resume(writer) == {"test1", "web/test2"}
+
+    def test_should_refuse_a_batch_mapper(self):
+        """... it should refuse a batch mapper"""
+        reader = PassReader(path="tests/password-store", mapper=BatchMapper(lambda entries: entries))
+        writer = P2KP2(password=test_pass, destination=test_db_file, checkpoint=Checkpoint(test_db_file))
+        with pytest.raises(CheckpointException):
+            convert(reader, writer)
+
+    def test_should_refuse_more_entries_than_read(self):
+        """... it should refuse more entries than read"""
+        reader = PassReader(path="tests/password-store")
+        reader.parse_db()
+        checkpoint = Checkpoint(test_db_file)
+        checkpoint.start(["test1"])
+        checkpoint.record(reader.entries[0])
+        with pytest.raises(CheckpointException):
+            checkpoint.record(reader.entries[1])
+
+
+@pytest.mark.usefixtures("reset_db_every_test", "remove_journal")
+class TestResumeOption:
+    """Test: --resume..."""
+
+    def test_should_refuse_to_resume_without_a_journal(self, monkeypatch, mocker):
+        """... it should refuse to resume without a journal"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-o", test_db_file, "--resume"])
+        mocker.patch("p2kp2.pass2keepass2.exec_quick_mode")
+        with pytest.raises(SystemExit):
+            main_func()
+
+    def test_should_refuse_to_checkpoint_a_sync(self, monkeypatch, mocker):
+        """... it should refuse to checkpoint a sync"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-o", test_db_file, "--sync", "--checkpoint", "5"])
+        mocker.patch("p2kp2.pass2keepass2.exec_quick_mode")
+        with pytest.raises(SystemExit):
+            main_func()
+
+    def test_should_complete_an_interrupted_conversion(self, monkeypatch, tmp_path):
+        """... it should complete an interrupted conversion"""
+        mapper = tmp_path / "mapper.py"
+        mapper.write_text("def custom_mapper(entry):\n"
+                          "    if entry.title == 'test2':\n"
+                          "        raise Exception\n"
+                          "    return entry\n")
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", test_db_file,
+                                          "-c", str(mapper), "--checkpoint", "60"])
+        with pytest.raises(SystemExit):
+            main_func()
+        assert os.path.exists(journal_path(test_db_file))
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", test_db_file,
+                                          "--resume"])
+        main_func()
+        assert db_titles() == ["test1", "test2", "test3", "test4"]
+        assert not os.path.exists(journal_path(test_db_file))
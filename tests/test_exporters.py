@@ -0,0 +1,142 @@
+import csv
+import os
+import stat
+import sys
+
+import pytest
+from lxml import etree
+
+from p2kp2 import PassReader, DbAlreadyExistsException
+from p2kp2.exporters import KeePassXmlWriter, CsvWriter
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.pipeline import convert
+from tests.conftest import test_pass
+
+
+@pytest.fixture(scope="module")
+def reader():
+    reader = PassReader(path="tests/password-store")
+    reader.parse_db()
+    return reader
+
+
+def entry_strings(entry) -> dict:
+    return {x.findtext("Key"): x.findtext("Value") for x in entry.findall("String")}
+
+
+class TestKeePassXmlWriter:
+    """Test: KeePassXmlWriter..."""
+
+    def test_should_nest_the_entries_in_their_groups(self, reader, tmp_path):
+        """... it should nest the entries in their groups"""
+        destination = str(tmp_path / "pass.xml")
+        KeePassXmlWriter(destination=destination).populate_db(reader)
+        root = etree.parse(destination).getroot()
+        assert root.tag == "KeePassFile"
+        titles = {}
+        for entry in root.iter("Entry"):
+            path = [x.findtext("Name") for x in entry.iterancestors("Group")][::-1]
+            titles[entry_strings(entry)["Title"]] = path
+        assert titles == {"test1": ["Root"], "test3": ["Root", "docs"], "test2": ["Root", "web"],
+                          "test4": ["Root", "web", "emails"]}
+
+    def test_should_write_every_field(self, reader, tmp_path):
+        """... it should write every field"""
+        destination = str(tmp_path / "pass.xml")
+        KeePassXmlWriter(destination=destination).populate_db(reader)
+        entry = etree.parse(destination).getroot().find("Root/Group/Entry")
+        assert entry_strings(entry) == {"Title": "test1", "UserName": "myusername", "Password": "somepassword",
+                                        "URL": "someurl.com", "Notes": "some notes something interesting",
+                                        "cell_number": "00000000"}
+        password = [x for x in entry.findall("String") if x.findtext("Key") == "Password"][0]
+        assert password.find("Value").get("ProtectInMemory") == "True"
+
+    def test_should_open_a_closed_group_again_with_a_uuid_of_its_own(self, reader, tmp_path):
+        """... it should open a closed group again with a uuid of its own"""
+        destination = str(tmp_path / "pass.xml")
+        KeePassXmlWriter(destination=destination).populate_db([reader.entries[2], reader.entries[0],
+                                                              reader.entries[3]])
+        groups = etree.parse(destination).getroot().findall("Root/Group/Group")
+        assert [x.findtext("Name") for x in groups] == ["web", "web"]
+        assert groups[0].findtext("UUID") != groups[1].findtext("UUID")
+        uuids = [x.text for x in etree.parse(destination).getroot().iter("UUID")]
+        assert len(set(uuids)) == len(uuids)
+
+
+class TestCsvWriter:
+    """Test: CsvWriter..."""
+
+    def test_should_write_a_row_for_every_entry(self, reader, tmp_path):
+        """... it should write a row for every entry"""
+        destination = str(tmp_path / "pass.csv")
+        CsvWriter(destination=destination).populate_db(reader)
+        with open(destination, newline="") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["Group", "Title", "Username", "Password", "URL", "Notes"]
+        assert rows[1] == ["Root", "test1", "myusername", "somepassword", "someurl.com",
+                           "some notes something interesting\ncell_number: 00000000"]
+        assert [x[:2] for x in rows[2:]] == [["Root/docs", "test3"], ["Root/web", "test2"],
+                                             ["Root/web/emails", "test4"]]
+
+
+@pytest.mark.parametrize("writer_class", [KeePassXmlWriter, CsvWriter])
+class TestStreamWriter:
+    """Test: StreamWriter..."""
+
+    def test_should_not_overwrite_an_existing_file(self, writer_class, tmp_path):
+        """... it should not overwrite an existing file"""
+        destination = tmp_path / "pass.out"
+        destination.write_text("")
+        with pytest.raises(DbAlreadyExistsException):
+            writer_class(destination=str(destination))
+        writer_class(destination=str(destination), overwrite=True)
+
+    def test_should_leave_the_destination_untouched_when_interrupted(self, writer_class, reader, tmp_path):
+        """... it should leave the destination untouched when interrupted"""
+        destination = tmp_path / "pass.out"
+        destination.write_text("old")
+
+        def entries():
+            yield reader.entries[0]
+            raise ValueError("broken")
+        with pytest.raises(ValueError):
+            writer_class(destination=str(destination), overwrite=True).populate_db(entries())
+        assert destination.read_text() == "old"
+        assert os.listdir(tmp_path) == ["pass.out"]
+
+    def test_should_only_let_the_owner_read_the_file(self, writer_class, reader, tmp_path):
+        """... it should only let the owner read the file"""
+        destination = str(tmp_path / "pass.out")
+        writer_class(destination=destination).populate_db(reader)
+        assert stat.S_IMODE(os.stat(destination).st_mode) == 0o600
+
+    def test_should_stream_the_entries_of_a_conversion(self, writer_class, tmp_path):
+        """... it should stream the entries of a conversion"""
+        writer = writer_class(destination=str(tmp_path / "pass.out"))
+        events = []
+        writer.event_stream.subscribe(events.append)
+        writer.event_step = 3
+        assert convert(PassReader(path="tests/password-store"), writer) == 4
+        assert events == [3, 4]
+
+
+class TestFormatOption:
+    """Test: --format..."""
+
+    def test_should_write_the_chosen_format(self, monkeypatch, tmp_path):
+        """... it should write the chosen format"""
+        destination = str(tmp_path / "pass.csv")
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", destination,
+                                          "--format", "csv"])
+        main_func()
+        with open(destination, newline="") as f:
+            assert len(list(csv.reader(f))) == 5
+
+    def test_should_refuse_the_keepass_options(self, monkeypatch, mocker):
+        """... it should refuse the keepass options"""
+        mocker.patch("p2kp2.pass2keepass2.exec_quick_mode")
+        for option in [["--sync"], ["--bulk"], ["--checkpoint", "5"], ["--kdf", "aes"]]:
+            monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "--format", "xml"] + option)
+            with pytest.raises(SystemExit):
+                main_func()
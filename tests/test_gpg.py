@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from p2kp2.gpg import GpgSession, GpgSessionPool, GpgSessionException
+
+
+test1_plaintext = b'somepassword\n---\nurl: someurl.com\nuser: myusername\nnotes: some notes something ' \
+                  b'interesting\ncell_number: 00000000\n'
+
+
+class TestGpgSession:
+    """Test: GpgSession..."""
+
+    session: GpgSession
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestGpgSession setup"""
+        request.cls.session = GpgSession(gpg_opts=["--quiet", "--batch"])
+        yield
+        request.cls.session.close()
+
+    def test_should_decrypt_a_file(self):
+        """... it should decrypt a file"""
+        assert self.session.decrypt("tests/password-store/test1.gpg") == test1_plaintext
+
+    def test_should_decrypt_many_files_with_the_same_process(self):
+        """... it should decrypt many files with the same process"""
+        pid = self.session._process.pid
+        assert self.session.decrypt("tests/password-store/web/test2.gpg") == b'],O}DLHRZ]8UTg4jv\'JC"r<Y*\n'
+        assert self.session.decrypt("tests/password-store/test1.gpg") == test1_plaintext
+        assert self.session._process.pid == pid
+
+    def test_should_raise_an_exception_when_the_file_is_not_there(self):
+        """... it should raise an exception when the file is not there"""
+        with pytest.raises(FileNotFoundError):
+            self.session.decrypt("tests/password-store/not_there.gpg")
+
+    def test_should_raise_an_exception_and_keep_working_when_a_file_cannot_be_decrypted(self):
+        """... it should raise an exception and keep working when a file cannot be decrypted"""
+        with pytest.raises(GpgSessionException):
+            self.session.decrypt("tests/password-store/.gpg-id")
+        assert self.session.decrypt("tests/password-store/test1.gpg") == test1_plaintext
+
+    def test_should_accept_a_password_without_putting_it_in_the_arguments(self):
+        """... it should accept a password without putting it in the arguments"""
+        with GpgSession(gpg_opts=["--quiet", "--batch"], password="pass2keepass2") as session:
+            assert "pass2keepass2" not in " ".join(session._process.args)
+            assert session.decrypt("tests/password-store-with-pass/test1.gpg") == \
+                b'F_Yq^5vgeyMCgYf-tW\\!T7Uj|\n---\nurl: someurl.com\n'
+
+    def test_should_refuse_to_work_once_closed(self):
+        """... it should refuse to work once closed"""
+        session = GpgSession(gpg_opts=["--quiet", "--batch"])
+        session.close()
+        assert session.closed
+        with pytest.raises(GpgSessionException):
+            session.decrypt("tests/password-store/test1.gpg")
+
+
+class TestGpgSessionPool:
+    """Test: GpgSessionPool..."""
+
+    def test_should_never_start_more_sessions_than_its_size(self):
+        """... it should never start more sessions than its size"""
+        pool = GpgSessionPool(size=2, gpg_opts=["--quiet", "--batch"])
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(pool.decrypt, ["tests/password-store/test1.gpg"] * 8))
+        assert results == [test1_plaintext] * 8
+        assert 0 < len(pool._sessions) <= 2
+        pool.close()
+        assert pool._sessions == []
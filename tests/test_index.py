@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from p2kp2.index import StoreIndex, IndexEntry
+
+
+class TestStoreIndex:
+    """Test: StoreIndex..."""
+
+    index: StoreIndex
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestStoreIndex setup"""
+        request.cls.index = StoreIndex(os.path.abspath("tests/password-store"))
+
+    def test_should_list_folder_entries_before_sub_folders_ones(self):
+        """... it should list folder entries before sub-folders ones"""
+        assert self.index.names() == ["test1", "docs/test3", "web/test2", "web/emails/test4"]
+
+    def test_should_expose_the_number_of_entries(self):
+        """... it should expose the number of entries"""
+        assert len(self.index) == 4
+
+    def test_should_skip_hidden_files(self):
+        """... it should skip hidden files"""
+        assert all(not os.path.basename(x.path).startswith(".") for x in self.index)
+
+    def test_should_record_path_size_mtime_and_groups(self):
+        """... it should record path, size, mtime and groups"""
+        entry: IndexEntry = self.index.entries[-1]
+        stat = os.stat("tests/password-store/web/emails/test4.gpg")
+        assert entry.path == os.path.abspath("tests/password-store/web/emails/test4.gpg")
+        assert entry.size == stat.st_size
+        assert entry.mtime_ns == stat.st_mtime_ns
+        assert entry.groups == ("web", "emails")
+
+    def test_should_list_every_group_path_once(self):
+        """... it should list every group path once"""
+        assert self.index.groups() == [(), ("docs",), ("web",), ("web", "emails")]
@@ -0,0 +1,59 @@
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2.kdf import AesKdf, Argon2Kdf, KdfNotSupportedException, calibrate, check_kdf, get_kdf, set_kdf
+from p2kp2.writer import empty_db_path, empty_kdbx4_db_path
+
+
+class TestKdfSettings:
+    """Test: kdf settings..."""
+
+    def test_should_read_the_kdf_of_a_kdbx3_db(self):
+        """... it should read the kdf of a kdbx3 db"""
+        assert isinstance(get_kdf(PyKeePass(empty_db_path)), AesKdf)
+
+    def test_should_read_the_kdf_of_a_kdbx4_db(self):
+        """... it should read the kdf of a kdbx4 db"""
+        assert isinstance(get_kdf(PyKeePass(empty_kdbx4_db_path)), Argon2Kdf)
+
+    def test_should_change_the_kdf_parameters(self):
+        """... it should change the kdf parameters"""
+        kp = PyKeePass(empty_kdbx4_db_path)
+        kdf = Argon2Kdf(memory=2048, iterations=4, parallelism=2, variant="argon2id")
+        set_kdf(kp, kdf)
+        assert get_kdf(kp) == kdf
+
+    def test_should_not_switch_between_kdfs(self):
+        """... it should not switch between kdfs"""
+        with pytest.raises(KdfNotSupportedException):
+            set_kdf(PyKeePass(empty_db_path), Argon2Kdf())
+
+    @pytest.mark.parametrize("kdf", [AesKdf(rounds=0), Argon2Kdf(iterations=0), Argon2Kdf(variant="argon2i"),
+                                     Argon2Kdf(memory=8, parallelism=2)])
+    def test_should_reject_invalid_settings(self, kdf):
+        """... it should reject invalid settings"""
+        with pytest.raises(ValueError):
+            check_kdf(kdf)
+
+
+class TestKdfCalibration:
+    """Test: kdf calibration..."""
+
+    def test_should_tune_aes_kdf_rounds(self):
+        """... it should tune aes kdf rounds"""
+        fast = calibrate(AesKdf(), 50)
+        slow = calibrate(AesKdf(), 200)
+        assert isinstance(fast, AesKdf)
+        assert slow.rounds > fast.rounds
+
+    def test_should_only_tune_argon2_iterations(self):
+        """... it should only tune argon2 iterations"""
+        kdf = Argon2Kdf(memory=1024, iterations=1, parallelism=1)
+        calibrated = calibrate(kdf, 100)
+        assert calibrated.iterations >= 1
+        assert calibrated._replace(iterations=1) == kdf
+
+    def test_should_reject_a_non_positive_target(self):
+        """... it should reject a non positive target"""
+        with pytest.raises(ValueError):
+            calibrate(AesKdf(), 0)
@@ -0,0 +1,208 @@
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+from lxml import etree
+from pykeepass import PyKeePass
+
+from p2kp2 import PassReader, P2KP2, CustomMapperExecException
+from p2kp2.exporters import KeePassXmlWriter
+from p2kp2.merge import MergedReader, check_mounts, default_prefix, mount_path
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.pipeline import convert
+from tests.conftest import test_pass
+
+store_names = ["test1", "docs/test3", "web/test2", "web/emails/test4"]
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two disposable copies of the test password-store."""
+    paths = []
+    for name in ["personal", "team"]:
+        path = tmp_path / name
+        shutil.copytree("tests/password-store", path)
+        paths.append(str(path))
+    return paths
+
+
+def merged_reader(stores, prefixes=("personal", "team/infra"), **kwargs) -> MergedReader:
+    return MergedReader([(prefix, PassReader(path=path, **kwargs)) for prefix, path in zip(prefixes, stores)])
+
+
+class TestMounts:
+    """Test: store mounts..."""
+
+    def test_should_turn_prefixes_into_group_paths(self):
+        """... it should turn prefixes into group paths"""
+        assert mount_path("team/infra/") == ("team", "infra")
+        assert mount_path("") == ()
+        assert default_prefix("~/.password-store/") == "password-store"
+
+    @pytest.mark.parametrize("prefixes", [["a", "a"], ["a", "a/b"], ["", "a"]])
+    def test_should_refuse_overlapping_prefixes(self, prefixes):
+        """... it should refuse overlapping prefixes"""
+        with pytest.raises(ValueError):
+            check_mounts(prefixes)
+        check_mounts(["a", "ab", "b/a"])
+        check_mounts([""])
+
+
+class TestMergedReader:
+    """Test: MergedReader..."""
+
+    def test_should_mount_every_store_under_its_prefix(self, stores):
+        """... it should mount every store under its prefix"""
+        reader = merged_reader(stores)
+        expected = [f"personal/{x}" for x in store_names] + [f"team/infra/{x}" for x in store_names]
+        assert reader.get_pass_entries() == expected
+        assert reader.index.groups()[:2] == [("personal",), ("personal", "docs")]
+        events = []
+        reader.event_stream.subscribe(events.append)
+        reader.parse_db()
+        assert sorted(x.name for x in reader.entries) == sorted(expected)
+        assert events == list(range(1, 9))
+
+    def test_should_read_only_the_given_entries(self, stores):
+        """... it should read only the given entries"""
+        reader = merged_reader(stores)
+        names = ["team/infra/web/test2", "personal/test1"]
+        assert sorted(x.name for x in reader.iter_entries(names)) == sorted(names)
+        with pytest.raises(FileNotFoundError):
+            list(reader.iter_entries(["team/test1"]))
+
+    def test_should_decrypt_the_stores_concurrently(self, stores):
+        """... it should decrypt the stores concurrently"""
+        barrier = threading.Barrier(2, timeout=10)
+
+        def waiting_mapper(entry):
+            # every store waits for the other one with its first entry
+            if entry.name == "test1":
+                barrier.wait()
+            return entry
+        reader = merged_reader(stores, mapper=waiting_mapper)
+        assert len(list(reader.iter_entries())) == 8
+
+    def test_should_keep_decrypting_a_store_while_another_one_is_read(self, stores):
+        """... it should keep decrypting a store while another one is read"""
+        team_done = threading.Event()
+
+        def personal_mapper(entry):
+            # the first store only goes on once the second one is fully decrypted
+            if entry.name == "docs/test3":
+                assert team_done.wait(timeout=10)
+            return entry
+
+        def team_mapper(entry):
+            if entry.name == "web/emails/test4":
+                team_done.set()
+            return entry
+        reader = MergedReader([("personal", PassReader(path=stores[0], mapper=personal_mapper)),
+                               ("team", PassReader(path=stores[1], mapper=team_mapper))], queue_size=1)
+        names = [x.name for x in reader.iter_entries()]
+        assert sorted(names) == sorted([f"personal/{x}" for x in store_names] + [f"team/{x}" for x in store_names])
+
+    def test_should_keep_every_store_in_one_piece(self, stores):
+        """... it should keep every store in one piece"""
+        def slow_mapper(entry):
+            # the first store is still decrypting when the second one is done
+            time.sleep(0.2)
+            return entry
+        reader = MergedReader([("personal", PassReader(path=stores[0], mapper=slow_mapper)),
+                               ("team", PassReader(path=stores[1]))], contiguous=True)
+        names = [x.name for x in reader.iter_entries()]
+        assert names == [f"personal/{x}" for x in store_names] + [f"team/{x}" for x in store_names]
+
+    def test_should_write_every_store_as_a_single_xml_group(self, stores, tmp_path):
+        """... it should write every store as a single xml group"""
+        destination = str(tmp_path / "merged.xml")
+        assert convert(merged_reader(stores, prefixes=("personal", "team")),
+                       KeePassXmlWriter(destination=destination)) == 8
+        root = etree.parse(destination).find("Root/Group")
+        assert [x.findtext("Name") for x in root.findall("Group")] == ["personal", "team"]
+
+    @pytest.mark.parametrize("contiguous", [False, True])
+    def test_should_stop_all_the_stores_at_the_first_error(self, stores, contiguous):
+        """... it should stop all the stores at the first error"""
+        def broken_mapper(entry):
+            if entry.name == "web/test2":
+                raise Exception
+            return entry
+
+        def slow_mapper(entry):
+            # the first store is still decrypting when the second one fails
+            if entry.name == "docs/test3":
+                time.sleep(1)
+            return entry
+        reader = MergedReader([("personal", PassReader(path=stores[0], mapper=slow_mapper)),
+                               ("team", PassReader(path=stores[1], mapper=broken_mapper))], contiguous=contiguous)
+        names = []
+        with pytest.raises(CustomMapperExecException):
+            for entry in reader.iter_entries():
+                names.append(entry.name)
+        assert [x for x in names if x.startswith("personal/")] == ["personal/test1"]
+
+    def test_should_feed_a_single_writer_saved_once(self, stores, tmp_path, mocker):
+        """... it should feed a single writer saved once"""
+        destination = str(tmp_path / "merged.kdbx")
+        writer = P2KP2(password=test_pass, destination=destination)
+        save = mocker.spy(writer, "save")
+        assert convert(merged_reader(stores), writer) == 8
+        assert save.call_count == 1
+        db = PyKeePass(destination, password=test_pass)
+        assert sorted(x.group.path for x in db.find_entries(title="test4")) == \
+            [["personal", "web", "emails"], ["team", "infra", "web", "emails"]]
+        assert len(db.entries) == 8
+
+
+    def test_should_hand_its_parsed_entries_to_every_writer(self, stores, tmp_path):
+        """... it should hand its parsed entries to every writer"""
+        reader = merged_reader(stores)
+        reader.parse_db()
+        destination = str(tmp_path / "merged.kdbx")
+        writer = P2KP2(password=test_pass, destination=destination)
+        writer.populate_db(reader)
+        writer.save()
+        assert len(PyKeePass(destination, password=test_pass).entries) == 8
+        destination = str(tmp_path / "merged.xml")
+        KeePassXmlWriter(destination=destination).populate_db(reader)
+        assert len(etree.parse(destination).findall("//Entry")) == 8
+
+
+class TestMultipleInputs:
+    """Test: many -i options..."""
+
+    def test_should_merge_the_stores_into_a_single_db(self, stores, tmp_path, monkeypatch):
+        """... it should merge the stores into a single db"""
+        destination = str(tmp_path / "merged.kdbx")
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", stores[0], "-i", f"team/infra={stores[1]}",
+                                          "-o", destination, "-j", "2"])
+        main_func()
+        db = PyKeePass(destination, password=test_pass)
+        assert sorted(x.path[0] for x in db.root_group.subgroups) == ["personal", "team"]
+        assert len(db.entries) == 8
+
+    def test_should_keep_a_single_store_as_it_is(self, monkeypatch, mocker):
+        """... it should keep a single store as it is"""
+        normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-i", "tests/password-store"])
+        main_func()
+        args = normal_mode.call_args[0][0]
+        assert (args.input, args.stores) == ("tests/password-store", None)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-i", "mine=tests/password-store"])
+        main_func()
+        args = normal_mode.call_args[0][0]
+        assert (args.input, args.stores) == (None, [("mine", "tests/password-store")])
+
+    @pytest.mark.parametrize("options", [["-i", "a=x", "-i", "a=y"], ["-i", "a=x", "--sync"],
+                                         ["-i", "x", "-i", "y", "--reverse", "-o", "store"]])
+    def test_should_refuse_what_it_cannot_merge(self, monkeypatch, mocker, options):
+        """... it should refuse what it cannot merge"""
+        mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        mocker.patch("p2kp2.pass2keepass2.exec_reverse_mode")
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2"] + options)
+        with pytest.raises(SystemExit):
+            main_func()
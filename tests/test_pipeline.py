@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2 import P2KP2, PassReader, CustomMapperExecException
+from p2kp2.pipeline import convert
+from tests.conftest import test_db_file, test_pass
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestConvert:
+    """Test: convert..."""
+
+    def test_should_write_every_entry_read(self):
+        """... it should write every entry read"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        assert convert(reader, writer) == 4
+        db = PyKeePass(test_db_file, password=test_pass)
+        assert sorted(x.title for x in db.entries) == ["test1", "test2", "test3", "test4"]
+
+    def test_should_leave_no_empty_group_behind_a_mapper(self):
+        """... it should leave no empty group behind a mapper"""
+        def flat_mapper(entry):
+            entry.groups = []
+            return entry
+        reader = PassReader(path="tests/password-store", mapper=flat_mapper)
+        assert convert(reader, P2KP2(password=test_pass, destination=test_db_file)) == 4
+        db = PyKeePass(test_db_file, password=test_pass)
+        assert db.root_group.subgroups == []
+        assert len(db.root_group.entries) == 4
+
+    def test_should_never_queue_more_entries_than_allowed(self):
+        """... it should never queue more entries than allowed"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        read, written, lag = [0], [0], []
+        reader.event_stream.subscribe(lambda i: read.__setitem__(0, i))
+
+        def on_written(i):
+            written[0] = i
+            lag.append(read[0] - written[0])
+        writer.event_stream.subscribe(on_written)
+        convert(reader, writer, queue_size=1)
+        # one entry in the queue, one being put in it by the reader
+        assert max(lag) <= 2
+
+    def test_should_raise_the_reader_exceptions(self):
+        """... it should raise the reader exceptions"""
+        def custom_broken_mapper(_):
+            raise Exception
+        reader = PassReader(path="tests/password-store", mapper=custom_broken_mapper)
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        with pytest.raises(CustomMapperExecException):
+            convert(reader, writer)
+        assert len(writer.db.entries) == 0
+
+    def test_should_stop_the_reader_when_the_writer_fails(self, mocker):
+        """... it should stop the reader when the writer fails"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        mocker.patch.object(writer, "add_entry", side_effect=RuntimeError)
+        with pytest.raises(RuntimeError):
+            convert(reader, writer, queue_size=1)
+        assert "p2kp2-reader" not in [t.name for t in threading.enumerate()]
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from p2kp2 import PassReader, P2KP2
+from p2kp2.profiling import Profiler, NullProfiler, percentile
+from tests.conftest import test_db_file, test_pass
+
+
+class TestProfiler:
+    """Test: Profiler..."""
+
+    def test_should_record_calls_and_total_time_of_every_stage(self):
+        """... it should record calls and total time of every stage"""
+        profiler = Profiler()
+        profiler.record("decrypt", 0.5, "a")
+        profiler.record("decrypt", 1.5, "b")
+        stage = profiler.report()["stages"]["decrypt"]
+        assert stage["calls"] == 2
+        assert stage["total"] == 2
+        assert stage["mean"] == 1
+        assert stage["max"] == 1.5
+
+    def test_should_record_the_time_spent_on_every_entry(self):
+        """... it should record the time spent on every entry"""
+        profiler = Profiler()
+        profiler.record("insert", 0.25, "web/test2")
+        profiler.record("insert", 0.25, "web/test2")
+        profiler.record("save", 1)
+        assert profiler.report()["entries"] == {"web/test2": {"insert": 0.5}}
+
+    def test_should_measure_a_block(self):
+        """... it should measure a block"""
+        profiler = Profiler()
+        with pytest.raises(ValueError):
+            with profiler.measure("map", "test1"):
+                raise ValueError()
+        assert profiler.report()["stages"]["map"]["calls"] == 1
+
+    def test_should_list_stages_in_conversion_order(self):
+        """... it should list stages in conversion order"""
+        profiler = Profiler()
+        for stage in ["save", "scan", "insert"]:
+            profiler.record(stage, 0)
+        assert list(profiler.report()["stages"]) == ["scan", "insert", "save"]
+
+    def test_should_compute_nearest_rank_percentiles(self):
+        """... it should compute nearest rank percentiles"""
+        values = [float(x) for x in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([3.0], 90) == 3
+
+    def test_should_print_a_summary_table(self):
+        """... it should print a summary table"""
+        profiler = Profiler()
+        profiler.record("parse", 0.001)
+        summary = profiler.summary()
+        assert "parse" in summary
+        assert "wall time" in summary
+
+    def test_should_record_nothing_when_disabled(self):
+        """... it should record nothing when disabled"""
+        profiler = NullProfiler()
+        with profiler.measure("scan"):
+            pass
+        assert profiler.report()["stages"] == {}
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestProfiledConversion:
+    """Test: profiled conversion..."""
+
+    def test_should_profile_every_stage_and_entry(self):
+        """... it should profile every stage and entry"""
+        profiler = Profiler()
+        reader = PassReader(path="tests/password-store", mapper=lambda x: x, profiler=profiler)
+        reader.parse_db()
+        writer = P2KP2(password=test_pass, destination=test_db_file, profiler=profiler)
+        writer.populate_db(reader)
+        report = profiler.report()
+        assert list(report["stages"]) == ["scan", "decrypt", "parse", "map", "group lookup", "insert", "save"]
+        assert report["stages"]["decrypt"]["calls"] == 4
+        assert set(report["entries"]) == set(reader.get_pass_entries())
+
+    def test_should_keep_the_bulk_inserts_apart(self):
+        """... it should keep the bulk inserts apart"""
+        profiler = Profiler()
+        reader = PassReader(path="tests/password-store")
+        reader.parse_db()
+        writer = P2KP2(password=test_pass, destination=test_db_file, bulk=True, profiler=profiler)
+        writer.populate_db(reader)
+        report = profiler.report()
+        assert list(report["stages"]) == ["group lookup", "bulk build", "bulk attach", "save"]
+        assert report["stages"]["bulk build"]["calls"] == 1
+        # a single call for every group holding entries
+        assert report["stages"]["bulk attach"]["calls"] == len(set(tuple(x.groups) for x in reader.entries))
+
+    def test_should_never_include_secrets(self, tmp_path):
+        """... it should never include secrets"""
+        profiler = Profiler()
+        reader = PassReader(path="tests/password-store", profiler=profiler)
+        reader.parse_db()
+        P2KP2(password=test_pass, destination=test_db_file, profiler=profiler).populate_db(reader)
+        profiler.save(str(tmp_path / "profile.json"))
+        with open(str(tmp_path / "profile.json")) as f:
+            report = f.read()
+        json.loads(report)
+        assert test_pass not in report
+        for entry in reader.entries:
+            for secret in [entry.password, entry.user, entry.url, entry.notes] + list(entry.custom_properties.values()):
+                if secret != "":
+                    assert secret not in report
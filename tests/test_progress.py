@@ -0,0 +1,101 @@
+import io
+import json
+
+import pytest
+
+from p2kp2 import PassReader, P2KP2
+from p2kp2.pipeline import convert
+from p2kp2.progress import ProgressReporter, format_seconds
+from tests.conftest import test_db_file, test_pass
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestEventStep:
+    """Test: event_step..."""
+
+    def test_should_make_the_reader_fire_fewer_events(self):
+        """... it should make the reader fire fewer events"""
+        reader = PassReader(path="tests/password-store")
+        reader.event_step = 3
+        events = []
+        reader.event_stream.subscribe(events.append)
+        reader.parse_db()
+        assert events == [3, 4]
+
+    def test_should_make_the_writer_fire_fewer_events(self):
+        """... it should make the writer fire fewer events"""
+        reader = PassReader(path="tests/password-store")
+        reader.parse_db()
+        for bulk in [False, True]:
+            writer = P2KP2(password=test_pass, destination=test_db_file, overwrite=True, bulk=bulk)
+            writer.event_step = 2
+            events = []
+            writer.event_stream.subscribe(events.append)
+            writer.populate_db(reader)
+            assert events == [2, 4]
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestProgressReporter:
+    """Test: ProgressReporter..."""
+
+    def test_should_print_json_lines_when_instructed(self):
+        """... it should print json lines when instructed"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        stream = io.StringIO()
+        with ProgressReporter(reader, writer, mode="json", stream=stream):
+            convert(reader, writer)
+        last = json.loads(stream.getvalue().splitlines()[-1])
+        assert last["total"] == 4
+        assert last["read"]["count"] == 4
+        assert last["written"]["count"] == 4
+        assert last["written"]["eta"] == 0
+
+    def test_should_print_a_single_line_of_text_by_default(self):
+        """... it should print a single line of text by default"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        stream = io.StringIO()
+        with ProgressReporter(reader, writer, stream=stream):
+            convert(reader, writer)
+        output = stream.getvalue()
+        assert "\n" not in output
+        assert output.split("\r")[-2].startswith(" > Reading password-store... 100% (")
+        assert "Writing keepass database... 100% (" in output
+
+    def test_should_only_print_at_its_own_pace(self):
+        """... it should only print at its own pace"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        stream = io.StringIO()
+        with ProgressReporter(reader, writer, mode="json", interval=60, stream=stream):
+            convert(reader, writer)
+        # nothing in between, the final refresh only
+        assert len(stream.getvalue().splitlines()) == 1
+
+    def test_should_bound_the_number_of_events(self, mocker):
+        """... it should bound the number of events"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        mocker.patch("p2kp2.progress.max_events", 2)
+        ProgressReporter(reader, writer)
+        assert reader.event_step == 2
+        assert writer.event_step == 2
+
+    def test_should_refuse_an_unknown_mode(self):
+        """... it should refuse an unknown mode"""
+        reader = PassReader(path="tests/password-store")
+        writer = P2KP2(password=test_pass, destination=test_db_file)
+        with pytest.raises(ValueError):
+            ProgressReporter(reader, writer, mode="xml")
+
+
+class TestFormatSeconds:
+    """Test: format_seconds..."""
+
+    def test_should_format_minutes_and_hours(self):
+        """... it should format minutes and hours"""
+        assert format_seconds(5.7) == "00:05"
+        assert format_seconds(125) == "02:05"
+        assert format_seconds(3725) == "1:02:05"
@@ -3,7 +3,14 @@ from p2kp2.reader import EntryNotFoundException
 
 import pytest
 
-from p2kp2 import PassReader, PassEntry, CustomMapperExecException
+from p2kp2 import PassReader, PassEntry, BatchMapper, ProcessMapper, CustomMapperExecException
+from p2kp2.buffers import wipe as wipe_buffer
+from p2kp2.reader import load_custom_mapper
+from p2kp2.index import StoreIndex
+
+
+def entry_fields(entry: PassEntry) -> dict:
+    return {field: getattr(entry, field) for field in PassEntry.__slots__}
 
 
 class TestPassReaderInit:
@@ -38,6 +45,16 @@ class TestPassReaderInit:
         pr = PassReader(path="tests/password-store", mapper=custom_mapper)
         assert pr.mapper is custom_mapper
 
+    def test_should_decrypt_one_entry_at_a_time_by_default(self):
+        """... it should decrypt one entry at a time by default"""
+        pr = PassReader(path="tests/password-store")
+        assert pr.jobs == 1
+
+    def test_should_refuse_a_non_positive_number_of_jobs(self):
+        """... it should refuse a non positive number of jobs"""
+        with pytest.raises(ValueError):
+            PassReader(path="tests/password-store", jobs=0)
+
 
 class TestPassReader:
     """Test: PassReader..."""
@@ -45,9 +62,11 @@ class TestPassReader:
     pr: PassReader
 
     @pytest.fixture(scope="class", autouse=True)
-    def setup(self, request):
+    def setup(self, request, backend):
         """TestPassReader setup"""
-        request.cls.pr = PassReader(path="tests/password-store")
+        request.cls.pr = PassReader(path="tests/password-store", backend=backend)
+        yield
+        request.cls.pr.close()
 
     def test_get_pass_entries_should_return_the_list_of_pass_db_entries(self):
         """Pass reader get pass entries should return the list of pass db entries."""
@@ -57,6 +76,16 @@ class TestPassReader:
         assert "docs/test3" in entries
         assert "web/emails/test4" in entries
 
+    def test_should_scan_the_store_only_once(self, mocker):
+        """... it should scan the store only once"""
+        pr = PassReader(path="tests/password-store")
+        spy = mocker.spy(StoreIndex, "_scan")
+        assert len(pr.index) == 4
+        pr.get_pass_entries()
+        list(pr.iter_entries())
+        # one call for the root folder and one for each of its three sub-folders
+        assert spy.call_count == 4
+
     def test_parse_pass_entry_should_return_a_pass_entry_object(self):
         """Pass reader parse pass entry should return a PassEntry object."""
         entry = self.pr.parse_pass_entry("test1")
@@ -74,25 +103,230 @@ class TestPassReader:
         assert "test3" in entries_name
         assert "test4" in entries_name
 
-    def test_should_apply_the_mapper_when_provided(self):
+    def test_should_iterate_over_the_entries_without_keeping_them(self):
+        """... it should iterate over the entries without keeping them"""
+        pr = PassReader(path="tests/password-store")
+        events = []
+        pr.event_stream.subscribe(events.append)
+        titles = [x.title for x in pr.iter_entries()]
+        assert sorted(titles) == ["test1", "test2", "test3", "test4"]
+        assert events == [1, 2, 3, 4]
+        assert pr.entries == []
+
+    def test_should_apply_the_mapper_when_provided(self, backend):
         """... it should apply the mapper when provided"""
         def custom_mapper(entry: PassEntry) -> PassEntry:
             entry.title += "_modified"
             if 'cell_number' in entry.custom_properties:
                 entry.custom_properties["cell_number"] = "11111111"
             return entry
-        pr = PassReader(path="tests/password-store", mapper=custom_mapper)
+        pr = PassReader(path="tests/password-store", mapper=custom_mapper, backend=backend)
         entry = pr.parse_pass_entry("test1")
         assert entry.title == "test1_modified"
         assert entry.custom_properties['cell_number'] == "11111111"
 
-    def test_should_raise_an_exception_if_a_provided_custom_mapper_contains_errors(self):
+    def test_should_raise_an_exception_if_a_provided_custom_mapper_contains_errors(self, backend):
         """... it should raise an exception if a provided custom mapper contains errors"""
         def custom_broken_mapper(_):
             raise Exception
-        pr = PassReader(path="tests/password-store", mapper=custom_broken_mapper)
+        pr = PassReader(path="tests/password-store", mapper=custom_broken_mapper, backend=backend)
+        with pytest.raises(CustomMapperExecException) as e:
+            pr.parse_pass_entry("web/test2")
+        assert e.value.entry == "web/test2"
+
+
+class TestPassReaderWithWipedBuffers:
+    """Test: PassReader with wipe_buffers..."""
+
+    def test_should_parse_the_same_entries(self, backend):
+        """... it should parse the same entries"""
+        reader = PassReader(path="tests/password-store", backend=backend)
+        reader.parse_db()
+        wiped = PassReader(path="tests/password-store", backend=backend, wipe_buffers=True, jobs=2)
+        wiped.parse_db()
+        assert [entry_fields(x) for x in wiped.entries] == [entry_fields(x) for x in reader.entries]
+
+    def test_should_wipe_every_buffer_once_parsed(self, backend, mocker):
+        """... it should wipe every buffer once parsed"""
+        buffers = []
+
+        def tracked_wipe(buffer):
+            buffers.append(buffer)
+            wipe_buffer(buffer)
+        wipe = mocker.patch("p2kp2.reader.wipe", side_effect=tracked_wipe)
+        reader = PassReader(path="tests/password-store", backend=backend, wipe_buffers=True)
+        reader.parse_db()
+        assert wipe.call_count == 4
+        assert all(x == bytes(len(x)) and len(x) > 0 for x in buffers)
+
+
+class TestPassReaderWithBatchMapper:
+    """Test: PassReader with a batch mapper..."""
+
+    def test_should_hand_the_entries_to_the_mapper_in_chunks(self):
+        """... it should hand the entries to the mapper in chunks"""
+        chunks = []
+
+        def custom_batch_mapper(entries):
+            chunks.append([x.title for x in entries])
+            return entries
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(custom_batch_mapper, size=3))
+        pr.parse_db()
+        assert chunks == [["test1", "test3", "test2"], ["test4"]]
+        assert [x.title for x in pr.entries] == ["test1", "test3", "test2", "test4"]
+
+    def test_should_allow_the_mapper_to_drop_entries(self):
+        """... it should allow the mapper to drop entries"""
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(lambda entries: entries[1:], size=2))
+        pr.parse_db()
+        assert [x.title for x in pr.entries] == ["test3", "test4"]
+
+    def test_should_work_with_jobs(self, backend):
+        """... it should work with jobs"""
+        def custom_batch_mapper(entries):
+            for entry in entries:
+                entry.title += "_modified"
+            return entries
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(custom_batch_mapper, size=2), jobs=3,
+                        backend=backend)
+        pr.parse_db()
+        assert [x.title for x in pr.entries] == ["test1_modified", "test3_modified", "test2_modified",
+                                                 "test4_modified"]
+
+    def test_should_apply_the_mapper_to_a_single_entry(self):
+        """... it should apply the mapper to a single entry"""
+        def custom_batch_mapper(entries):
+            entries[0].title += "_modified"
+            return entries
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(custom_batch_mapper))
+        assert pr.parse_pass_entry("docs/test3").title == "test3_modified"
+
+    def test_should_identify_the_entry_the_mapper_failed_on(self):
+        """... it should identify the entry the mapper failed on"""
+        def custom_batch_mapper(entries):
+            for entry in entries:
+                if entry.title == "test2":
+                    raise ValueError()
+            return entries
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(custom_batch_mapper, size=10))
+        with pytest.raises(CustomMapperExecException) as e:
+            pr.parse_db()
+        assert e.value.entry == "web/test2"
+
+    def test_should_refuse_a_mapper_not_returning_entries(self):
+        """... it should refuse a mapper not returning entries"""
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(lambda entries: None))
+        with pytest.raises(CustomMapperExecException):
+            pr.parse_db()
+        pr = PassReader(path="tests/password-store", mapper=BatchMapper(lambda entries: entries + ["other"]))
+        with pytest.raises(CustomMapperExecException):
+            pr.parse_db()
+
+    def test_should_refuse_an_invalid_chunk_size(self):
+        """... it should refuse an invalid chunk size"""
+        with pytest.raises(ValueError):
+            BatchMapper(lambda entries: entries, size=0)
+
+
+def upper_title_mapper(entry: PassEntry) -> PassEntry:
+    entry.title = entry.title.upper()
+    return entry
+
+
+def broken_on_test2_mapper(entry: PassEntry) -> PassEntry:
+    if entry.title == "test2":
+        raise KeyError("something")
+    return entry
+
+
+class TestPassReaderWithProcessMapper:
+    """Test: PassReader with a process mapper..."""
+
+    def test_should_map_every_entry_in_order(self):
+        """... it should map every entry in order"""
+        mapper = ProcessMapper(upper_title_mapper, processes=2, chunk_size=1)
+        pr = PassReader(path="tests/password-store", mapper=mapper, jobs=2)
+        pr.parse_db()
+        assert [x.title for x in pr.entries] == ["TEST1", "TEST3", "TEST2", "TEST4"]
+        assert pr.entries[0].custom_properties["cell_number"] == "00000000"
+
+    def test_should_report_the_entry_the_mapper_failed_on(self):
+        """... it should report the entry the mapper failed on"""
+        pr = PassReader(path="tests/password-store", mapper=ProcessMapper(broken_on_test2_mapper, processes=2))
+        with pytest.raises(CustomMapperExecException) as e:
+            pr.parse_db()
+        assert e.value.entry == "web/test2"
+        assert "KeyError" in e.value.reason
+
+    def test_should_load_the_mapper_from_its_source_file_in_the_workers(self):
+        """... it should load the mapper from its source file in the workers"""
+        function = load_custom_mapper("tests/custom_mapper.py")
+        mapper = ProcessMapper(function, processes=2, source="tests/custom_mapper.py")
+        pr = PassReader(path="tests/password-store", mapper=mapper)
+        pr.parse_db()
+        assert [x.title for x in pr.entries] == ["test1_modified", "test3_modified", "test2_modified",
+                                                 "test4_modified"]
+
+    def test_should_map_a_single_entry_in_process(self):
+        """... it should map a single entry in process"""
+        pr = PassReader(path="tests/password-store", mapper=ProcessMapper(upper_title_mapper, processes=1))
+        assert pr.parse_pass_entry("test1").title == "TEST1"
+
+    def test_should_refuse_invalid_settings(self):
+        """... it should refuse invalid settings"""
+        with pytest.raises(ValueError):
+            ProcessMapper(upper_title_mapper, processes=0)
+
+
+class TestPassReaderWithJobs:
+    """Test: PassReader with jobs..."""
+
+    def test_should_parse_the_db_in_the_same_order_as_the_serial_reader(self, backend):
+        """... it should parse the db in the same order as the serial reader"""
+        serial = PassReader(path="tests/password-store")
+        serial.parse_db()
+        parallel = PassReader(path="tests/password-store", jobs=3, backend=backend)
+        parallel.parse_db()
+        assert [x.title for x in parallel.entries] == [x.title for x in serial.entries]
+        assert [entry_fields(x) for x in parallel.entries] == [entry_fields(x) for x in serial.entries]
+
+    def test_should_fire_a_progress_event_for_every_entry(self, backend):
+        """... it should fire a progress event for every entry"""
+        pr = PassReader(path="tests/password-store", jobs=2, backend=backend)
+        events = []
+        pr.event_stream.subscribe(events.append)
+        pr.parse_db()
+        assert events == [1, 2, 3, 4]
+
+    def test_should_apply_the_mapper_in_order(self):
+        """... it should apply the mapper in order"""
+        mapped = []
+
+        def custom_mapper(entry: PassEntry) -> PassEntry:
+            mapped.append(entry.title)
+            return entry
+        pr = PassReader(path="tests/password-store", mapper=custom_mapper, jobs=4)
+        pr.parse_db()
+        assert mapped == [x.title for x in pr.entries]
+
+    def test_should_stop_at_the_first_mapper_failure(self):
+        """... it should stop at the first mapper failure"""
+        def custom_broken_mapper(_):
+            raise Exception
+        pr = PassReader(path="tests/password-store", mapper=custom_broken_mapper, jobs=2)
+        events = []
+        pr.event_stream.subscribe(events.append)
         with pytest.raises(CustomMapperExecException):
-            pr.parse_pass_entry("test1")
+            pr.parse_db()
+        assert events == []
+        assert pr.entries == []
+
+    def test_should_stop_at_the_first_decryption_failure(self, backend):
+        """... it should stop at the first decryption failure"""
+        pr = PassReader(path="tests/password-store", jobs=2, backend=backend)
+        with pytest.raises(FileNotFoundError):
+            list(pr.parse_entries(["test1", "not_there", "web/test2"]))
+        pr.close()
 
 
 class TestPassEntry:
@@ -101,9 +335,11 @@ class TestPassEntry:
     pr: PassReader
 
     @pytest.fixture(scope="class", autouse=True)
-    def setup(self, request):
+    def setup(self, request, backend):
         """TestPassEntry setup"""
-        request.cls.pr = PassReader(path="tests/password-store")
+        request.cls.pr = PassReader(path="tests/password-store", backend=backend)
+        yield
+        request.cls.pr.close()
 
     def test_should_correctly_parse_the_group(self):
         """Pass entry should correctly parse the group."""
@@ -117,6 +353,11 @@ class TestPassEntry:
         assert PassEntry(self.pr, "docs/test3").title == "test3"
         assert PassEntry(self.pr, "web/emails/test4").title == "test4"
 
+    def test_should_expose_its_full_name(self):
+        """Pass entry should expose its full name."""
+        assert PassEntry(self.pr, "test1").name == "test1"
+        assert PassEntry(self.pr, "web/emails/test4").name == "web/emails/test4"
+
     def test_should_be_able_to_decrypt_an_entry(self):
         """Pass entry should be able to decrypt an entry."""
         decrypted_entry = PassEntry.decrypt_entry(self.pr, "test1")
@@ -133,12 +374,13 @@ class TestPassEntry:
         with pytest.raises(FileNotFoundError):
             PassEntry.decrypt_entry(self.pr, "not_there")
 
-    def test_should_be_able_to_decrypt_an_entry_with_a_given_password(self):
+    def test_should_be_able_to_decrypt_an_entry_with_a_given_password(self, backend):
         """Pass entry should be able to decrypt an entry with a given password."""
-        pr = PassReader(path="tests/password-store-with-pass", password="pass2keepass2")
+        pr = PassReader(path="tests/password-store-with-pass", password="pass2keepass2", backend=backend)
         decrypted_entry = PassEntry.decrypt_entry(pr, "test1")
         entry = 'F_Yq^5vgeyMCgYf-tW\\!T7Uj|\n---\nurl: someurl.com\n'
         assert decrypted_entry == entry
+        pr.close()
 
     def test_should_be_able_to_recognize_a_valid_entry_line(self):
         """Pass entry should be able to recognize a valid entry line."""
@@ -157,3 +399,61 @@ class TestPassEntry:
         assert entry.user == "myusername"
         assert entry.notes == "some notes something interesting"
         assert entry.custom_properties["cell_number"] == "00000000"
+
+
+
+class TestPassEntryParser:
+    """Test: PassEntry parser..."""
+
+    entry_strings = [
+        "",
+        "onlypassword",
+        "pass:word\n---\nurl: someurl.com\nuser: me\nnotes: a: b\ncustom: value\n",
+        "pw\n: no key\nno separator\n---\n\nlogin: other\nuser: last\n  spaced key  :  spaced value  \n",
+        "pw\r\nurl: windows\r\nkey:\n",
+    ]
+
+    @staticmethod
+    def legacy_parse(entry_string: str) -> dict:
+        """The original parser, built from is_valid_line and parse_entry_line."""
+        fields = {"password": "", "url": "", "user": "", "notes": "", "custom_properties": {},
+                  "attachment": None}
+        lines = entry_string.split("\n")
+        fields["password"] = lines.pop(0)
+        for line in lines:
+            if line in PassEntry.to_skip or not PassEntry.is_valid_line(line):
+                continue
+            key, value = PassEntry.parse_entry_line(line)
+            if key == "url":
+                fields["url"] = value
+            elif key == "user" or key == "login":
+                fields["user"] = value
+            elif key == "notes":
+                fields["notes"] = value
+            else:
+                fields["custom_properties"][key] = value
+        return fields
+
+    @pytest.mark.parametrize("entry_string", entry_strings)
+    def test_should_give_the_same_results_as_the_line_helpers(self, entry_string):
+        """... it should give the same results as the line helpers"""
+        entry = PassEntry.from_string("web/test", entry_string)
+        fields = entry_fields(entry)
+        assert fields.pop("groups") == ["web"]
+        assert fields.pop("title") == "test"
+        assert fields == self.legacy_parse(entry_string)
+
+    @pytest.mark.parametrize("entry_string", entry_strings + ["", "pw", "pw\n\x1ckey: \u2003value\u2003 \r\n"])
+    def test_should_parse_a_buffer_like_a_string(self, entry_string):
+        """... it should parse a buffer like a string"""
+        buffer = bytearray(entry_string.encode("utf-8"))
+        assert entry_fields(PassEntry.from_buffer("web/test", buffer)) == \
+            entry_fields(PassEntry.from_string("web/test", entry_string))
+        assert buffer == entry_string.encode("utf-8")
+
+    def test_should_not_have_a_per_instance_dict(self):
+        """... it should not have a per-instance dict"""
+        entry = PassEntry.from_string("test", "pw")
+        assert not hasattr(entry, "__dict__")
+        with pytest.raises(AttributeError):
+            entry.something = "else"
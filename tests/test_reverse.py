@@ -0,0 +1,229 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from p2kp2 import PassReader, PassEntry, P2KP2
+from p2kp2.gpg import EncryptionException
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.reverse import KeePassReader, PassWriter, PassEntryExistsException, UnsafePassEntryException, pass_name
+from p2kp2.rules import FieldRules
+from p2kp2.sync import fingerprint_key
+from tests.conftest import test_db_file, test_pass
+from tests.test_reader import entry_fields
+
+recipient = "pass2keepass2"
+
+
+@pytest.fixture(scope="module")
+def pass_entries():
+    reader = PassReader(path="tests/password-store")
+    reader.parse_db()
+    return reader.entries
+
+
+@pytest.fixture
+def test_db(pass_entries):
+    writer = P2KP2(password=test_pass, destination=test_db_file)
+    writer.populate_db(pass_entries)
+    return writer
+
+
+class TestToEntryString:
+    """Test: PassEntry.to_entry_string..."""
+
+    @pytest.mark.parametrize("entry_string", [
+        "pw\n",
+        "pw\nurl: example.com\nuser: me\npin: 1234\nnotes: a note\n",
+        "pw\nsecond: line\nnotes: first\n",
+    ])
+    def test_should_be_the_inverse_of_parsing(self, entry_string):
+        """... it should be the inverse of parsing"""
+        entry = PassEntry.from_string("web/test", entry_string)
+        assert entry.to_entry_string() == entry_string
+        assert entry_fields(PassEntry.from_string("web/test", entry.to_entry_string())) == entry_fields(entry)
+
+    def test_should_give_back_the_notes_lines_added_by_the_rules(self):
+        """... it should give back the notes lines added by the rules"""
+        rules = FieldRules([{"key": "pin", "to_notes": True}])
+        entry = PassEntry.from_string("test", "pw\nnotes: first\npin: 1234\n", rules)
+        assert entry.notes == "first\npin: 1234"
+        assert entry.to_entry_string() == "pw\nnotes: first\npin: 1234\n"
+        assert PassEntry.from_string("test", entry.to_entry_string(), rules).notes == entry.notes
+
+    def test_should_keep_every_field_on_a_single_line(self):
+        """... it should keep every field on a single line"""
+        entry = PassEntry.from_string("test", "pw\n")
+        entry.user = "first\nsecond"
+        entry.custom_properties["pin"] = "1\n2"
+        assert entry.to_entry_string() == "pw\nuser: first second\npin: 1 2\n"
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestKeePassReader:
+    """Test: KeePassReader..."""
+
+    def test_should_read_back_the_entries_p2kp2_wrote(self, test_db, pass_entries):
+        """... it should read back the entries p2kp2 wrote"""
+        reader = KeePassReader(test_db_file, password=test_pass)
+        reader.parse_db()
+        assert [entry_fields(x) for x in reader.entries] == [entry_fields(x) for x in pass_entries]
+
+    def test_should_skip_the_recycle_bin_and_the_sync_fingerprint(self, test_db):
+        """... it should skip the recycle bin and the sync fingerprint"""
+        entry = test_db.db.find_entries(title="test1", first=True)
+        entry.set_custom_property(fingerprint_key, "{}")
+        test_db.db.trash_entry(test_db.db.find_entries(title="test2", first=True))
+        test_db.save()
+        reader = KeePassReader(test_db_file, password=test_pass)
+        reader.parse_db()
+        assert [x.name for x in reader.entries] == ["test1", "docs/test3", "web/emails/test4"]
+        assert reader.entries[0].custom_properties == {"cell_number": "00000000"}
+
+    def test_should_turn_keepass_names_into_pass_names(self, test_db):
+        """... it should turn keepass names into pass names"""
+        test_db.db.add_entry(test_db.get_group(["a/b"]), "c/d", "", "pw")
+        test_db.save()
+        reader = KeePassReader(test_db_file, password=test_pass)
+        reader.parse_db()
+        assert reader.entries[-1].name == "a-b/c-d"
+
+    @pytest.mark.parametrize("name, expected", [("..", "__"), (".", "_"), (".hidden", "_hidden"), (" ", "untitled"),
+                                                ("a.b", "a.b")])
+    def test_should_never_give_names_out_of_the_store_or_hidden(self, name, expected):
+        """... it should never give names out of the store, or hidden"""
+        assert pass_name(name) == expected
+
+    def test_should_keep_dot_dot_groups_in_the_store(self, test_db):
+        """... it should keep dot dot groups in the store"""
+        test_db.db.add_entry(test_db.get_group([".."]), "escaped", "", "pw")
+        test_db.save()
+        reader = KeePassReader(test_db_file, password=test_pass)
+        reader.parse_db()
+        assert reader.entries[-1].name == "__/escaped"
+
+
+class TestPassWriter:
+    """Test: PassWriter..."""
+
+    def test_should_write_a_store_the_pass_reader_can_read(self, pass_entries, tmp_path):
+        """... it should write a store the pass reader can read"""
+        writer = PassWriter(str(tmp_path), recipients=[recipient], jobs=2)
+        events = []
+        writer.event_stream.subscribe(events.append)
+        writer.populate_db(pass_entries)
+        assert events == [1, 2, 3, 4]
+        assert (tmp_path / ".gpg-id").read_text() == recipient + "\n"
+        reader = PassReader(path=str(tmp_path))
+        reader.parse_db()
+        assert [entry_fields(x) for x in reader.entries] == [entry_fields(x) for x in pass_entries]
+
+    def test_should_encrypt_the_entries_concurrently(self, pass_entries, tmp_path, mocker):
+        """... it should encrypt the entries concurrently"""
+        running, peak = [0], [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(2, timeout=5)
+
+        def tracked_encrypt(data, *args, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            barrier.wait()
+            with lock:
+                running[0] -= 1
+            return data
+        mocker.patch("p2kp2.reverse.encrypt", tracked_encrypt)
+        PassWriter(str(tmp_path), recipients=[recipient], jobs=2).populate_db(pass_entries)
+        assert peak[0] == 2
+
+    def test_should_use_the_nearest_recipients_file(self, tmp_path, mocker):
+        """... it should use the nearest recipients file"""
+        encrypt = mocker.patch("p2kp2.reverse.encrypt", return_value=b"")
+        (tmp_path / "web").mkdir()
+        (tmp_path / "web" / ".gpg-id").write_text("someone\nsomeone-else\n")
+        writer = PassWriter(str(tmp_path), recipients=[recipient])
+        writer.populate_db([PassEntry.from_string("web/emails/test", "pw"), PassEntry.from_string("test", "pw")])
+        assert [x.args[1] for x in encrypt.call_args_list] == [["someone", "someone-else"], [recipient]]
+
+    def test_should_need_the_store_recipients(self, tmp_path):
+        """... it should need the store recipients"""
+        with pytest.raises(ValueError):
+            PassWriter(str(tmp_path))
+        with pytest.raises(ValueError):
+            PassWriter(str(tmp_path), recipients=[])
+
+    def test_should_only_replace_the_recipients_of_a_store_when_overwriting(self, tmp_path):
+        """... it should only replace the recipients of a store when overwriting"""
+        (tmp_path / ".gpg-id").write_text("ORIGINAL-KEY\n")
+        with pytest.raises(ValueError):
+            PassWriter(str(tmp_path), recipients=[recipient])
+        assert (tmp_path / ".gpg-id").read_text() == "ORIGINAL-KEY\n"
+        PassWriter(str(tmp_path), recipients=["ORIGINAL-KEY"])
+        PassWriter(str(tmp_path), recipients=[recipient], overwrite=True)
+        assert (tmp_path / ".gpg-id").read_text() == f"{recipient}\n"
+
+    def test_should_not_overwrite_an_existing_entry(self, tmp_path, mocker):
+        """... it should not overwrite an existing entry"""
+        mocker.patch("p2kp2.reverse.encrypt", return_value=b"new")
+        (tmp_path / "test.gpg").write_bytes(b"old")
+        with pytest.raises(PassEntryExistsException):
+            PassWriter(str(tmp_path), recipients=[recipient]).populate_db([PassEntry.from_string("test", "pw")])
+        assert (tmp_path / "test.gpg").read_bytes() == b"old"
+        PassWriter(str(tmp_path), recipients=[recipient], overwrite=True).populate_db(
+            [PassEntry.from_string("test", "pw")])
+        assert (tmp_path / "test.gpg").read_bytes() == b"new"
+
+    def test_should_refuse_two_entries_with_the_same_name(self, tmp_path, mocker):
+        """... it should refuse two entries with the same name"""
+        mocker.patch("p2kp2.reverse.encrypt", return_value=b"")
+        with pytest.raises(PassEntryExistsException):
+            PassWriter(str(tmp_path), recipients=[recipient]).populate_db(
+                [PassEntry.from_string("test", "pw"), PassEntry.from_string("test", "other")])
+
+    def test_should_never_write_out_of_the_store(self, tmp_path, mocker):
+        """... it should never write out of the store"""
+        mocker.patch("p2kp2.reverse.encrypt", return_value=b"")
+        store = tmp_path / "store"
+        entry = PassEntry.from_string("escaped", "pw")
+        entry.groups = [".."]
+        with pytest.raises(UnsafePassEntryException):
+            PassWriter(str(store), recipients=[recipient]).populate_db([entry])
+        assert not (tmp_path / "escaped.gpg").exists()
+
+    def test_should_raise_an_encryption_exception_when_gpg_fails(self, tmp_path):
+        """... it should raise an encryption exception when gpg fails"""
+        writer = PassWriter(str(tmp_path), recipients=["nobody-at-all"])
+        with pytest.raises(EncryptionException):
+            writer.populate_db([PassEntry.from_string("test", "pw")])
+        assert not os.path.exists(tmp_path / "test.gpg")
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestReverseOption:
+    """Test: --reverse..."""
+
+    def test_should_restore_the_store(self, test_db, pass_entries, monkeypatch, tmp_path):
+        """... it should restore the store"""
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--reverse", "-i", test_db_file, "-o", str(tmp_path),
+                                          "--recipient", recipient, "-j", "2"])
+        main_func()
+        reader = PassReader(path=str(tmp_path))
+        reader.parse_db()
+        assert [entry_fields(x) for x in reader.entries] == [entry_fields(x) for x in pass_entries]
+
+    def test_should_need_both_paths(self, monkeypatch, mocker):
+        """... it should need both paths"""
+        mocker.patch("p2kp2.pass2keepass2.exec_reverse_mode")
+        for paths in [["-i", "pass.kdbx"], ["-o", "store"]]:
+            monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--reverse"] + paths)
+            with pytest.raises(SystemExit):
+                main_func()
+
+    def test_should_refuse_the_conversion_options(self, monkeypatch, mocker):
+        """... it should refuse the conversion options"""
+        mocker.patch("p2kp2.pass2keepass2.exec_reverse_mode")
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--reverse", "-i", "a.kdbx", "-o", "store", "--sync"])
+        with pytest.raises(SystemExit):
+            main_func()
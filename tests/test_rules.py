@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from p2kp2 import PassReader, PassEntry
+from p2kp2.rules import FieldRules, RulesException
+
+
+def parse(entry_string: str, rules: list) -> PassEntry:
+    return PassEntry.from_string("test", entry_string, FieldRules(rules))
+
+
+class TestFieldRules:
+    """Test: FieldRules..."""
+
+    def test_should_map_the_standard_fields_by_default(self):
+        """... it should map the standard fields by default"""
+        entry = parse("pw\nurl: a.com\nlogin: me\nnotes: hi\nother: x", [])
+        assert (entry.url, entry.user, entry.notes) == ("a.com", "me", "hi")
+        assert entry.custom_properties == {"other": "x"}
+
+    def test_should_rename_a_field(self):
+        """... it should rename a field"""
+        entry = parse("pw\notpauth: secret", [{"key": "otpauth", "rename": "otp"}])
+        assert entry.custom_properties == {"otp": "secret"}
+
+    def test_should_rename_a_field_to_a_standard_one(self):
+        """... it should rename a field to a standard one"""
+        entry = parse("pw\nwebsite: a.com\nemail: me@a.com", [{"key": "website", "rename": "url"},
+                                                              {"key": "email", "rename": "login"}])
+        assert (entry.url, entry.user) == ("a.com", "me@a.com")
+        assert entry.custom_properties == {}
+
+    def test_should_override_the_default_rules(self):
+        """... it should override the default rules"""
+        entry = parse("pw\nlogin: me", [{"key": "login", "rename": "account"}])
+        assert entry.user == ""
+        assert entry.custom_properties == {"account": "me"}
+
+    def test_should_prefix_a_value(self):
+        """... it should prefix a value"""
+        entry = parse("pw\notpauth: secret", [{"key": "otpauth", "rename": "otp", "prefix": "otpauth:"}])
+        assert entry.custom_properties == {"otp": "otpauth:secret"}
+
+    def test_should_move_a_field_to_the_notes(self):
+        """... it should move a field to the notes"""
+        entry = parse("pw\npin: 1234\nnotes: hi\nhint: none", [{"key": "pin", "to_notes": True},
+                                                               {"key": "hint", "to_notes": True}])
+        assert entry.notes == "hi\npin: 1234\nhint: none"
+        assert entry.custom_properties == {}
+
+    def test_should_drop_a_field(self):
+        """... it should drop a field"""
+        entry = parse("pw\nuseless: x\nother: y", [{"key": "useless", "drop": True}])
+        assert entry.custom_properties == {"other": "y"}
+
+    def test_should_rewrite_a_value_with_regular_expressions(self):
+        """... it should rewrite a value with regular expressions"""
+        rules = [{"key": "url", "regex": [["^http://", "https://"], ["/$", ""]], "prefix": ">"}]
+        assert parse("pw\nurl: http://a.com/", rules).url == ">https://a.com"
+        assert parse("pw\nurl: a.com", [{"key": "url", "regex": ["^", "https://"]}]).url == "https://a.com"
+
+    @pytest.mark.parametrize("rules", [
+        {"key": "a"},
+        [{"rename": "b"}],
+        [{"key": "a", "unknown": True}],
+        [{"key": "a", "drop": True, "rename": "b"}],
+        [{"key": "a", "rename": ""}],
+        [{"key": "a", "regex": "^a"}],
+        [{"key": "a", "regex": ["(", "b"]}],
+        [{"key": "a", "regex": {"^a": "b"}}],
+        [{"key": "a", "regex": {}}],
+        [{"key": "a", "regex": []}],
+        [{"key": "a", "regex": [["^a", "b"], "c"]}],
+        [{"key": "a", "prefix": 3}],
+    ])
+    def test_should_reject_invalid_rules(self, rules):
+        """... it should reject invalid rules"""
+        with pytest.raises(RulesException):
+            FieldRules(rules)
+
+    def test_should_load_the_rules_from_a_file(self, tmp_path):
+        """... it should load the rules from a file"""
+        rules = FieldRules.from_file("tests/rules.json")
+        assert rules.table["cell_number"].name == "phone"
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps([{"key": "a"}]))
+        with pytest.raises(RulesException):
+            FieldRules.from_file(str(path))
+        with pytest.raises(RulesException):
+            FieldRules.from_file(str(tmp_path / "missing.json"))
+
+    def test_should_be_applied_by_the_reader(self):
+        """... it should be applied by the reader"""
+        pr = PassReader(path="tests/password-store", rules=FieldRules.from_file("tests/rules.json"))
+        entry = pr.parse_pass_entry("test1")
+        assert entry.url == "https://someurl.com"
+        assert entry.custom_properties == {"phone": "+39 00000000"}
@@ -1,8 +1,13 @@
+import json
 import os
+import subprocess
 import sys
 import pytest
 
 from p2kp2.pass2keepass2 import main_func, import_custom_mapper, CustomMapperImportException
+from p2kp2 import BatchMapper, ProcessMapper
+from p2kp2.kdf import AesKdf, Argon2Kdf
+from p2kp2.profiling import Profiler
 from p2kp2.reader import PassEntry, PassReader
 
 from tests.conftest import test_db_file
@@ -42,6 +47,143 @@ class TestMainFunc:
         assert "custom" in named_args
         assert named_args.custom == "mycustomfunction.py"
 
+    def test_should_accept_the_number_of_jobs(self, monkeypatch, mocker):
+        """... it should accept the number of jobs"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-j", "4"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        named_args = mocked_normal_mode.call_args[0][0]
+        assert named_args.jobs == 4
+
+    def test_should_accept_the_decryption_backend(self, monkeypatch, mocker):
+        """... it should accept the decryption backend"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-b", "batch"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        named_args = mocked_normal_mode.call_args[0][0]
+        assert named_args.backend == "batch"
+
+    def test_should_accept_the_batch_mapper_chunk_size(self, monkeypatch, mocker):
+        """... it should accept the batch mapper chunk size"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--batch-size", "50"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        assert mocked_normal_mode.call_args[0][0].batch_size == 50
+
+    def test_should_load_the_field_rules(self, monkeypatch, mocker):
+        """... it should load the field rules"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-r", "tests/rules.json"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        assert mocked_normal_mode.call_args[0][0].field_rules.table["cell_number"].name == "phone"
+
+    def test_should_refuse_an_invalid_rules_file(self, monkeypatch, mocker):
+        """... it should refuse an invalid rules file"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-r", "tests/custom_mapper.py"])
+        mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        with pytest.raises(SystemExit):
+            main_func()
+
+    def test_should_accept_the_bulk_flag(self, monkeypatch, mocker):
+        """... it should accept the bulk flag"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--bulk"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        named_args = mocked_normal_mode.call_args[0][0]
+        assert named_args.bulk is True
+
+    def test_should_not_choose_a_kdf_by_default(self, monkeypatch, mocker):
+        """... it should not choose a kdf by default"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        assert mocked_normal_mode.call_args[0][0].kdf_settings is None
+
+    def test_should_accept_the_kdf_settings(self, monkeypatch, mocker):
+        """... it should accept the kdf settings"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--kdf", "argon2id", "--kdf-memory", "16",
+                                          "--kdf-iterations", "3", "--kdf-parallelism", "4"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        main_func()
+        named_args = mocked_normal_mode.call_args[0][0]
+        assert named_args.kdf_settings == Argon2Kdf(memory=16384, iterations=3, parallelism=4, variant="argon2id")
+
+    def test_should_calibrate_the_kdf_when_given_a_target_time(self, monkeypatch, mocker):
+        """... it should calibrate the kdf when given a target time"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--kdf-target-ms", "500"])
+        mocked_normal_mode = mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        mocked_calibrate = mocker.patch("p2kp2.pass2keepass2.calibrate", return_value=AesKdf(rounds=42))
+        main_func()
+        mocked_calibrate.assert_called_with(AesKdf(), 500)
+        assert mocked_normal_mode.call_args[0][0].kdf_settings == AesKdf(rounds=42)
+
+    def test_should_refuse_mixed_kdf_settings(self, monkeypatch, mocker):
+        """... it should refuse mixed kdf settings"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "--kdf", "aes", "--kdf-memory", "16"])
+        mocker.patch("p2kp2.pass2keepass2.exec_normal_mode")
+        with pytest.raises(SystemExit):
+            main_func()
+
+    def test_should_save_and_print_a_profiling_report_when_instructed(self, monkeypatch, mocker, tmp_path, capsys):
+        """... it should save and print a profiling report when instructed"""
+        report_file = str(tmp_path / "profile.json")
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", test_db_file,
+                                          "--profile", report_file])
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: "strong")
+        mocked_passreader = mocker.patch('p2kp2.pass2keepass2.PassReader')
+        mocked_p2kp2 = mocker.patch('p2kp2.pass2keepass2.P2KP2')
+        mocker.patch('p2kp2.pass2keepass2.print_conversion_progress')
+        mocker.patch('p2kp2.pass2keepass2.convert')
+        main_func()
+        profiler = mocked_passreader.call_args[1]["profiler"]
+        assert isinstance(profiler, Profiler)
+        assert mocked_p2kp2.call_args[1]["profiler"] is profiler
+        with open(report_file) as f:
+            assert "stages" in json.load(f)
+        assert "wall time" in capsys.readouterr().out
+
+    def test_should_print_the_progress_as_json_when_instructed(self, monkeypatch, mocker):
+        """... it should print the progress as json when instructed"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", test_db_file,
+                                          "--progress", "json"])
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: "strong")
+        mocker.patch('p2kp2.pass2keepass2.PassReader')
+        mocker.patch('p2kp2.pass2keepass2.P2KP2')
+        mocked_progress = mocker.patch('p2kp2.pass2keepass2.print_conversion_progress')
+        mocker.patch('p2kp2.pass2keepass2.convert')
+        main_func()
+        assert mocked_progress.call_args[1]["mode"] == "json"
+
+    @pytest.mark.parametrize("quick", [True, False])
+    def test_should_print_nothing_but_json_lines_to_stdout_in_json_mode(self, monkeypatch, capsys, tmp_path, quick):
+        """... it should print nothing but json lines to stdout in json mode"""
+        destination = str(tmp_path / "pass.kdbx")
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-i", "tests/password-store", "-o", destination,
+                                          "--progress", "json"] + (["-q"] if quick else []))
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: "strong")
+        monkeypatch.setattr('builtins.input', lambda _="": "y")
+        main_func()
+        out, err = capsys.readouterr()
+        lines = [x for x in out.split("\n") if x != ""]
+        assert len(lines) > 0
+        assert all(isinstance(json.loads(x), dict) for x in lines)
+        assert "Creating the new keepass database" in err
+        assert "ALL DONE" in err
+
+    def test_should_sync_instead_of_converting_when_instructed(self, monkeypatch, mocker):
+        """... it should sync instead of converting when instructed"""
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "--sync", "-i", "tests/password-store",
+                                          "-o", test_db_file])
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: "strong")
+        mocker.patch('p2kp2.pass2keepass2.PassReader')
+        mocked_p2kp2 = mocker.patch('p2kp2.pass2keepass2.P2KP2')
+        mocked_sync = mocker.patch('p2kp2.pass2keepass2.sync')
+        mocked_convert = mocker.patch('p2kp2.pass2keepass2.convert')
+        main_func()
+        assert mocked_p2kp2.call_args[1]["sync"] is True
+        assert mocked_sync.call_count == 1
+        assert mocked_convert.call_count == 0
+
     def test_should_pass_the_provided_custom_function_to_the_passreader_in_normal_mode(self, monkeypatch, mocker):
         """... it should pass the provided custom function to the PassReader in normal mode"""
         # Mock the command line
@@ -67,10 +209,11 @@ class TestMainFunc:
         main_func()
 
         # Check that the mapper importer was called correctly
-        mocked_importer.assert_called_with(os.path.abspath("tests/custom_mapper.py"))
+        mocked_importer.assert_called_with(os.path.abspath("tests/custom_mapper.py"), batch_size=100, processes=0)
 
         # Check that the passreader was called with the right arguments
-        mocked_passreader.assert_called_with(path='tests/password-store', mapper=mock_mapper)
+        mocked_passreader.assert_called_with(path='tests/password-store', mapper=mock_mapper, jobs=1, backend='passpy',
+                                             profiler=None, rules=None, wipe_buffers=False)
 
     def test_should_pass_the_provided_custom_function_to_the_passreader_in_quick_mode(self, monkeypatch, mocker):
         """... it should pass the provided custom function to the PassReader in quick mode"""
@@ -95,11 +238,43 @@ class TestMainFunc:
         main_func()
 
         # Check that the mapper importer was called correctly
-        mocked_importer.assert_called_with(os.path.abspath("tests/custom_mapper.py"))
+        mocked_importer.assert_called_with(os.path.abspath("tests/custom_mapper.py"), batch_size=100, processes=0)
 
         # Check that the passreader was called with the right arguments
         mocked_passreader.assert_called_with(
-            path='tests/password-store', mapper=mock_mapper, password="strong")
+            path='tests/password-store', mapper=mock_mapper, password="strong", jobs=1, backend='passpy',
+            profiler=None, rules=None, wipe_buffers=False)
+
+
+class TestStartup:
+    """Test: startup..."""
+
+    @staticmethod
+    def loaded_modules(code: str):
+        """Return the modules loaded by a fresh python process running the given code."""
+        output = subprocess.run([sys.executable, "-c", f"{code}; import sys; print(' '.join(sys.modules))"],
+                                stdout=subprocess.PIPE, check=True).stdout
+        return {x.split(".")[0] for x in output.decode("utf-8").split()}
+
+    def test_should_not_load_the_conversion_dependencies_when_importing_the_script(self):
+        """... it should not load the conversion dependencies when importing the script"""
+        modules = self.loaded_modules("import p2kp2.pass2keepass2")
+        for name in ["pykeepass", "lxml", "passpy", "rx", "gnupg", "argon2", "pkg_resources"]:
+            assert name not in modules
+
+    def test_should_load_them_once_a_conversion_needs_them(self):
+        """... it should load them once a conversion needs them"""
+        modules = self.loaded_modules("from p2kp2 import P2KP2; P2KP2(password='x', destination='unused.kdbx')")
+        assert {"pykeepass", "lxml", "rx"} <= modules
+
+    def test_should_still_export_everything_from_the_package(self):
+        """... it should still export everything from the package"""
+        import p2kp2
+        from p2kp2.writer import P2KP2
+        assert p2kp2.P2KP2 is P2KP2
+        assert set(p2kp2.__all__) <= set(dir(p2kp2))
+        with pytest.raises(AttributeError):
+            p2kp2.Missing
 
 
 class TestTheCustomMapperImporter:
@@ -113,6 +288,22 @@ class TestTheCustomMapperImporter:
         assert callable(mapper)
         assert mapper(entry).title == "test1_modified"
 
+    def test_should_recognize_a_batch_mapper(self):
+        """... it should recognize a batch mapper"""
+        pr = PassReader(path="tests/password-store")
+        entries = [PassEntry(pr, "test1"), PassEntry(pr, "test1"), PassEntry(pr, "docs/test3")]
+        mapper = import_custom_mapper("tests/custom_batch_mapper.py", batch_size=7)
+        assert isinstance(mapper, BatchMapper)
+        assert mapper.size == 7
+        assert [x.title for x in mapper.function(entries)] == ["test1", "test3"]
+
+    def test_should_run_the_mapper_in_worker_processes_when_instructed(self):
+        """... it should run the mapper in worker processes when instructed"""
+        mapper = import_custom_mapper("tests/custom_mapper.py", processes=3)
+        assert isinstance(mapper, ProcessMapper)
+        assert mapper.processes == 3
+        assert mapper.source == "tests/custom_mapper.py"
+
     def test_should_raise_an_exception_when_it_encounters_an_error(self):
         """... it should raise an exception when it encounters an error"""
         pr = PassReader(path="tests/password-store")
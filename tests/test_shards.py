@@ -0,0 +1,116 @@
+import sys
+
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2 import PassReader, PassEntry, DbAlreadyExistsException
+from p2kp2.pass2keepass2 import main_func
+from p2kp2.pipeline import convert
+from p2kp2.shards import ShardedWriter, ShardException, shard_destination
+from tests.conftest import test_pass
+
+
+@pytest.fixture(scope="module")
+def pass_entries():
+    reader = PassReader(path="tests/password-store")
+    reader.parse_db()
+    return reader.entries
+
+
+def shard_titles(path: str) -> dict:
+    db = PyKeePass(path, password=test_pass)
+    return {x.title: x.group.path for x in db.entries}
+
+
+class TestShardDestination:
+    """Test: shard_destination..."""
+
+    def test_should_name_the_shards_after_the_destination(self):
+        """... it should name the shards after the destination"""
+        assert shard_destination("out/pass.kdbx", "web") == "out/pass-web.kdbx"
+        assert shard_destination("out/pass.kdbx") == "out/pass.kdbx"
+
+
+class TestShardedWriter:
+    """Test: ShardedWriter..."""
+
+    @pytest.mark.parametrize("bulk", [False, True])
+    def test_should_write_a_db_for_every_top_level_group(self, pass_entries, tmp_path, bulk):
+        """... it should write a db for every top level group"""
+        destination = str(tmp_path / "pass.kdbx")
+        writer = ShardedWriter(password=test_pass, destination=destination, bulk=bulk, processes=2)
+        events = []
+        writer.event_stream.subscribe(events.append)
+        writer.populate_db(pass_entries)
+        assert events == [1, 2, 3, 4]
+        assert writer.shards == {destination: 1, str(tmp_path / "pass-docs.kdbx"): 1,
+                                 str(tmp_path / "pass-web.kdbx"): 2}
+        assert shard_titles(destination) == {"test1": []}
+        assert shard_titles(str(tmp_path / "pass-docs.kdbx")) == {"test3": ["docs"]}
+        assert shard_titles(str(tmp_path / "pass-web.kdbx")) == {"test2": ["web"], "test4": ["web", "emails"]}
+
+    def test_should_route_the_entries_by_their_mapped_groups(self, tmp_path):
+        """... it should route the entries by their mapped groups"""
+        entry = PassEntry.from_string("web/test", "pw")
+        entry.groups = ["moved"]
+        writer = ShardedWriter(password=test_pass, destination=str(tmp_path / "pass.kdbx"), processes=1)
+        writer.populate_db([entry])
+        assert list(writer.shards) == [str(tmp_path / "pass-moved.kdbx")]
+        assert not (tmp_path / "pass-web.kdbx").exists()
+
+    def test_should_check_every_shard_before_converting(self, tmp_path):
+        """... it should check every shard before converting"""
+        (tmp_path / "pass-web.kdbx").write_bytes(b"old")
+        writer = ShardedWriter(password=test_pass, destination=str(tmp_path / "pass.kdbx"))
+        with pytest.raises(DbAlreadyExistsException):
+            convert(PassReader(path="tests/password-store"), writer)
+        assert (tmp_path / "pass-web.kdbx").read_bytes() == b"old"
+        assert not (tmp_path / "pass.kdbx").exists()
+
+    def test_should_raise_a_shard_exception_and_write_nothing_when_a_worker_fails(self, tmp_path):
+        """... it should raise a shard exception and write nothing when a worker fails"""
+        entries = [PassEntry.from_string("test", "pw"), PassEntry.from_string("web/test", "pw"),
+                   PassEntry.from_string("web/test", "again")]
+        writer = ShardedWriter(password=test_pass, destination=str(tmp_path / "pass.kdbx"), processes=2)
+        with pytest.raises(ShardException, match="pass-web.kdbx"):
+            writer.populate_db(entries)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_should_remove_the_saved_shards_when_another_one_fails_to_save(self, pass_entries, tmp_path):
+        """... it should remove the saved shards when another one fails to save"""
+        # the web shard can't be saved next to its destination
+        (tmp_path / "pass-web.kdbx.tmp").mkdir()
+        writer = ShardedWriter(password=test_pass, destination=str(tmp_path / "pass.kdbx"), processes=2)
+        with pytest.raises(ShardException, match="pass-web.kdbx"):
+            writer.populate_db(pass_entries)
+        assert [x.name for x in tmp_path.iterdir()] == ["pass-web.kdbx.tmp"]
+        assert writer.shards == {}
+
+    def test_should_refuse_invalid_settings(self):
+        """... it should refuse invalid settings"""
+        with pytest.raises(ValueError):
+            ShardedWriter(password=test_pass, processes=0)
+        with pytest.raises(ValueError):
+            ShardedWriter(password=test_pass, chunk_size=0)
+
+
+class TestShardByOption:
+    """Test: --shard-by..."""
+
+    def test_should_write_the_shards(self, monkeypatch, tmp_path, capsys):
+        """... it should write the shards"""
+        destination = str(tmp_path / "pass.kdbx")
+        monkeypatch.setattr('p2kp2.pass2keepass2.getpass', lambda _: test_pass)
+        monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "-i", "tests/password-store", "-o", destination,
+                                          "--shard-by", "top-level-group", "--shard-processes", "2"])
+        main_func()
+        assert "4 entries converted" in capsys.readouterr().out
+        assert sorted(x.name for x in tmp_path.iterdir()) == ["pass-docs.kdbx", "pass-web.kdbx", "pass.kdbx"]
+
+    def test_should_refuse_the_unsupported_options(self, monkeypatch, mocker):
+        """... it should refuse the unsupported options"""
+        mocker.patch("p2kp2.pass2keepass2.exec_quick_mode")
+        for option in [["--sync"], ["--checkpoint", "5"], ["--format", "xml"], ["--shard-processes", "0"]]:
+            monkeypatch.setattr(sys, 'argv', ["pass2keepass2", "-q", "--shard-by", "top-level-group"] + option)
+            with pytest.raises(SystemExit):
+                main_func()
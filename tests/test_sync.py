@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+import pytest
+from pykeepass import PyKeePass
+
+from p2kp2 import P2KP2, PassReader
+from p2kp2.pipeline import convert
+from p2kp2.sync import sync, fingerprint_key, SyncResult, file_digest
+from tests.conftest import test_pass
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A disposable copy of the test password-store."""
+    path = tmp_path / "password-store"
+    shutil.copytree("tests/password-store", path)
+    return str(path)
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """The path of a disposable keepass db."""
+    return str(tmp_path / "sync.kdbx")
+
+
+def run_sync(store: str, db_file: str) -> SyncResult:
+    return sync(PassReader(path=store), P2KP2(password=test_pass, destination=db_file, sync=True))
+
+
+class TestSync:
+    """Test: sync..."""
+
+    def test_should_create_the_db_and_add_every_entry_the_first_time(self, store, db_file):
+        """... it should create the db and add every entry the first time"""
+        assert run_sync(store, db_file) == SyncResult(added=4, updated=0, removed=0, unchanged=0)
+        db = PyKeePass(db_file, password=test_pass)
+        assert len(db.entries) == 4
+
+    def test_should_record_the_source_fingerprint(self, store, db_file):
+        """... it should record the source fingerprint"""
+        run_sync(store, db_file)
+        entry = PyKeePass(db_file, password=test_pass).find_entries(title="test4", first=True)
+        fingerprint = json.loads(entry.get_custom_property(fingerprint_key))
+        path = os.path.join(store, "web/emails/test4.gpg")
+        assert fingerprint == {"path": "web/emails/test4", "mtime_ns": os.stat(path).st_mtime_ns,
+                               "sha256": file_digest(path)}
+
+    def test_should_not_decrypt_anything_when_nothing_changed(self, store, db_file, mocker):
+        """... it should not decrypt anything when nothing changed"""
+        run_sync(store, db_file)
+        spy = mocker.spy(PassReader, "parse_pass_entry")
+        assert run_sync(store, db_file) == SyncResult(added=0, updated=0, removed=0, unchanged=4)
+        assert spy.call_count == 0
+
+    def test_should_not_decrypt_files_that_were_only_touched(self, store, db_file, mocker):
+        """... it should not decrypt files that were only touched"""
+        run_sync(store, db_file)
+        path = os.path.join(store, "test1.gpg")
+        os.utime(path, ns=(0, 0))
+        spy = mocker.spy(PassReader, "parse_pass_entry")
+        assert run_sync(store, db_file) == SyncResult(added=0, updated=0, removed=0, unchanged=4)
+        assert spy.call_count == 0
+        entry = PyKeePass(db_file, password=test_pass).find_entries(title="test1", first=True)
+        assert json.loads(entry.get_custom_property(fingerprint_key))["mtime_ns"] == 0
+
+    def test_should_update_changed_entries(self, store, db_file):
+        """... it should update changed entries"""
+        run_sync(store, db_file)
+        shutil.copyfile(os.path.join(store, "web/test2.gpg"), os.path.join(store, "test1.gpg"))
+        assert run_sync(store, db_file) == SyncResult(added=0, updated=1, removed=0, unchanged=3)
+        db = PyKeePass(db_file, password=test_pass)
+        assert len(db.entries) == 4
+        assert db.find_entries(title="test1", first=True).password == db.find_entries(title="test2",
+                                                                                      first=True).password
+
+    def test_should_add_new_entries_and_remove_deleted_ones(self, store, db_file):
+        """... it should add new entries and remove deleted ones"""
+        run_sync(store, db_file)
+        shutil.move(os.path.join(store, "docs/test3.gpg"), os.path.join(store, "web/test5.gpg"))
+        assert run_sync(store, db_file) == SyncResult(added=1, updated=0, removed=1, unchanged=3)
+        db = PyKeePass(db_file, password=test_pass)
+        assert sorted(x.title for x in db.entries) == ["test1", "test2", "test4", "test5"]
+
+    def test_should_leave_alone_entries_not_added_by_a_sync(self, store, db_file):
+        """... it should leave alone entries not added by a sync"""
+        run_sync(store, db_file)
+        db = PyKeePass(db_file, password=test_pass)
+        db.add_entry(db.root_group, "keepass only", "user", "password")
+        db.save()
+        run_sync(store, db_file)
+        db = PyKeePass(db_file, password=test_pass)
+        assert db.find_entries(title="keepass only", first=True) is not None
+
+
+    @pytest.mark.parametrize("bulk", [False, True])
+    def test_should_adopt_the_entries_of_a_full_conversion(self, store, db_file, bulk):
+        """... it should adopt the entries of a full conversion"""
+        convert(PassReader(path=store), P2KP2(password=test_pass, destination=db_file))
+        writer = P2KP2(password=test_pass, destination=db_file, sync=True, bulk=bulk)
+        assert sync(PassReader(path=store), writer) == SyncResult(added=0, updated=4, removed=0, unchanged=0)
+        db = PyKeePass(db_file, password=test_pass)
+        assert len(db.entries) == 4
+        assert all(x.get_custom_property(fingerprint_key) is not None for x in db.entries)
+        assert run_sync(store, db_file) == SyncResult(added=0, updated=0, removed=0, unchanged=4)
+
+
+class TestP2kp2SyncInit:
+    """Test: P2kp2 init in sync mode..."""
+
+    def test_should_open_the_existing_db(self, store, db_file):
+        """... it should open the existing db"""
+        run_sync(store, db_file)
+        assert len(P2KP2(password=test_pass, destination=db_file, sync=True).db.entries) == 4
+
+    def test_should_fail_with_the_wrong_password(self, store, db_file):
+        """... it should fail with the wrong password"""
+        run_sync(store, db_file)
+        with pytest.raises(Exception):
+            P2KP2(password="wrong", destination=db_file, sync=True)
@@ -5,7 +5,8 @@ from pykeepass import PyKeePass
 from pykeepass.entry import Entry
 from pykeepass.group import Group
 
-from p2kp2 import P2KP2, DbAlreadyExistsException, PassReader, PassEntry, empty_db_path
+from p2kp2 import P2KP2, DbAlreadyExistsException, DbNotWritableException, PassReader, PassEntry, empty_db_path
+from p2kp2.kdf import AesKdf, Argon2Kdf, KdfNotSupportedException, get_kdf
 from tests.conftest import test_db_file, test_pass
 
 
@@ -36,10 +37,17 @@ class TestP2kp2Init:
 
     def test_should_create_a_default_new_file(self):
         """P2kp2 init should create a default new file."""
-        P2KP2(password=test_pass)
+        P2KP2(password=test_pass).populate_db([])
         assert os.path.exists("pass.kdbx")
         os.remove("pass.kdbx")
 
+    def test_should_not_write_anything_until_the_db_is_populated(self):
+        """P2kp2 init should not write anything until the db is populated."""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        assert not os.path.exists(test_db_file)
+        p2kp2.populate_db([])
+        assert os.path.exists(test_db_file)
+
     def test_should_allow_to_specify_a_custom_path_for_the_new_db_file(self):
         """P2kp2 init should allow to specify a custom path for the new db file."""
         P2KP2(password=test_pass, destination=test_db_file)
@@ -51,19 +59,110 @@ class TestP2kp2Init:
             P2KP2(password=test_pass, destination=test_db_file)
             os.remove(test_db_file)
 
+    def test_should_refuse_a_destination_it_could_not_save_to(self, tmp_path, mocker):
+        """P2kp2 init should refuse a destination it could not save to."""
+        with pytest.raises(DbNotWritableException):
+            P2KP2(password=test_pass, destination=str(tmp_path / "missing" / "pass.kdbx"))
+        mocker.patch("os.access", return_value=False)
+        with pytest.raises(DbNotWritableException):
+            P2KP2(password=test_pass, destination=str(tmp_path / "pass.kdbx"))
+        (tmp_path / "pass.kdbx").write_bytes(b"")
+        with pytest.raises(DbNotWritableException):
+            P2KP2(password=test_pass, destination=str(tmp_path / "pass.kdbx"), overwrite=True)
+        assert [x.name for x in tmp_path.iterdir()] == ["pass.kdbx"]
+
     def test_should_set_the_given_password(self):
         """P2kp2 should set the given password."""
-        P2KP2(password=test_pass, destination=test_db_file)
+        P2KP2(password=test_pass, destination=test_db_file).populate_db([])
         PyKeePass(test_db_file, password=test_pass)  # this will fail if the pass is wrong
 
     def test_should_overwrite_an_already_present_db_if_instructed_to_do_so(self):
         """P2kp2 init should overwrite an already present db if instructed to do so."""
         open(test_db_file, "a").close()
-        P2KP2(password=test_pass, destination=test_db_file, overwrite=True)
+        P2KP2(password=test_pass, destination=test_db_file, overwrite=True).populate_db([])
         assert os.stat(test_db_file).st_size > 0
         os.remove(test_db_file)
 
 
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestP2Kp2Kdf:
+    """Test: P2kp2 key derivation..."""
+
+    def test_should_default_to_aes_kdf_for_new_dbs(self):
+        """P2kp2 key derivation should default to aes kdf for new dbs."""
+        P2KP2(password=test_pass, destination=test_db_file).populate_db([])
+        kp = PyKeePass(test_db_file, password=test_pass)
+        assert kp.version == (3, 1)
+        assert get_kdf(kp) == AesKdf()
+
+    def test_should_use_the_given_aes_kdf_rounds(self):
+        """P2kp2 key derivation should use the given aes kdf rounds."""
+        P2KP2(password=test_pass, destination=test_db_file, kdf=AesKdf(rounds=1000)).populate_db([])
+        assert get_kdf(PyKeePass(test_db_file, password=test_pass)) == AesKdf(rounds=1000)
+
+    def test_should_create_a_kdbx4_db_when_using_argon2(self):
+        """P2kp2 key derivation should create a kdbx4 db when using argon2."""
+        kdf = Argon2Kdf(memory=1024, iterations=3, parallelism=1, variant="argon2id")
+        P2KP2(password=test_pass, destination=test_db_file, kdf=kdf).populate_db(
+            [PassEntry(PassReader(path="tests/password-store"), "test1")])
+        kp = PyKeePass(test_db_file, password=test_pass)
+        assert kp.version[0] == 4
+        assert get_kdf(kp) == kdf
+        assert kp.entries[0].title == "test1"
+
+    def test_should_keep_the_kdf_of_a_synced_db(self):
+        """P2kp2 key derivation should keep the kdf of a synced db."""
+        P2KP2(password=test_pass, destination=test_db_file, kdf=AesKdf(rounds=1000)).populate_db([])
+        P2KP2(password=test_pass, destination=test_db_file, sync=True).populate_db([])
+        assert get_kdf(PyKeePass(test_db_file, password=test_pass)) == AesKdf(rounds=1000)
+
+    def test_should_refuse_to_switch_the_kdf_of_a_synced_db(self):
+        """P2kp2 key derivation should refuse to switch the kdf of a synced db."""
+        P2KP2(password=test_pass, destination=test_db_file, kdf=AesKdf(rounds=1000)).populate_db([])
+        with pytest.raises(KdfNotSupportedException):
+            P2KP2(password=test_pass, destination=test_db_file, sync=True, kdf=Argon2Kdf())
+
+
+@pytest.mark.usefixtures("reset_db_every_test")
+class TestP2Kp2Groups:
+    """Test: P2kp2 groups..."""
+
+    def test_should_start_with_the_root_group_in_the_cache(self):
+        """... it should start with the root group in the cache"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        assert p2kp2.groups == {(): p2kp2.db.root_group}
+
+    def test_should_create_missing_parent_groups(self):
+        """... it should create missing parent groups"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        group = p2kp2.get_group(["web", "emails"])
+        assert group.path == ["web", "emails"]
+        assert p2kp2.groups[("web",)].path == ["web"]
+        assert len(p2kp2.db.groups) == 3
+
+    def test_should_reuse_cached_groups(self, mocker):
+        """... it should reuse cached groups"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        group = p2kp2.get_group(["web", "emails"])
+        spy = mocker.spy(p2kp2.db, "add_group")
+        assert p2kp2.get_group(("web", "emails")) is group
+        assert spy.call_count == 0
+
+    def test_should_build_the_whole_group_tree_up_front(self):
+        """... it should build the whole group tree up front"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        p2kp2.build_group_tree([("web", "emails"), ("docs",), ("web",), (), ("web", "emails")])
+        assert sorted(x.path for x in p2kp2.db.groups if not x.is_root_group) == \
+            [["docs"], ["web"], ["web", "emails"]]
+
+    def test_should_find_groups_without_searching_the_db(self, mocker):
+        """... it should find groups without searching the db"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        spy = mocker.spy(p2kp2.db, "find_groups")
+        p2kp2.add_entry(PassEntry(PassReader(path="tests/password-store"), "web/emails/test4"))
+        assert spy.call_count == 0
+
+
 class TestP2Kp2AddEntry:
     """Test: P2kp2 add_entry..."""
 
@@ -162,3 +261,73 @@ class TestP2Kp2:
     def test_should_actually_populate_the_db_with_populate_db(self):
         """P 2 kp 2 should actually populate the db with populate db."""
         assert len(self.db.entries) == 4
+
+    def test_should_accept_any_iterable_of_entries(self):
+        """P2kp2 populate db should accept any iterable of entries."""
+        reader = PassReader(path="tests/password-store")
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file, overwrite=True)
+        p2kp2.populate_db(reader.iter_entries())
+        assert len(PyKeePass(test_db_file, password=test_pass).entries) == 4
+
+
+class TestP2Kp2BulkMode:
+    """Test: P2kp2 bulk mode..."""
+
+    reader: PassReader
+    db: PyKeePass
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request, reset_db_after_all_class_test):
+        """TestP2Kp2BulkMode setup"""
+        reader = PassReader(path="tests/password-store")
+        reader.parse_db()
+        request.cls.reader = reader
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file, bulk=True)
+        p2kp2.bulk_size = 3
+        events = []
+        p2kp2.event_stream.subscribe(events.append)
+        p2kp2.populate_db(reader)
+        request.cls.events = events
+        request.cls.db = PyKeePass(test_db_file, password=test_pass)
+
+    def test_should_populate_the_db_in_batches(self):
+        """... it should populate the db in batches"""
+        assert len(self.db.entries) == 4
+        assert self.events == [1, 2, 3, 4]
+
+    def test_should_set_the_same_fields_as_add_entry(self):
+        """... it should set the same fields as add_entry"""
+        for pass_entry in self.reader.entries:
+            entry = self.db.find_entries(title=pass_entry.title, first=True)
+            assert entry.group.path == pass_entry.groups
+            assert (entry.username or "") == pass_entry.user
+            assert entry.password == pass_entry.password
+            assert (entry.url or "") == pass_entry.url
+            assert (entry.notes or "") == pass_entry.notes
+            assert entry.custom_properties == pass_entry.custom_properties
+
+    def test_should_not_search_the_db_while_adding_entries(self, mocker):
+        """... it should not search the db while adding entries"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file, overwrite=True)
+        p2kp2.build_group_tree(x.groups for x in self.reader.entries)
+        spy = mocker.spy(p2kp2.db, "_xpath")
+        entries = p2kp2.add_entries(self.reader.entries)
+        assert spy.call_count == 0
+        assert [x.title for x in entries] == [x.title for x in self.reader.entries]
+
+    def test_should_add_a_batch_as_a_whole_or_not_at_all(self, mocker):
+        """... it should add a batch as a whole or not at all"""
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file, overwrite=True)
+        binary = PassEntry.from_bytes("keys/key.der", b"\x00key")
+        get_group = p2kp2.get_group
+
+        def broken_get_group(path):
+            if tuple(path) == ("web",):
+                raise OSError("broken")
+            return get_group(path)
+        mocker.patch.object(p2kp2, "get_group", broken_get_group)
+        # the keys group is filled before the web one fails
+        with pytest.raises(OSError):
+            p2kp2.add_entries([binary] + self.reader.entries)
+        assert p2kp2.db.entries == []
+        assert p2kp2.db.binaries == []